@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Benchmark of the cost of routing one input event to its behaviours.
+
+Compares the linear `isinstance` scan over every registered event type (which the
+BotRunner used to do for each event) with a lookup in a
+:class:`~mewbot.dispatch.TypeDispatchTable`, as the number of behaviours grows.
+
+Run from the root of the repository with
+
+    PYTHONPATH=src python benchmarks/bench_dispatch.py
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Set, Type
+
+import dataclasses
+import functools
+import timeit
+
+from mewbot.core import InputEvent
+from mewbot.dispatch import TypeDispatchTable
+
+BEHAVIOUR_COUNTS = (1, 10, 100, 300, 1000)
+LOOKUPS = 20_000
+
+
+@dataclasses.dataclass
+class RoutedEvent(InputEvent):
+    """The event which is being routed; one behaviour is interested in it."""
+
+
+def build_registrations(count: int) -> Dict[Type[InputEvent], Set[object]]:
+    """Registrations with `count` behaviours, each with its own event type."""
+
+    registrations: Dict[Type[InputEvent], Set[object]] = {
+        dataclasses.make_dataclass(f"Event{i}", [], bases=(InputEvent,)): {object()}
+        for i in range(count - 1)
+    }
+    registrations[RoutedEvent] = {object()}
+
+    return registrations
+
+
+def linear_scan(registrations: Dict[Type[InputEvent], Set[object]], event: InputEvent) -> int:
+    """The previous routing strategy: test the event against every registered type."""
+
+    matched = 0
+    for event_type, behaviours in registrations.items():
+        if isinstance(event, event_type):
+            matched += len(behaviours)
+    return matched
+
+
+def main() -> None:
+    """Print the per-event routing cost of both strategies at each behaviour count."""
+
+    event = RoutedEvent()
+
+    print(f"{'behaviours':>10} {'linear scan (us)':>18} {'dispatch table (us)':>20}")
+
+    for count in BEHAVIOUR_COUNTS:
+        registrations = build_registrations(count)
+        table: TypeDispatchTable[InputEvent, object] = TypeDispatchTable(registrations)
+
+        linear = timeit.timeit(
+            functools.partial(linear_scan, registrations, event), number=LOOKUPS
+        )
+        lookup = timeit.timeit(functools.partial(table.lookup, type(event)), number=LOOKUPS)
+
+        print(f"{count:>10} {linear / LOOKUPS * 1e6:>18.3f} {lookup / LOOKUPS * 1e6:>20.3f}")
+
+
+if __name__ == "__main__":
+    main()
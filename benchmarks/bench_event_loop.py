@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Benchmark of the socket and HTTP echo bots on the asyncio and uvloop event loops.
+
+For each bot, a number of clients (on the same event loop as the bot) send timestamped
+messages as fast as the bot acknowledges them. A behaviour records how long each message
+took to reach it. The events per second, and the median and p99 latency from a message
+being sent to it being processed, are printed for each bot and loop.
+
+If uvloop is not installed, only the asyncio loop is measured.
+
+Run from the root of the repository with
+
+    PYTHONPATH=src python benchmarks/bench_event_loop.py
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterable, Awaitable, Callable
+from typing import Any
+
+import asyncio
+import logging
+import socket
+import time
+
+import aiohttp
+
+from mewbot.bot import BotRunner, RunnerConfig, uvloop
+from mewbot.core import InputEvent, OutputEvent
+from mewbot.io.http import HTTPServlet, IncomingWebhookEvent
+from mewbot.io.socket import SocketInputEvent, SocketIO
+
+CLIENTS = 10
+MESSAGES = 500  # Per client
+
+
+class LatencyBehaviour:
+    """Behaviour which records how long ago each message was sent, and produces no output."""
+
+    latencies: list[float]
+
+    def __init__(self) -> None:
+        self.latencies = []
+
+    def add(self, component: Any) -> None:
+        """Components are not supported by this benchmark behaviour."""
+
+    def consumes_inputs(self) -> set[type[InputEvent]]:
+        """Consumes the events from both echo bots."""
+        return {SocketInputEvent, IncomingWebhookEvent}
+
+    async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """Record the latency of the message, from the timestamp it contains."""
+        if isinstance(event, SocketInputEvent):
+            message = event.data.decode("utf-8").strip()
+        else:
+            message = getattr(event, "text")
+
+        # The socket input also sends an empty event when the client disconnects.
+        if message:
+            self.latencies.append(time.perf_counter() - float(message))
+
+        outputs: tuple[OutputEvent, ...] = ()
+        for output in outputs:
+            yield output
+
+
+async def socket_client(port: int) -> None:
+    """Send messages to the socket bot, waiting for each to be acknowledged."""
+
+    reader, writer = await asyncio.open_connection("localhost", port)
+
+    for _ in range(MESSAGES):
+        writer.write(f"{time.perf_counter()}\n".encode("utf-8"))
+        await reader.readline()
+
+    # Close our side, and let the bot close its side, so it does not write to a closed socket.
+    writer.write_eof()
+    await reader.read()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def http_client(port: int) -> None:
+    """Post messages to the HTTP bot, waiting for each response."""
+
+    async with aiohttp.ClientSession() as session:
+        for _ in range(MESSAGES):
+            async with session.post(
+                f"http://localhost:{port}/", data=str(time.perf_counter())
+            ):
+                pass
+
+
+async def measure(
+    io_class: type[SocketIO], client: Callable[[int], Awaitable[None]]
+) -> tuple[float, float, float]:
+    """
+    Run an echo bot with the given IOConfig, and measure it under load from the clients.
+
+    :return: The events per second, and the median and p99 latency in seconds.
+    """
+    port = free_port()
+
+    config = io_class()
+    config.port = port
+
+    behaviour = LatencyBehaviour()
+    runner = BotRunner(
+        {SocketInputEvent: {behaviour}, IncomingWebhookEvent: {behaviour}},
+        set(config.get_inputs()),
+        {},
+        # A small queue makes the clients wait for the bot, rather than building a backlog.
+        RunnerConfig(input_queue_size=CLIENTS),
+    )
+
+    loop = asyncio.get_running_loop()
+    tasks = runner.setup_tasks(loop)
+    tasks.append(loop.create_task(runner.process_input_queue()))
+    await asyncio.sleep(0.1)  # Let the servers start listening.
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port) for _ in range(CLIENTS)))
+    await runner.input_event_queue.join()
+    elapsed = time.perf_counter() - start
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = sorted(behaviour.latencies)
+    return (
+        len(latencies) / elapsed,
+        latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.99)],
+    )
+
+
+def free_port() -> int:
+    """Find a port which is not in use."""
+
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+def main() -> None:
+    """Print the throughput and latency for each bot on each loop."""
+
+    logging.disable(logging.INFO)
+
+    loops: list[tuple[str, Callable[[], asyncio.AbstractEventLoop]]] = [
+        ("asyncio", asyncio.new_event_loop)
+    ]
+    if uvloop is not None:
+        loops.append(("uvloop", uvloop.new_event_loop))
+    else:
+        print("uvloop is not installed; only measuring the asyncio loop")
+
+    bots: list[tuple[str, type[SocketIO], Callable[[int], Awaitable[None]]]] = [
+        ("socket", SocketIO, socket_client),
+        ("http", HTTPServlet, http_client),
+    ]
+
+    print(f"{'bot':>8} {'loop':>8} {'events/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for bot, io_class, client in bots:
+        for name, new_loop in loops:
+            loop = new_loop()
+            try:
+                rate, median, p99 = loop.run_until_complete(measure(io_class, client))
+            finally:
+                loop.close()
+            print(
+                f"{bot:>8} {name:>8} {rate:>10.0f} {median * 1000:>8.2f} {p99 * 1000:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Benchmark of input throughput with slow actions, as the number of input workers grows.
+
+Each event is handled by one behaviour which waits (as an action doing network IO
+would) before finishing. Events are spread over a number of partition keys, so events
+for different keys may be processed concurrently.
+
+Run from the root of the repository with
+
+    PYTHONPATH=src python benchmarks/bench_input_workers.py
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterable, Hashable
+from typing import Any
+
+import asyncio
+import dataclasses
+
+from mewbot.bot import BotRunner, RunnerConfig
+from mewbot.core import InputEvent, OutputEvent
+
+WORKER_COUNTS = (1, 2, 4, 8, 16)
+EVENTS = 200
+KEYS = 32
+ACTION_DELAY = 0.005
+
+
+@dataclasses.dataclass
+class KeyedEvent(InputEvent):
+    """Event partitioned by an integer key."""
+
+    key: int
+
+    def partition_key(self) -> Hashable:
+        """Events are partitioned by their key."""
+        return self.key
+
+
+class SlowBehaviour:
+    """Behaviour which waits for a fixed time for each event, and produces no output."""
+
+    def add(self, component: Any) -> None:
+        """Components are not supported by this benchmark behaviour."""
+
+    def consumes_inputs(self) -> set[type[InputEvent]]:
+        """Consumes the benchmark events."""
+        return {KeyedEvent}
+
+    # pylint: disable=unused-argument
+    # Every event takes the same time, whatever it is.
+    async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """Wait, then finish without output."""
+        await asyncio.sleep(ACTION_DELAY)
+        for output in ():
+            yield output
+
+
+async def measure(workers: int) -> float:
+    """Time taken for a runner with the given number of workers to process all events."""
+
+    runner = BotRunner(
+        {KeyedEvent: {SlowBehaviour()}}, set(), {}, RunnerConfig(input_workers=workers)
+    )
+    runner._running = True  # pylint: disable=protected-access
+
+    for i in range(EVENTS):
+        runner.input_event_queue.put_nowait(KeyedEvent(i % KEYS))
+
+    start = asyncio.get_running_loop().time()
+    task = asyncio.create_task(runner.process_input_queue())
+    await runner.input_event_queue.join()
+    elapsed = asyncio.get_running_loop().time() - start
+
+    task.cancel()
+    return elapsed
+
+
+async def main() -> None:
+    """Print the throughput at each worker count."""
+
+    print(f"{'workers':>8} {'events/s':>10}")
+    for workers in WORKER_COUNTS:
+        elapsed = await measure(workers)
+        print(f"{workers:>8} {EVENTS / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Benchmark of input throughput with CPU bound actions, as the number of processes grows.
+
+Each event is handled by one behaviour whose action does a fixed amount of computation.
+The single process BotRunner is measured first, then the MultiProcessBotRunner with an
+increasing number of worker processes. Throughput should scale with the number of cores
+until the processes outnumber them.
+
+Run from the root of the repository with
+
+    PYTHONPATH=src python benchmarks/bench_multiprocess.py
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterable, Hashable
+from typing import Any, Type
+
+import asyncio
+import dataclasses
+import os
+
+from mewbot.api.v1 import Action, Behaviour, Trigger
+from mewbot.bot import BotRunner, RunnerConfig
+from mewbot.core import InputEvent, OutputEvent
+from mewbot.multiprocess import MultiProcessBotRunner
+
+PROCESS_COUNTS = (1, 2, 4, 8)
+EVENTS = 400
+KEYS = 64
+WORK = 100_000
+
+
+@dataclasses.dataclass
+class KeyedEvent(InputEvent):
+    """Event partitioned by an integer key."""
+
+    key: int
+
+    def partition_key(self) -> Hashable:
+        """Events are partitioned by their key."""
+        return self.key
+
+
+class KeyedTrigger(Trigger):
+    """Matches all the benchmark events."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the benchmark events."""
+        return {KeyedEvent}
+
+    def matches(self, event: InputEvent) -> bool:
+        """All benchmark events match."""
+        return True
+
+
+class BusyAction(Action):
+    """Action which does a fixed amount of computation, and produces no output."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the benchmark events."""
+        return {KeyedEvent}
+
+    @staticmethod
+    def produces_outputs() -> set[type[OutputEvent]]:
+        """Produces nothing."""
+        return set()
+
+    async def act(self, event: InputEvent, state: dict[str, Any]) -> AsyncIterable[None]:
+        """Compute, then finish without output."""
+        state["total"] = sum(i * i for i in range(WORK))
+        yield None
+
+
+async def measure(runner_class: Type[BotRunner], processes: int) -> float:
+    """Time taken for a runner to process all the events, once it has started."""
+
+    behaviour = Behaviour()
+    behaviour.add(KeyedTrigger())
+    behaviour.add(BusyAction())
+
+    config = RunnerConfig(input_workers=2 * processes, processes=processes)
+    runner = runner_class({KeyedEvent: {behaviour}}, set(), {}, config)
+    task = asyncio.create_task(runner.process_input_queue())
+
+    # Let the worker processes start before timing.
+    runner.input_event_queue.put_nowait(KeyedEvent(0))
+    await runner.input_event_queue.join()
+
+    for i in range(EVENTS):
+        runner.input_event_queue.put_nowait(KeyedEvent(i % KEYS))
+
+    start = asyncio.get_running_loop().time()
+    await runner.input_event_queue.join()
+    elapsed = asyncio.get_running_loop().time() - start
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return elapsed
+
+
+async def main() -> None:
+    """Print the throughput of each runner."""
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'runner':>16} {'processes':>10} {'events/s':>10}")
+
+    elapsed = await measure(BotRunner, 1)
+    print(f"{'BotRunner':>16} {'-':>10} {EVENTS / elapsed:>10.0f}")
+
+    for processes in PROCESS_COUNTS:
+        elapsed = await measure(MultiProcessBotRunner, processes)
+        print(f"{'MultiProcess':>16} {processes:>10} {EVENTS / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Benchmark suite for the core event pipeline, from an input to the outputs.
+
+Each scenario runs a :class:`~mewbot.bot.BotRunner` with a synthetic input, which puts
+events on the input queue as fast as it accepts them, and counting outputs, which record
+how long after being produced each event reached them. The events per second, and the
+p50/p90/p99 latency from input to output, are measured for each scenario.
+
+Starting from a baseline of one behaviour with one trigger, an event class directly
+derived from InputEvent, and one output, the scenarios vary one of:
+
+ - the kind of behaviour: `noop` behaviours implement the behaviour interface directly and
+   only reply to the events meant for them; `v1` behaviours are built from the v1
+   components, with command triggers, a condition, and an action formatting a reply
+ - the number of behaviours: every behaviour is given every event, but only one of them
+   has a trigger which matches it
+ - the number of triggers in each behaviour: events match the last trigger
+ - the depth of the event class hierarchy, between the events and InputEvent
+ - the number of outputs each output event is sent to
+
+The results are written as JSON, labelled with the current commit, so that they can be
+compared between commits. With `--compare`, each scenario is also compared with an earlier
+result file, and the run fails if any has slowed down by more than `--threshold`.
+
+Run from the root of the repository with
+
+    PYTHONPATH=src python benchmarks/bench_pipeline.py
+    PYTHONPATH=src python benchmarks/bench_pipeline.py --compare pipeline-abc1234.json
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterable, Iterable
+from typing import Any, cast
+
+import argparse
+import asyncio
+import dataclasses
+import datetime
+import json
+import logging
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from mewbot.api.v1 import Action, Behaviour, Condition, Input, Output, Trigger
+from mewbot.bot import BotRunner, RunnerConfig
+from mewbot.core import InputEvent, OutputEvent
+
+EVENTS = 5000
+REPEATS = 3
+QUEUE_SIZE = 100  # The input waits for space, as a busy input would, rather than piling up.
+THRESHOLD = 0.1
+
+
+@dataclasses.dataclass
+class PipelineEvent(InputEvent):
+    """The root of the synthetic event classes; behaviours consume this."""
+
+    target: int  # The behaviour which should reply to the event
+    text: str
+    sent: float = dataclasses.field(default_factory=time.perf_counter)
+
+
+@dataclasses.dataclass
+class ReplyEvent(OutputEvent):
+    """A behaviour's reply to an event, carrying the time the event was produced."""
+
+    text: str
+    sent: float
+
+
+@dataclasses.dataclass(frozen=True)
+class Scenario:
+    """The shape of the bot being measured."""
+
+    kind: str = "v1"
+    behaviours: int = 1
+    triggers: int = 1
+    depth: int = 1
+    fanout: int = 1
+
+    @property
+    def name(self) -> str:
+        """A short label for the scenario."""
+        return (
+            f"{self.kind} behaviours={self.behaviours} triggers={self.triggers} "
+            f"depth={self.depth} fanout={self.fanout}"
+        )
+
+
+def scenarios() -> list[Scenario]:
+    """The baseline, and each variation of it, one dimension at a time."""
+
+    baseline = Scenario()
+    variations = [
+        Scenario(kind="noop"),
+        *(Scenario(behaviours=count) for count in (10, 50)),
+        *(Scenario(triggers=count) for count in (5, 20)),
+        *(Scenario(depth=depth) for depth in (5, 20)),
+        *(Scenario(fanout=count) for count in (4, 16)),
+    ]
+    return [baseline, *variations]
+
+
+def event_class(depth: int) -> type[PipelineEvent]:
+    """The event class with `depth` classes between it and InputEvent."""
+
+    cls = PipelineEvent
+    for level in range(1, depth):
+        cls = cast(type[PipelineEvent], type(f"PipelineEvent{level}", (cls,), {}))
+    return cls
+
+
+def command_text(behaviour: int, trigger: int) -> str:
+    """The text which a trigger of a behaviour matches."""
+    return f"!b{behaviour}c{trigger}"
+
+
+class SyntheticInput(Input):
+    """Input which puts a fixed number of events on the queue, as fast as it can."""
+
+    def __init__(self, scenario: Scenario, count: int) -> None:
+        """Create an input for `count` events of the scenario."""
+        super().__init__()
+        self.events = event_class(scenario.depth)
+        self.scenario = scenario
+        self.count = count
+
+    @staticmethod
+    def produces_inputs() -> set[type[InputEvent]]:
+        """Produces the synthetic events."""
+        return {PipelineEvent}
+
+    async def run(self) -> None:
+        """Put the events on the queue; each is meant for the next behaviour in turn."""
+        assert self.queue
+
+        last = self.scenario.triggers - 1
+        for value in range(self.count):
+            target = value % self.scenario.behaviours
+            await self.queue.put(self.events(target, command_text(target, last)))
+
+
+class CommandTrigger(Trigger):
+    """Trigger which matches events with the given text."""
+
+    _command: str = ""
+
+    @property
+    def command(self) -> str:
+        """The text to match."""
+        return self._command
+
+    @command.setter
+    def command(self, command: str) -> None:
+        self._command = command
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the synthetic events."""
+        return {PipelineEvent}
+
+    def matches(self, event: InputEvent) -> bool:
+        """Whether the event's text is the command."""
+        return isinstance(event, PipelineEvent) and event.text == self._command
+
+
+class AllowedUserCondition(Condition):
+    """Condition which blocks some events, as a permissions check would."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the synthetic events."""
+        return {PipelineEvent}
+
+    def allows(self, event: InputEvent) -> bool:
+        """None of the synthetic events are blocked, but each has to be checked."""
+        return getattr(event, "text", "") not in {"!ban", "!kick"}
+
+
+class ReplyAction(Action):
+    """Action which formats a reply to the event."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the synthetic events."""
+        return {PipelineEvent}
+
+    @staticmethod
+    def produces_outputs() -> set[type[OutputEvent]]:
+        """Produces replies."""
+        return {ReplyEvent}
+
+    async def act(
+        self, event: InputEvent, state: dict[str, Any]
+    ) -> AsyncIterable[OutputEvent | None]:
+        """Reply to the event."""
+        assert isinstance(event, PipelineEvent)
+        yield ReplyEvent(f"Running {event.text[1:]} for you", event.sent)
+
+
+class NoopBehaviour:
+    """Behaviour which replies to the events meant for it, without any components."""
+
+    def __init__(self, index: int) -> None:
+        """Create the behaviour which replies to the events targeted at `index`."""
+        self.index = index
+
+    def add(self, component: Any) -> None:
+        """Components are not supported by this benchmark behaviour."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the synthetic events."""
+        return {PipelineEvent}
+
+    async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """Reply, if the event is meant for this behaviour."""
+        assert isinstance(event, PipelineEvent)
+        if event.target == self.index:
+            yield ReplyEvent(event.text, event.sent)
+
+
+class LatencyOutput(Output):
+    """Output which records how long ago each event was produced by the input."""
+
+    def __init__(self, latencies: list[float]) -> None:
+        """Create an output which appends each event's latency to `latencies`."""
+        self.latencies = latencies
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Consumes the replies."""
+        return {ReplyEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Record the latency of the event."""
+        assert isinstance(event, ReplyEvent)
+        self.latencies.append(time.perf_counter() - event.sent)
+        return True
+
+
+def build_behaviour(scenario: Scenario, index: int) -> Any:
+    """A behaviour of the scenario's kind, which replies to the events for `index`."""
+
+    if scenario.kind == "noop":
+        return NoopBehaviour(index)
+
+    built = Behaviour(name=f"behaviour-{index}")  # type: ignore
+    for trigger in range(scenario.triggers):
+        built.add(CommandTrigger(command=command_text(index, trigger)))  # type: ignore
+    built.add(AllowedUserCondition())
+    built.add(ReplyAction())
+    return built
+
+
+async def measure(scenario: Scenario, count: int) -> dict[str, float]:
+    """
+    Run the scenario once.
+
+    :return: The events per second, and the latency percentiles in seconds.
+    """
+    latencies: list[float] = []
+    synthetic = SyntheticInput(scenario, count)
+
+    runner = BotRunner(
+        {
+            PipelineEvent: {
+                build_behaviour(scenario, index) for index in range(scenario.behaviours)
+            }
+        },
+        {synthetic},
+        {ReplyEvent: {LatencyOutput(latencies) for _ in range(scenario.fanout)}},
+        RunnerConfig(input_queue_size=QUEUE_SIZE),
+    )
+
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+
+    processors = [
+        loop.create_task(runner.process_input_queue()),
+        loop.create_task(runner.process_output_queue()),
+    ]
+    await asyncio.gather(*runner.setup_tasks(loop))
+    report = await runner.drain(60)
+    elapsed = time.perf_counter() - start
+
+    for task in processors:
+        task.cancel()
+    await asyncio.gather(*processors, return_exceptions=True)
+
+    if report.timed_out or len(latencies) != count * scenario.fanout:
+        raise RuntimeError(f"{scenario.name} did not finish: {report}")
+
+    latencies.sort()
+    return {
+        "events_per_second": count / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p90": latencies[int(len(latencies) * 0.9)],
+        "p99": latencies[int(len(latencies) * 0.99)],
+    }
+
+
+def run_suite(count: int, repeats: int) -> list[dict[str, Any]]:
+    """Run each scenario `repeats` times, keeping the median of each measurement."""
+
+    results: list[dict[str, Any]] = []
+
+    print(f"{'scenario':<52} {'events/s':>10} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for scenario in scenarios():
+        runs = [asyncio.run(measure(scenario, count)) for _ in range(repeats)]
+        result = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        results.append({"name": scenario.name, **dataclasses.asdict(scenario), **result})
+
+        print(
+            f"{scenario.name:<52} {result['events_per_second']:>10.0f} "
+            f"{result['p50'] * 1000:>8.2f} {result['p90'] * 1000:>8.2f} "
+            f"{result['p99'] * 1000:>8.2f}"
+        )
+
+    return results
+
+
+def current_commit() -> str:
+    """The short hash of the checked out commit, or "unknown" outside a git checkout."""
+
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            cwd=pathlib.Path(__file__).parent,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(
+    results: Iterable[dict[str, Any]], baseline: dict[str, Any], threshold: float
+) -> bool:
+    """
+    Print the change in throughput from an earlier run for each scenario.
+
+    :return: Whether any scenario's throughput fell by more than the threshold.
+    """
+    before = {result["name"]: result for result in baseline["results"]}
+    regressed = False
+
+    print(f"\nCompared with {baseline['commit']}:")
+    for result in results:
+        previous = before.get(result["name"])
+        if previous is None:
+            continue
+
+        change = result["events_per_second"] / previous["events_per_second"] - 1
+        slower = change < -threshold
+        regressed |= slower
+        print(f"{result['name']:<52} {change:>+8.1%}{'  REGRESSION' if slower else ''}")
+
+    return regressed
+
+
+def main() -> None:
+    """Run the suite, write the results, and compare them with a baseline if given."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--events", type=int, default=EVENTS, help="events per run")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="runs per scenario")
+    parser.add_argument("--output", help="JSON file for the results (pipeline-COMMIT.json)")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="fall in throughput counted as a regression (default 0.1)",
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    commit = current_commit()
+    report = {
+        "commit": commit,
+        "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "events": args.events,
+        "repeats": args.repeats,
+        "results": run_suite(args.events, args.repeats),
+    }
+
+    output = args.output or f"pipeline-{commit}.json"
+    with open(output, "w", encoding="utf-8") as stream:
+        json.dump(report, stream, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as stream:
+            baseline = json.load(stream)
+        if compare(report["results"], baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
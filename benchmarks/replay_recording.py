@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Replays a recording of a bot's input events through a bot, and reports how it kept up.
+
+The recording is made by running a bot with a `record_path` in its Runner block (see
+:mod:`mewbot.replay`). The bot given here is loaded from YAML, as for running it, but its
+inputs are not started and its outputs are replaced by a counter, so no services are used.
+The throughput, how far the replay fell behind the recorded pace, the output events
+produced, and the p50/p99 latency of each pipeline stage are printed.
+
+Run from the root of the repository with
+
+    PYTHONPATH=src python benchmarks/replay_recording.py bot.yaml traffic.rec.gz --speed 2
+
+A speed of 0 replays the events as fast as the bot accepts them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from mewbot.loader import configure_bot
+from mewbot.replay import replay, replay_runner
+
+
+def main() -> None:
+    """Replay the recording through the bot, and print the results."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("bot", help="YAML file defining the bot")
+    parser.add_argument("recording", help="recording of input events to replay")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="times faster than recorded (0: no delay)"
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    with open(args.bot, "r", encoding="utf-8") as config:
+        bot = configure_bot(args.bot, config)
+
+    runner, sink = replay_runner(bot)
+    report = asyncio.run(replay(runner, args.recording, args.speed))
+
+    print(
+        f"{report.events} events in {report.elapsed:.2f}s "
+        f"({report.events_per_second:.0f} events/s), "
+        f"at most {report.behind * 1000:.1f}ms behind the recorded pace"
+    )
+    if not report.drained:
+        print("Not all the events were handled before the drain timeout")
+    print(f"Outputs: {dict(sink.counts)}")
+
+    print(f"{'stage':>10} {'component':>30} {'count':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for latency in report.latencies:
+        print(
+            f"{latency['stage']:>10} {latency['component'][:30]:>30} {latency['count']:>8} "
+            f"{latency['p50'] * 1000:>8.2f} {latency['p99'] * 1000:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
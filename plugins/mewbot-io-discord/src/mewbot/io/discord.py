@@ -10,8 +10,9 @@ Provides an IOConfig for listening to and responding to discord message channels
 
 from __future__ import annotations
 
-from typing import List, Optional, Sequence, Set, Type
+from typing import Hashable, List, Optional, Sequence, Set, Type
 
+import asyncio
 import dataclasses
 import logging
 
@@ -35,6 +36,18 @@ class DiscordUserJoinInputEvent(DiscordInputEvent):
 
     member: discord.member.Member
 
+    def partition_key(self) -> Hashable:
+        """Joins to the same guild are processed in order."""
+        # pylint: disable=no-member
+        # Member's attributes are slots, which pylint can not see.
+        return self.member.guild.id
+
+    def dedup_key(self) -> Hashable:
+        """A member joining a guild is identified by when they joined it."""
+        # pylint: disable=no-member
+        # Member's slots, and the attributes it copies from its user, are hidden from pylint.
+        return "join", self.member.guild.id, self.member.id, self.member.joined_at
+
 
 @dataclasses.dataclass
 class DiscordMessageCreationEvent(DiscordInputEvent):
@@ -45,6 +58,14 @@ class DiscordMessageCreationEvent(DiscordInputEvent):
     text: str
     message: discord.Message
 
+    def partition_key(self) -> Hashable:
+        """Messages in the same channel are processed in the order they were sent."""
+        return self.message.channel.id
+
+    def dedup_key(self) -> Hashable:
+        """Messages are identified by their (globally unique) id."""
+        return "create", self.message.id
+
 
 @dataclasses.dataclass
 class DiscordMessageEditInputEvent(DiscordInputEvent):
@@ -58,6 +79,14 @@ class DiscordMessageEditInputEvent(DiscordInputEvent):
     text_after: str
     message_after: discord.Message
 
+    def partition_key(self) -> Hashable:
+        """Edits are processed in order with the other messages in the channel."""
+        return self.message_after.channel.id
+
+    def dedup_key(self) -> Hashable:
+        """Each edit of a message is identified by when it was made."""
+        return "edit", self.message_after.id, self.message_after.edited_at
+
 
 @dataclasses.dataclass
 class DiscordMessageDeleteInputEvent(DiscordInputEvent):
@@ -68,6 +97,14 @@ class DiscordMessageDeleteInputEvent(DiscordInputEvent):
     text_before: str
     message: discord.Message
 
+    def partition_key(self) -> Hashable:
+        """Deletions are processed in order with the other messages in the channel."""
+        return self.message.channel.id
+
+    def dedup_key(self) -> Hashable:
+        """A message can only be deleted once."""
+        return "delete", self.message.id
+
 
 @dataclasses.dataclass
 class DiscordOutputEvent(OutputEvent):
@@ -218,6 +255,20 @@ class InternalMewbotDiscordClient(discord.Client):
 
     queue: Optional[InputQueue]
 
+    async def _put(self, event: InputEvent) -> None:
+        """
+        Put an event on the input queue, logging if the queue rejects it.
+
+        Discord does not allow us to refuse an event, so a rejected event is dropped.
+        """
+        if not self.queue:
+            return
+
+        try:
+            await self.queue.put(event)
+        except asyncio.QueueFull:
+            self._logger.warning("Input queue full; dropped %s", event)
+
     async def on_ready(self) -> None:
         """
         Called once at the start, after the bot has connected to discord.
@@ -266,7 +317,7 @@ class InternalMewbotDiscordClient(discord.Client):
             if not isinstance(message, discord.Message):
                 self._logger.info("Expected a message and got a %s", type(message))
 
-            await self.queue.put(
+            await self._put(
                 DiscordMessageCreationEvent(text=message.content, message=message)
             )
 
@@ -280,7 +331,7 @@ class InternalMewbotDiscordClient(discord.Client):
         if not self.queue:
             return
 
-        await self.queue.put(
+        await self._put(
             DiscordMessageCreationEvent(text=str(message.clean_content), message=message)
         )
 
@@ -297,7 +348,7 @@ class InternalMewbotDiscordClient(discord.Client):
         if not self.queue:
             return
 
-        await self.queue.put(DiscordUserJoinInputEvent(member=member))
+        await self._put(DiscordUserJoinInputEvent(member=member))
 
     async def on_message_edit(self, before: discord.Message, after: discord.Message) -> None:
         """
@@ -311,7 +362,7 @@ class InternalMewbotDiscordClient(discord.Client):
         if not self.queue:
             return
 
-        await self.queue.put(
+        await self._put(
             DiscordMessageEditInputEvent(
                 text_before=before.content,
                 message_before=before,
@@ -335,7 +386,7 @@ class InternalMewbotDiscordClient(discord.Client):
         if not self.queue:
             return
 
-        await self.queue.put(
+        await self._put(
             DiscordMessageDeleteInputEvent(text_before=message.content, message=message)
         )
 
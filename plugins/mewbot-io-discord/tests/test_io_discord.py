@@ -6,10 +6,15 @@
 
 from __future__ import annotations
 
+from types import SimpleNamespace
 from typing import Type
 
 from mewbot.api.v1 import IOConfig
-from mewbot.io.discord import DiscordIO
+from mewbot.io.discord import (
+    DiscordIO,
+    DiscordMessageCreationEvent,
+    DiscordMessageDeleteInputEvent,
+)
 from mewbot.test import BaseTestClassWithConfig
 
 # pylint: disable=R0903
@@ -28,3 +33,19 @@ class TestIoHttpsPost(BaseTestClassWithConfig[DiscordIO]):
 
         assert isinstance(self.component, DiscordIO)
         assert isinstance(self.component, IOConfig)
+
+
+class TestDiscordDedupKeys:
+    """Testing that redelivered Discord events can be recognised."""
+
+    @staticmethod
+    def test_message_events_keyed_by_id() -> None:
+        """Events for the same message share a key; different kinds of event do not."""
+
+        message = SimpleNamespace(id=1234)
+        created = DiscordMessageCreationEvent("text", message)  # type: ignore
+        redelivered = DiscordMessageCreationEvent("text", message)  # type: ignore
+        deleted = DiscordMessageDeleteInputEvent("text", message)  # type: ignore
+
+        assert created.dedup_key() == redelivered.dedup_key()
+        assert created.dedup_key() != deleted.dedup_key()
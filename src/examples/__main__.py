@@ -17,6 +17,7 @@ import os
 import pathlib
 import sys
 
+import mewbot.host
 import mewbot.loader
 
 
@@ -57,15 +58,25 @@ def gather_paths(*filters: str, search_root: Optional[str] = None) -> Iterable[s
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage", sys.argv[0], " [configuration name]")
+    if len(sys.argv) < 2:
+        print("Usage", sys.argv[0], " [configuration name] [more configuration names...]")
         sys.exit(1)
 
     # Extend paths so the included plugin examples can be run
     # (this is done for you in tools/examples in the top level of the repo)
     sys.path.extend(gather_paths("src"))
 
-    with open(sys.argv[1], "r", encoding="utf-8") as config:
-        bot = mewbot.loader.configure_bot("DemoBot", config)
+    if len(sys.argv) == 2:
+        with open(sys.argv[1], "r", encoding="utf-8") as config:
+            bot = mewbot.loader.configure_bot("DemoBot", config)
 
-    bot.run()
+        bot.run()
+        sys.exit(0)
+
+    # Several configurations are run together, sharing any identical connections.
+    host = mewbot.host.BotHost()
+    for config_path in sys.argv[1:]:
+        with open(config_path, "r", encoding="utf-8") as config:
+            host.load(pathlib.Path(config_path).stem, config)
+
+    host.run()
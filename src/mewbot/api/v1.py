@@ -16,15 +16,16 @@ Plugins that use this API will, therefore, be able to be automatically discovere
 by bots, and have components states be preserved during a bot restart.
 """
 
-
 from __future__ import annotations
 
 import types
-from collections.abc import AsyncIterable, Iterable
+from collections.abc import AsyncIterable, Iterable, Sequence
 from typing import Any, Callable, TypeVar, Union, get_args, get_origin, get_type_hints
 
 import abc
+import asyncio
 import functools
+import time
 
 from mewbot.api.registry import ComponentRegistry
 from mewbot.core import (
@@ -39,6 +40,9 @@ from mewbot.core import (
     OutputQueue,
     TriggerInterface,
 )
+from mewbot.metrics import REGISTRY
+from mewbot.offload import BLOCKING_POOL
+from mewbot.tracing import TRACER, sampled_trace
 
 
 class Component(metaclass=ComponentRegistry):
@@ -189,6 +193,10 @@ class Output:
     The bot's output processor takes events from the behaviours off
     the output queue, and passes it to all Outputs that declare that
     they can consume it.
+
+    Outputs which can send several events in one call (e.g. in one request) can also
+    implement `output_many`, to be given batches of events; see
+    :class:`~mewbot.core.BatchOutputInterface`.
     """
 
     @staticmethod
@@ -221,6 +229,8 @@ class Trigger(Component):
     Filtering behaviours is the role of the Condition Component.
     """
 
+    blocking: bool = False  # Whether matches blocks, and so is run on a thread (see blocking)
+
     @staticmethod
     @abc.abstractmethod
     def consumes_inputs() -> set[type[InputEvent]]:
@@ -251,6 +261,8 @@ class Condition(Component):
     see all events.
     """
 
+    blocking: bool = False  # Whether allows blocks, and so is run on a thread (see blocking)
+
     @staticmethod
     @abc.abstractmethod
     def consumes_inputs() -> set[type[InputEvent]]:
@@ -277,6 +289,8 @@ class Action(Component):
      - Add data to the state, which will be available to the other actions in the behaviour
     """
 
+    blocking: bool = False  # Whether act blocks, and so is run on a thread (see blocking)
+
     @staticmethod
     @abc.abstractmethod
     def consumes_inputs() -> set[type[InputEvent]]:
@@ -455,19 +469,118 @@ class Behaviour(Component):
 
         If both of the above succeed, a state object is created, and the Event
         is passed to each action in turn, updating state and emitting any outputs.
+
+        Components which are marked as `blocking` are run on the blocking thread pool
+        (see :func:`blocking`), and the behaviour waits for them without blocking the loop.
+
+        The time taken by each trigger, condition, and action is recorded in the latency
+        histograms (see :mod:`mewbot.metrics`).
         """
-        if not any(trigger.matches(event) for trigger in self.triggers):
+        if not await self._matches(event):
             return
 
-        if not all(condition.allows(event) for condition in self.conditions):
-            return
+        async for output in self._act(event):
+            yield output
+
+    async def _matches(self, event: InputEvent) -> bool:
+        """Checks that at least one trigger matches the event, and all conditions allow it."""
+        label = self._name or type(self).__name__
+        clock = time.perf_counter
+        trace = sampled_trace()
+
+        matched = False
+        for trigger in self.triggers:
+            start = clock()
+            matched = (
+                await BLOCKING_POOL.run(trigger.matches, event)
+                if getattr(trigger, "blocking", False)
+                else trigger.matches(event)
+            )
+            elapsed = clock() - start
+            REGISTRY.observe("trigger", elapsed, label, type(trigger).__name__)
+            if trace:
+                TRACER.span(
+                    trace,
+                    "trigger",
+                    start,
+                    elapsed,
+                    type(event).__name__,
+                    label,
+                    type(trigger).__name__,
+                )
+            if matched:
+                break
+
+        if not matched:
+            return False
+
+        for condition in self.conditions:
+            start = clock()
+            allowed = (
+                await BLOCKING_POOL.run(condition.allows, event)
+                if getattr(condition, "blocking", False)
+                else condition.allows(event)
+            )
+            elapsed = clock() - start
+            REGISTRY.observe("condition", elapsed, label, type(condition).__name__)
+            if trace:
+                TRACER.span(
+                    trace,
+                    "condition",
+                    start,
+                    elapsed,
+                    type(event).__name__,
+                    label,
+                    type(condition).__name__,
+                )
+            if not allowed:
+                return False
 
+        return True
+
+    async def _act(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """
+        Passes the event to each action in turn, with a new state object.
+
+        The time recorded for each action only includes the time spent in the action itself,
+        and not the time spent by whoever consumes its outputs. Blocking actions are run to
+        completion on the blocking thread pool before their outputs are passed on, and the
+        time recorded includes any time spent waiting for a thread.
+        """
+        label = self._name or type(self).__name__
+        clock = time.perf_counter
+        trace = sampled_trace()
         state: dict[str, Any] = {}
 
         for action in self.actions:
-            async for output in action.act(event, state):
-                if output:
-                    yield output
+            elapsed = 0.0
+            start = began = clock()
+
+            if getattr(action, "blocking", False):
+                outputs = await BLOCKING_POOL.run(_run_action, action, event, state)
+                elapsed = clock() - start
+                for output in outputs:
+                    if output:
+                        yield output
+            else:
+                async for output in action.act(event, state):
+                    elapsed += clock() - start
+                    if output:
+                        yield output
+                    start = clock()
+
+                elapsed += clock() - start
+            REGISTRY.observe("action", elapsed, label, type(action).__name__)
+            if trace:
+                TRACER.span(
+                    trace,
+                    "action",
+                    began,
+                    elapsed,
+                    type(event).__name__,
+                    label,
+                    type(action).__name__,
+                )
 
     def serialise(self) -> BehaviourConfigBlock:
         """
@@ -494,12 +607,93 @@ class Behaviour(Component):
         }
 
 
+class BatchBehaviour(Behaviour):
+    """
+    A Behaviour which opts in to being given several events at once.
+
+    When the runner's batch_size is above one, a worker takes the waiting events together
+    and passes them to :meth:`process_batch`, rather than passing each event to
+    :meth:`~Behaviour.process` (see :class:`~mewbot.core.BatchBehaviourInterface`). This
+    saves the cost of a separate call for each event, when events arrive in bulk (e.g. a
+    feed backfilling on startup).
+
+    This changes the order the components see the events in, so behaviours have to opt in
+    by subclassing this, rather than :class:`Behaviour`.
+    """
+
+    async def process_batch(self, events: Sequence[InputEvent]) -> AsyncIterable[OutputEvent]:
+        """
+        Processes several InputEvents, in order.
+
+        The triggers and conditions are checked for the whole batch in one pass, and the
+        actions are then run for each matching event in turn, each with its own state.
+        Note that the conditions therefore see the data stores as they were before the
+        batch, rather than after the actions for the earlier events.
+
+        Subclasses which override :meth:`process` have each event passed to that instead.
+        """
+        if type(self).process is not Behaviour.process:
+            for event in events:
+                async for result in self.process(event):
+                    yield result
+            return
+
+        matched = [event for event in events if await self._matches(event)]
+
+        for event in matched:
+            async for output in self._act(event):
+                yield output
+
+
+def _run_action(
+    action: ActionInterface, event: InputEvent, state: dict[str, Any]
+) -> list[OutputEvent | None]:
+    """
+    Run a blocking action to completion, on its own event loop, collecting its outputs.
+
+    This is called on a thread of the blocking pool.
+    """
+
+    async def collect() -> list[OutputEvent | None]:
+        return [output async for output in action.act(event, state)]
+
+    return asyncio.run(collect())
+
+
+BlockingComponent = TypeVar("BlockingComponent", bound=Union[Trigger, Condition, Action])
+
+
+def blocking(cls: type[BlockingComponent]) -> type[BlockingComponent]:
+    """
+    Class decorator marking a Trigger, Condition, or Action as doing blocking work.
+
+    A component which blocks (e.g. calling a synchronous library, or running a subprocess)
+    would stall every input and output of the bot. A Behaviour instead runs the `matches`,
+    `allows`, or `act` of a blocking component on a thread of the blocking pool (see
+    :mod:`mewbot.offload`), and waits for the result without blocking the event loop.
+    Results and exceptions are passed back to the behaviour as if the method had been
+    called directly. This is the same as setting `blocking = True` in the class.
+
+    Blocking actions are run on their own event loop in the thread, so `act` can still be
+    written as an async generator, but it must not await anything belonging to the bot's
+    event loop. Its outputs are passed on once it has finished.
+
+    .. code-block:: python
+
+        @blocking
+        class RollDice(Action):
+            ...
+    """
+    cls.blocking = True
+    return cls
+
+
 TypingComponent = TypeVar("TypingComponent", bound=Union[Trigger, Condition])
 TypingEvent = TypeVar("TypingEvent", bound=InputEvent)
 
 
 def pre_filter_non_matching_events(
-    wrapped: Callable[[TypingComponent, TypingEvent], bool]
+    wrapped: Callable[[TypingComponent, TypingEvent], bool],
 ) -> Callable[[TypingComponent, InputEvent], bool]:
     """
         Check an input event against the valid event types declared in the signature.
@@ -624,6 +818,7 @@ __all__ = [
     "Input",
     "Output",
     "Behaviour",
+    "BatchBehaviour",
     "Trigger",
     "Condition",
     "Action",
@@ -631,5 +826,6 @@ __all__ = [
     "OutputEvent",
     "InputQueue",
     "OutputQueue",
+    "blocking",
     "pre_filter_non_matching_events",
 ]
@@ -11,16 +11,41 @@ The objective of most other parts of this project is to produce a Bot, which can
 the outside world.
 """
 
+# pylint: disable=too-many-lines
+# The runner's configuration and processing are kept together, so they can be read as one.
+
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Type
+from collections.abc import Hashable
+from types import ModuleType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Type,
+    TypeVar,
+)
 
 import asyncio
+import collections
+import dataclasses
+import functools
+import importlib
+import io
 import logging
 import signal
+import time
 
 from mewbot.core import (
+    BatchBehaviourInterface,
     BehaviourInterface,
+    DedupIndex,
     InputEvent,
     InputInterface,
     InputQueue,
@@ -28,12 +53,330 @@ from mewbot.core import (
     OutputEvent,
     OutputInterface,
     OutputQueue,
+    OverflowPolicy,
+    PriorityLanes,
+    take_batch,
 )
 from mewbot.data import DataSource
+from mewbot.deadletter import DeadLetter, DeadLetterStore, component_name
+from mewbot.delivery import CircuitBreaker, OutputLane, RetryPolicy, TokenBucket
+from mewbot.dispatch import TypeDispatchTable
+from mewbot.journal import DEFAULT_COMMIT_INTERVAL, DEFAULT_COMMIT_SIZE, EventJournal
+from mewbot.lagmonitor import LoopLagMonitor
+from mewbot.metrics import REGISTRY
+from mewbot.offload import BLOCKING_POOL
+from mewbot.profiler import DEFAULT_PROFILE_INTERVAL, DEFAULT_PROFILE_PATH, PROFILER
+from mewbot.replay import EventRecorder, RecordingQueue
+from mewbot.scheduler import BehaviourScheduler
+from mewbot.tracing import CURRENT_TRACE, TRACER, FileExporter, Trace, tag, trace_of
+
+# uvloop is optional; see RunnerConfig.event_loop
+uvloop: Optional[ModuleType]
+try:
+    uvloop = importlib.import_module("uvloop")
+except ImportError:
+    uvloop = None
 
 logging.basicConfig(level=logging.INFO)
 
+# The event loops a runner can use: see RunnerConfig.event_loop
+EVENT_LOOPS = ("asyncio", "uvloop", "auto")
+
+
+@dataclasses.dataclass
+class RunnerConfig:
+    """
+    Settings which control how a :class:`BotRunner` processes events.
+
+    These are set in the bot's YAML with a `Runner` block, where the properties are the
+    fields of this class. Any field which is not given keeps its default.
+
+    .. code-block:: yaml
+
+        kind: Runner
+        implementation: mewbot.bot.BotRunner
+        uuid: aaaaaaaa-aaaa-4aaa-0000-aaaaaaaaaa00
+        properties:
+          input_workers: 4
+          input_queue_size: 10000
+          input_queue_policy: drop-oldest
+          priority_weights: [8, 1]
+          event_priorities:
+            mewbot.io.rss.RSSInputEvent: 1
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # Each setting is a field, so that they can all be given in the YAML.
+
+    # Number of tasks taking events off the input queue and passing them to behaviours.
+    # Events with the same partition key are still processed in order.
+    input_workers: int = 1
+
+    # Maximum number of input events each worker takes off the queue at once, and how long
+    # (in seconds) it waits for more events to arrive once it has one. Behaviours which
+    # implement process_batch (such as mewbot.api.v1.BatchBehaviour) are given all the
+    # events in a batch together. A batch_size of 1 processes events one at a time.
+    batch_size: int = 1
+    batch_wait: float = 0.0
+
+    # Maximum number of events waiting on each queue (0 for no limit), and what to do with
+    # new events when the queue is full: one of "block", "drop-oldest", "drop-newest", or
+    # "reject". See mewbot.core.OverflowPolicy.
+    input_queue_size: int = 0
+    input_queue_policy: str = OverflowPolicy.BLOCK.value
+    output_queue_size: int = 0
+    output_queue_policy: str = OverflowPolicy.BLOCK.value
+
+    # Input events can be split into priority lanes, so that (for example) chat commands are
+    # not held up behind a burst of feed items. priority_weights is the share of events
+    # taken from each lane while several lanes have events waiting, highest priority first.
+    # event_priorities maps event classes, or whole modules, to the index of their lane;
+    # events which are not listed (and whose base classes are not listed) use lane 0.
+    priority_weights: List[int] = dataclasses.field(default_factory=lambda: [1])
+    event_priorities: Dict[str, int] = dataclasses.field(default_factory=dict)
+
+    # By default, each input event is passed to all its behaviours before the worker takes
+    # the next event, so the slowest behaviour sets the pace. If behaviour_concurrency is set,
+    # each behaviour instead processes events as independent tasks, with up to this many
+    # events in flight per behaviour, and as many again waiting in its buffer. Workers only
+    # wait while a behaviour's buffer is full, so other behaviours keep receiving events.
+    # behaviour_limits overrides the limit for behaviours by their name (or uuid).
+    # Batches (see batch_size) are always passed to all their behaviours together.
+    behaviour_concurrency: int = 0
+    behaviour_limits: Dict[str, int] = dataclasses.field(default_factory=dict)
+
+    # Maximum number of output events passed to an output at once, and how long (in seconds)
+    # its lane waits for more events to arrive once it has one. Only outputs which
+    # implement output_many (see mewbot.core.BatchOutputInterface) are given batches; others
+    # are given one event at a time. An output_batch_size of 1 sends events one at a time.
+    output_batch_size: int = 1
+    output_batch_wait: float = 0.0
+
+    # Outputs can be rate limited, so that behaviours can not flood a service (and get the
+    # bot rate limited by it). output_rate_limits maps output classes, or whole modules, to
+    # a limit with a "rate" (events per second), and optionally a "burst" (events which can
+    # be sent at once; default 1) and "max_wait" (the longest an event may wait to be sent,
+    # in seconds; by default they wait as long as needed). Events which would wait longer
+    # are dropped. Each output has its own bucket (shared by the bots in a BotHost which
+    # share the output). See mewbot.delivery.TokenBucket.
+    output_rate_limits: Dict[str, Dict[str, float]] = dataclasses.field(default_factory=dict)
+
+    # By default, events waiting on the queues are lost if the process dies. If queue_path
+    # is set, queued events are also kept in an SQLite database at that path until they
+    # have been handled, and any left from a previous run are queued again at startup.
+    # Changes to the database are committed in groups: once queue_commit_size are waiting,
+    # or queue_commit_interval seconds after the first of them. See mewbot.journal.
+    queue_path: str = ""
+    queue_commit_interval: float = DEFAULT_COMMIT_INTERVAL
+    queue_commit_size: int = DEFAULT_COMMIT_SIZE
+
+    # If record_path is set, every event the inputs produce is also written to a recording
+    # at that path (replacing any existing file), with the time it arrived, so that the
+    # traffic can be replayed through a new version of the bot. See mewbot.replay.
+    record_path: str = ""
+
+    # A behaviour which raises an exception for an event, or an output which raises one
+    # while sending an event, is logged and the runner carries on. Outputs can retry events:
+    # up to output_retries times, after a random delay of up to retry_backoff seconds,
+    # doubling for each retry up to retry_max_backoff. If dead_letter_size is set, events
+    # which still failed are kept (the newest dead_letter_size of them) so that they can be
+    # inspected and replayed; with a dead_letter_path, they are also kept in an SQLite
+    # database at that path. See mewbot.deadletter.
+    output_retries: int = 0
+    retry_backoff: float = 1.0
+    retry_max_backoff: float = 60.0
+    dead_letter_size: int = 0
+    dead_letter_path: str = ""
+
+    # Each output can have a circuit breaker, so that an output whose service is down does
+    # not hold up its events for a timeout each. If circuit_failures is set, an output's
+    # circuit opens after that many calls in a row raise an exception, or take longer than
+    # circuit_slow_call seconds (if set). While it is open, events for the output fail
+    # straight away (and are retried or dead-lettered as above), or, with circuit_buffer,
+    # wait in the output's lane. After circuit_reset seconds, the next event is sent to
+    # test the output, and closes the circuit again if it succeeds. As with rate limits,
+    # bots in a BotHost which share an output share its circuit. The state of each
+    # circuit is logged with the metrics. See mewbot.delivery.CircuitBreaker.
+    circuit_failures: int = 0
+    circuit_slow_call: float = 0.0
+    circuit_reset: float = 30.0
+    circuit_buffer: bool = False
+
+    # Triggers, conditions, and actions which declare that they block (see
+    # mewbot.api.v1.blocking) are run on a pool of threads, so that they do not stall the
+    # event loop. blocking_workers is the number of threads; 0 uses Python's default (the
+    # number of CPUs plus 4, up to 32). See mewbot.offload.
+    blocking_workers: int = 0
+
+    # Number of worker processes which run the behaviours, when using the
+    # mewbot.multiprocess.MultiProcessBotRunner. 0 starts one for each CPU.
+    processes: int = 0
+
+    # When stopping, the maximum time (in seconds) to spend finishing the events which are
+    # already queued. Events still waiting after this are dropped. 0 stops immediately.
+    drain_timeout: float = 5.0
+
+    # Every input event is given a correlation ID, which is attached to the output events
+    # produced for it (see mewbot.tracing). This fraction of events, between 0 and 1, are
+    # also traced: the time spent on each stage of handling them is appended to trace_file.
+    trace_sample_rate: float = 0.0
+    trace_file: str = "mewbot-trace.jsonl"
+
+    # Sending the process SIGUSR1 starts a sampling profiler, and sending it again stops the
+    # profiler and writes the samples to profile_path (passed through strftime, with the
+    # time the profiler was started), as folded stacks which flamegraph tools can read.
+    # A sample is taken every profile_interval seconds. See mewbot.profiler.
+    profile_path: str = DEFAULT_PROFILE_PATH
+    profile_interval: float = DEFAULT_PROFILE_INTERVAL
+
+    # Synchronous work in a component blocks the event loop, stalling every other input and
+    # output. If lag_interval is set, a heartbeat checks the loop every lag_interval seconds,
+    # and the percentiles of how late it was are logged with the metrics. Whenever the loop
+    # is blocked for more than lag_threshold seconds, a warning is logged with the stack it
+    # is blocked in, naming the behaviour, action, or output running. See mewbot.lagmonitor.
+    lag_interval: float = 0.0
+    lag_threshold: float = 0.1
+
+    # The event loop to run the bot on: "asyncio" for the standard library loop, or
+    # "uvloop" for the (generally faster) uvloop, if it is installed. If uvloop is asked for
+    # but not installed, a warning is logged and the asyncio loop is used. "auto" uses
+    # uvloop whenever it is installed, without the warning.
+    event_loop: str = "asyncio"
+
+    # Inputs can redeliver events (e.g. a chat gateway reconnecting, or a feed being re-read
+    # after a restart). If dedup_size is set, input events with a dedup_key are checked
+    # against the keys of the last dedup_size events seen within dedup_ttl seconds, and
+    # duplicates are dropped before they are queued. See mewbot.core.DedupIndex.
+    dedup_size: int = 0
+    dedup_ttl: float = 300.0
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        self._validate_numbers()
+        self._validate_behaviour_limits()
+        self._validate_tracing()
+        self._validate_event_loop()
+        self._validate_rate_limits()
+        self._validate_dead_letters()
+
+        # Raises a ValueError for unknown policies.
+        OverflowPolicy(self.input_queue_policy)
+        OverflowPolicy(self.output_queue_policy)
+
+        if not self.priority_weights or min(self.priority_weights) < 1:
+            raise ValueError(
+                f"priority_weights must be at least 1 (got {self.priority_weights})"
+            )
+
+        for name, lane in self.event_priorities.items():
+            if not 0 <= lane < len(self.priority_weights):
+                raise ValueError(f"event_priorities for {name} has no lane {lane}")
+
+    def _validate_numbers(self) -> None:
+        """Check that the sizes, limits, and times are in range."""
+        for name in ("input_workers", "batch_size", "output_batch_size", "queue_commit_size"):
+            if getattr(self, name) < 1:
+                raise ValueError(f"{name} must be at least 1 (got {getattr(self, name)})")
+
+        for name in (
+            "input_queue_size",
+            "output_queue_size",
+            "processes",
+            "behaviour_concurrency",
+            "batch_wait",
+            "output_batch_wait",
+            "queue_commit_interval",
+            "drain_timeout",
+            "dedup_size",
+            "output_retries",
+            "retry_backoff",
+            "retry_max_backoff",
+            "dead_letter_size",
+            "circuit_failures",
+            "circuit_slow_call",
+            "circuit_reset",
+            "lag_interval",
+            "blocking_workers",
+        ):
+            if getattr(self, name) < 0:
+                raise ValueError(f"{name} can not be negative (got {getattr(self, name)})")
+
+        for name in ("dedup_ttl", "profile_interval", "lag_threshold"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name} must be positive (got {getattr(self, name)})")
+
+    def _validate_behaviour_limits(self) -> None:
+        """Check the per-behaviour limits, which are only used when scheduling behaviours."""
+        if self.behaviour_limits and not self.behaviour_concurrency:
+            raise ValueError("behaviour_limits require behaviour_concurrency to be set")
+
+        for name, limit in self.behaviour_limits.items():
+            if limit < 1:
+                raise ValueError(
+                    f"behaviour_limits for {name} must be at least 1 (got {limit})"
+                )
+
+    def _validate_tracing(self) -> None:
+        """Check the fraction of events traced is a fraction."""
+        if not 0 <= self.trace_sample_rate <= 1:
+            raise ValueError(
+                f"trace_sample_rate must be between 0 and 1 (got {self.trace_sample_rate})"
+            )
+
+    def _validate_event_loop(self) -> None:
+        """Check the event loop is one which can be run."""
+        if self.event_loop not in EVENT_LOOPS:
+            raise ValueError(
+                f"event_loop must be one of {', '.join(EVENT_LOOPS)} (got {self.event_loop})"
+            )
+
+    def _validate_rate_limits(self) -> None:
+        """Check each output rate limit would make a valid token bucket."""
+        for name, rate_limit in self.output_rate_limits.items():
+            try:
+                TokenBucket.from_config(rate_limit)
+            except ValueError as error:
+                raise ValueError(f"output_rate_limits for {name}: {error}") from error
+
+    def _validate_dead_letters(self) -> None:
+        """Check dead letters are kept if they are to be stored."""
+        if self.dead_letter_path and not self.dead_letter_size:
+            raise ValueError("dead_letter_path requires dead_letter_size to be set")
+
+
+@dataclasses.dataclass
+class DrainReport:
+    """
+    Summary of the events handled while a :class:`BotRunner` was draining its queues.
+
+    Events are counted as dropped if they were still waiting to be processed (or sent)
+    when the drain finished.
+    """
+
+    inputs_processed: int = 0
+    inputs_dropped: int = 0
+    outputs_sent: int = 0
+    outputs_dropped: int = 0
+    timed_out: bool = False
+
+
+@dataclasses.dataclass
+class ReloadReport:
+    """
+    Summary of the components changed when a :class:`Bot`'s configuration was reloaded.
+
+    Behaviours and IOConfigs are matched by their uuid, and listed by it. Those whose
+    configuration is unchanged are kept, along with their state and connections.
+    """
+
+    added: List[str] = dataclasses.field(default_factory=list)
+    replaced: List[str] = dataclasses.field(default_factory=list)
+    removed: List[str] = dataclasses.field(default_factory=list)
+    kept: List[str] = dataclasses.field(default_factory=list)
+
 
+# pylint: disable=too-many-instance-attributes
+# The bot keeps its components, its runner settings, and the runner it created.
 class Bot:
     """
     Fundamental object of mewbot - a collection of objects which forms a software bot.
@@ -47,6 +390,13 @@ class Bot:
     _io_configs: List[IOConfigInterface]  # Connections to bot makes to other services
     _behaviours: List[BehaviourInterface]  # All the things the bot does
     _datastores: Dict[str, DataSource[Any]]  # Data sources and stores for this bot
+    _runner_config: RunnerConfig  # How the bot's events should be processed
+    _runner_class: Type[BotRunner]  # The runner which will process the bot's events
+    _runner: Optional[BotRunner]  # The runner created for the bot, if there is one
+
+    # Re-reads the bot's configuration, and updates the bot with it (see update).
+    # The loader sets this when a bot is loaded from a file; the runner calls it on SIGHUP.
+    reloader: Optional[Callable[[], ReloadReport]]
 
     def __init__(self, name: str) -> None:
         """
@@ -61,6 +411,10 @@ class Bot:
         self._io_configs = []
         self._behaviours = []
         self._datastores = {}
+        self._runner_config = RunnerConfig()
+        self._runner_class = BotRunner
+        self._runner = None
+        self.reloader = None
 
     def run(self) -> None:
         """
@@ -69,12 +423,71 @@ class Bot:
         This involves the creation of a :class BotRunner: instance, which will then be run.
         :return:
         """
-        runner = BotRunner(
+        self.create_runner().run()
+
+    def create_runner(self, config: Optional[RunnerConfig] = None) -> BotRunner:
+        """
+        Create the :class BotRunner: which will process the Bot's events, without running it.
+
+        :param config: Settings to use instead of the Bot's :attr:`runner_config`
+        :return:
+        """
+        self._runner = self._runner_class(
             self._marshal_behaviours(),
             self._marshal_inputs(),
             self._marshal_outputs(),
+            config=config if config else self._runner_config,
         )
-        runner.run()
+        self._runner.reloader = self.reloader
+        return self._runner
+
+    def update(
+        self,
+        behaviours: Iterable[BehaviourInterface],
+        io_configs: Iterable[IOConfigInterface],
+    ) -> ReloadReport:
+        """
+        Replace the Bot's Behaviours and IOConfigs with a new set, while it may be running.
+
+        Components are matched to the existing ones by their uuid. Where a component's
+        serialised configuration has not changed, the existing component is kept; otherwise
+        the new one is used. If the Bot has a runner, the runner is updated to match: see
+        :meth:`BotRunner.reload`. The runner's own settings are not changed.
+        :param behaviours: The Behaviours the Bot should now have
+        :param io_configs: The IOConfigs the Bot should now have
+        :return: Which components were added, replaced, removed, and kept
+        """
+        report = ReloadReport()
+        self._behaviours = _merge_components(self._behaviours, behaviours, report)
+        self._io_configs = _merge_components(self._io_configs, io_configs, report)
+
+        if self._runner:
+            self._runner.reload(
+                self._marshal_behaviours(), self._marshal_inputs(), self._marshal_outputs()
+            )
+
+        return report
+
+    def configure_runner(
+        self, config: RunnerConfig, runner_class: Optional[Type[BotRunner]] = None
+    ) -> None:
+        """
+        Set how the Bot's events will be processed once it is running.
+
+        As with the components, this should only be used _before_ the Bot is running.
+        :param config: The settings for the runner
+        :param runner_class: The :class BotRunner: (sub)class to run the bot with.
+                             If not given, the current runner class is kept.
+        :return:
+        """
+        self._runner_config = config
+        if runner_class:
+            self._runner_class = runner_class
+
+    @property
+    def runner_config(self) -> RunnerConfig:
+        """The settings the Bot's events will be processed with."""
+        return self._runner_config
 
     def add_io_config(self, ioc: IOConfigInterface) -> None:
         """
@@ -87,6 +500,28 @@ class Bot:
         """
         self._io_configs.append(ioc)
 
+    @property
+    def behaviours(self) -> List[BehaviourInterface]:
+        """The :class Behaviour:s of this Bot, in the order they were added."""
+        return list(self._behaviours)
+
+    @property
+    def io_configs(self) -> List[IOConfigInterface]:
+        """The :class IOConfig:s of this Bot, in the order they were added."""
+        return list(self._io_configs)
+
+    def replace_io_config(self, old: IOConfigInterface, new: IOConfigInterface) -> None:
+        """
+        Replace one of the Bot's :class IOConfig:s with another.
+
+        This is used by :class:`~mewbot.host.BotHost` to give several bots the same connection.
+        As with adding IOConfigs, this should only be used _before_ the Bot is running.
+        :param old: The IOConfig to be replaced
+        :param new: The IOConfig to use in its place
+        :return:
+        """
+        self._io_configs[self._io_configs.index(old)] = new
+
     def add_behaviour(self, behaviour: BehaviourInterface) -> None:
         """
         Add a :class Behaviour: to the Bot.
@@ -137,6 +572,53 @@ class Bot:
         return outputs
 
 
+Merged = TypeVar("Merged", BehaviourInterface, IOConfigInterface)
+
+
+def _merge_components(
+    existing: Iterable[Merged], new: Iterable[Merged], report: ReloadReport
+) -> List[Merged]:
+    """Match new components to existing ones by uuid, keeping those which are unchanged."""
+    previous = {getattr(component, "uuid", None): component for component in existing}
+    merged: List[Merged] = []
+
+    for component in new:
+        uuid = getattr(component, "uuid", None)
+        old = previous.pop(uuid, None) if uuid is not None else None
+
+        if old is None:
+            report.added.append(str(uuid))
+            merged.append(component)
+        elif _serialised(old) is not None and _serialised(old) == _serialised(component):
+            report.kept.append(str(uuid))
+            merged.append(old)
+        else:
+            report.replaced.append(str(uuid))
+            merged.append(component)
+
+    report.removed.extend(
+        str(getattr(component, "uuid", None)) for component in previous.values()
+    )
+    return merged
+
+
+def _serialised(component: Any) -> Optional[Any]:
+    serialise = getattr(component, "serialise", None)
+    return serialise() if callable(serialise) else None
+
+
+def _config_names(cls: type) -> List[str]:
+    """
+    Names a class can be referred to by in the runner config, most specific first.
+
+    These are the full names of the class and each of its base classes, and then the
+    names of their modules.
+    """
+    names = [f"{base.__module__}.{base.__qualname__}" for base in cls.__mro__]
+    names.extend(base.__module__ for base in cls.__mro__)
+    return names
+
+
 class BotRunner:
     """
     Responsible for running this programs interaction with the world.
@@ -146,12 +628,48 @@ class BotRunner:
     This class is responsible for all interactions of this program with the outside world.
     """
 
+    # pylint: disable=too-many-instance-attributes
+    # The queues, dispatch tables, lanes, and counters are all part of the runner's state.
+
     input_event_queue: InputQueue
     output_event_queue: OutputQueue
 
     inputs: Set[InputInterface]
-    outputs: Dict[Type[OutputEvent], Set[OutputInterface]] = {}
-    behaviours: Dict[Type[InputEvent], Set[BehaviourInterface]] = {}
+    _input_tasks: Dict[InputInterface, asyncio.Task[None]]  # Inputs started by setup_tasks
+    _closing_lanes: Set[
+        asyncio.Task[None]
+    ]  # Lanes of removed outputs, finishing their events
+    reloader: Optional[Callable[[], Any]]  # Called on SIGHUP; see Bot.reloader
+
+    _behaviours: Dict[Type[InputEvent], Set[BehaviourInterface]]
+    _behaviour_table: TypeDispatchTable[InputEvent, BehaviourInterface]
+    _outputs: Dict[Type[OutputEvent], Set[OutputInterface]]
+    _output_table: TypeDispatchTable[OutputEvent, OutputInterface]
+    _output_lanes: Dict[OutputInterface, OutputLane]
+    # The rate limit of each output, made as its lane is started. A BotHost shares this
+    # between its runners, so that an output shared by several bots is limited as one.
+    rate_limits: Dict[OutputInterface, Optional[TokenBucket]]
+    circuit_breakers: Dict[OutputInterface, Optional[CircuitBreaker]]  # Shared likewise
+
+    config: RunnerConfig
+    _partitions: Dict[Hashable, Deque[InputEvent]]  # Keys being processed, and their backlog
+    _priorities: Dict[Type[InputEvent], int]  # Priority lane for each event class seen
+    _schedule_behaviours: bool  # Whether behaviours run as tasks (see behaviour_concurrency)
+    _schedulers: Dict[BehaviourInterface, BehaviourScheduler]
+    # Schedulers of behaviours removed by a reload, finishing their events.
+    _closing_schedulers: Dict[BehaviourScheduler, asyncio.Future[None]]
+
+    journal: Optional[EventJournal]  # Keeps the queued events, if queue_path is set
+    recorder: Optional[EventRecorder]  # Records the input events, if record_path is set
+    dead_letters: Optional[DeadLetterStore]  # Events which failed, if dead_letter_size is set
+    _retry: Optional[RetryPolicy]  # When outputs retry failed events, if they do
+    lag_monitor: Optional[LoopLagMonitor]  # Running if lag_interval is set
+    input_target: InputQueue  # The queue the inputs are bound to
+    _unsent_outputs: Dict[int, int]  # Lanes yet to handle each journaled output event, by id
+
+    inputs_processed: int  # Input events which have been passed to all their behaviours
+    behaviour_failures: int  # Times a behaviour raised an exception for an event
+    _inputs_in_progress: int  # Input events currently being processed by behaviours
 
     _running: bool = False
 
@@ -160,28 +678,169 @@ class BotRunner:
         behaviours: Dict[Type[InputEvent], Set[BehaviourInterface]],
         inputs: Set[InputInterface],
         outputs: Dict[Type[OutputEvent], Set[OutputInterface]],
+        config: Optional[RunnerConfig] = None,
     ) -> None:
         """
         Provides the runner with all information it should need to start.
 
         All sub-components of the bot should be passed in at this point.
-        Adding additional parts later, once the runner has started, is not currently supported and
-        will result in undefined behavior.
-        If you wish to do this - and there is currently no inbuilt mechanism to do so - you must
-        stop the bot, construct a new runner, and start it again.
+        To change them once the runner has started, use :meth:`reload` (or
+        :meth:`Bot.update`, which works out what has changed).
         :param behaviours:
         :param inputs:
         :param outputs:
+        :param config: Settings for processing events. If not given, the defaults are used.
         """
         self.logger = logging.getLogger(__name__ + "BotRunner")
+        self.config = config if config else RunnerConfig()
+
+        self._priorities = {}
+        self.journal = self._journal()
+        self.input_event_queue = InputQueue(
+            self.config.input_queue_size,
+            self.config.input_queue_policy,
+            self._priority_lanes(),
+            self._dedup_index(),
+            self.journal.queue("input") if self.journal else None,
+        )
+        self.output_event_queue = OutputQueue(
+            self.config.output_queue_size,
+            self.config.output_queue_policy,
+            journal=self.journal.queue("output") if self.journal else None,
+        )
+        self._unsent_outputs = {}
+        self._restore_queues()
 
-        self.input_event_queue = InputQueue()
-        self.output_event_queue = OutputQueue()
+        self.recorder = (
+            EventRecorder(self.config.record_path) if self.config.record_path else None
+        )
+        self.input_target = (
+            RecordingQueue(self.input_event_queue, self.recorder)
+            if self.recorder
+            else self.input_event_queue
+        )
+
+        self.dead_letters = (
+            DeadLetterStore(self.config.dead_letter_size, self.config.dead_letter_path)
+            if self.config.dead_letter_size
+            else None
+        )
+        self._retry = (
+            RetryPolicy(
+                self.config.output_retries,
+                self.config.retry_backoff,
+                self.config.retry_max_backoff,
+            )
+            if self.config.output_retries
+            else None
+        )
 
         self.inputs = inputs
         self.outputs = outputs
         self.behaviours = behaviours
 
+        self._output_lanes = {}
+        self.rate_limits = {}
+        self.circuit_breakers = {}
+        self._input_tasks = {}
+        self._closing_lanes = set()
+        self.reloader = None
+        self.lag_monitor = None
+        self._partitions = {}
+        self._schedule_behaviours = self.config.behaviour_concurrency > 0
+        self._schedulers = {}
+        self._closing_schedulers = {}
+
+        self.inputs_processed = 0
+        self.behaviour_failures = 0
+        self._inputs_in_progress = 0
+
+    def _priority_lanes(self) -> Optional[PriorityLanes[InputEvent]]:
+        """Creates the priority lanes for the input queue, if more than one is configured."""
+        if len(self.config.priority_weights) == 1:
+            return None
+
+        return PriorityLanes(self.config.priority_weights, self._input_priority)
+
+    def _journal(self) -> Optional[EventJournal]:
+        """Opens the journal for the event queues, if a queue_path is configured."""
+        if not self.config.queue_path:
+            return None
+
+        return EventJournal(
+            self.config.queue_path,
+            self.config.queue_commit_interval,
+            self.config.queue_commit_size,
+        )
+
+    def _restore_queues(self) -> None:
+        """Queues the events left in the journal by a previous run, if there are any."""
+        for queue in (self.input_event_queue, self.output_event_queue):
+            restored = queue.restore()
+            if restored:
+                self.logger.info("Restored %d events to %s", restored, type(queue).__name__)
+
+    def _dedup_index(self) -> Optional[DedupIndex]:
+        """Creates the index of recently seen input events, if deduplication is configured."""
+        if not self.config.dedup_size:
+            return None
+
+        return DedupIndex(self.config.dedup_size, self.config.dedup_ttl)
+
+    def _input_priority(self, event: InputEvent) -> int:
+        """
+        Gets the priority lane for an input event, from the config's event_priorities.
+
+        The event's class and each of its base classes are checked by their full name, and
+        then by the name of their module. The result is cached for each class.
+        """
+        event_type = type(event)
+
+        try:
+            return self._priorities[event_type]
+        except KeyError:
+            pass
+
+        priorities = self.config.event_priorities
+        lane = next(
+            (priorities[name] for name in _config_names(event_type) if name in priorities), 0
+        )
+
+        self._priorities[event_type] = lane
+        return lane
+
+    @property
+    def behaviours(self) -> Dict[Type[InputEvent], Set[BehaviourInterface]]:
+        """
+        The behaviours of this bot, indexed by the base input event types they consume.
+
+        Input events are routed using a dispatch table built from this mapping.
+        Assigning a new mapping rebuilds that table; the mapping should not be modified
+        in place, as those changes will not be seen by the dispatch table.
+        """
+        return self._behaviours
+
+    @behaviours.setter
+    def behaviours(self, behaviours: Dict[Type[InputEvent], Set[BehaviourInterface]]) -> None:
+        # The table is built before either attribute is replaced, so they always agree.
+        table = TypeDispatchTable(behaviours)
+        self._behaviours, self._behaviour_table = behaviours, table
+
+    @property
+    def outputs(self) -> Dict[Type[OutputEvent], Set[OutputInterface]]:
+        """
+        The outputs of this bot, indexed by the base output event types they consume.
+
+        As with :attr:`behaviours`, output events are routed using a dispatch table built from
+        this mapping, which is rebuilt when a new mapping is assigned.
+        """
+        return self._outputs
+
+    @outputs.setter
+    def outputs(self, outputs: Dict[Type[OutputEvent], Set[OutputInterface]]) -> None:
+        table = TypeDispatchTable(outputs)
+        self._outputs, self._output_table = outputs, table
+
     def run(self, _loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
         """
         Start the bot at the end of construction.
@@ -196,7 +855,7 @@ class BotRunner:
         if self._running:
             raise RuntimeError("Bot is already running")
 
-        loop = _loop if _loop else asyncio.get_event_loop()
+        loop = _loop if _loop else self.event_loop()
 
         self.logger.info("Starting main event loop")
         self._running = True
@@ -223,19 +882,112 @@ class BotRunner:
 
         # Handle correctly terminating the loop
         self.add_signal_handlers(loop, stop)
+        self.add_profiler_handler(loop)
+        self.add_metrics_handler(loop)
+        self.add_reload_handler(loop)
+        self.setup_tracing()
+        self.setup_lag_monitor(loop)
+        BLOCKING_POOL.configure(self.config.blocking_workers)
 
         try:
             loop.run_forever()
         finally:
-            # Stop accepting new events
-            for task in input_tasks:
+            # Stop accepting new events (from the inputs started here, or by a reload)
+            for task in [*input_tasks, *self._input_tasks.values()]:
                 if not task.done():
                     result = task.cancel()
                     self.logger.warning("Cancelling %s: %s", task, result)
 
-            # Finish processing anything already in the queues.
-            loop.run_until_complete(input_task)
-            loop.run_until_complete(output_task)
+            # Finish processing anything already in the queues, up to the deadline.
+            report = loop.run_until_complete(self.drain(self.config.drain_timeout))
+            self.logger.info("Drained queues: %s", report)
+
+            # Shut down the processors, which would otherwise wait for events forever.
+            for task in (input_task, output_task):
+                task.remove_done_callback(stop)
+                task.cancel()
+            loop.run_until_complete(
+                asyncio.gather(input_task, output_task, return_exceptions=True)
+            )
+            TRACER.configure(0.0, None)
+            if PROFILER.running:
+                PROFILER.toggle(loop, self.config.profile_path)
+            if self.lag_monitor:
+                self.lag_monitor.stop()
+            BLOCKING_POOL.shutdown()
+
+            self.close()
+
+    def close(self) -> None:
+        """
+        Close the journal, the recording, and the dead-letter store, if there are any.
+
+        Events which were not handled stay in the journal for the next run.
+        """
+        if self.journal:
+            self.journal.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.dead_letters:
+            self.dead_letters.close()
+
+    def event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        Gets the event loop to run the bot on, as set by the config's event_loop.
+
+        If uvloop is used, a new uvloop loop is created and set as the current loop.
+        :return:
+        """
+        if self.config.event_loop == "asyncio":
+            return asyncio.get_event_loop()
+
+        if uvloop is None:
+            if self.config.event_loop == "uvloop":
+                self.logger.warning("uvloop is not installed; using the asyncio event loop")
+            return asyncio.get_event_loop()
+
+        self.logger.info("Using uvloop event loop")
+        loop: asyncio.AbstractEventLoop = uvloop.new_event_loop()
+        asyncio.set_event_loop(loop)
+        return loop
+
+    async def drain(self, timeout: float) -> DrainReport:
+        """
+        Wait for the events already queued to be processed and sent.
+
+        Waits for at most `timeout` seconds. Input events are processed (and their outputs
+        queued) before the outputs are waited for. This does not stop the processors or
+        the inputs; new events which arrive while draining will also be handled.
+        :param timeout: The maximum time, in seconds, to wait.
+        :return: How many events were handled while draining, and how many remain.
+        """
+        inputs_before = self.inputs_processed
+        outputs_before = sum(lane.attempted for lane in self._output_lanes.values())
+        timed_out = False
+
+        try:
+            await asyncio.wait_for(self._wait_until_drained(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+
+        lanes = self._output_lanes.values()
+        return DrainReport(
+            inputs_processed=self.inputs_processed - inputs_before,
+            inputs_dropped=(
+                self.input_event_queue.qsize()
+                + sum(len(backlog) for backlog in self._partitions.values())
+                + self._inputs_in_progress
+            ),
+            outputs_sent=sum(lane.attempted for lane in lanes) - outputs_before,
+            outputs_dropped=self.output_event_queue.qsize()
+            + sum(lane.unsent for lane in lanes),
+            timed_out=timed_out,
+        )
+
+    async def _wait_until_drained(self) -> None:
+        await self.input_event_queue.join()
+        await self.output_event_queue.join()
+        await asyncio.gather(*(lane.join() for lane in self._output_lanes.values()))
 
     @staticmethod
     def add_signal_handlers(
@@ -269,6 +1021,123 @@ class BotRunner:
                 # We're probably running on windows, where this is not an option
                 pass
 
+    def add_profiler_handler(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Start and stop the sampling profiler when the process receives SIGUSR1.
+
+        The profile_path and profile_interval from the config are used; see
+        :mod:`mewbot.profiler`.
+        (If this is possible - currently only possible on posix environments).
+        :param loop:
+        :return:
+        """
+        sigusr1 = getattr(signal, "SIGUSR1", None)
+
+        if sigusr1 is None:
+            return
+
+        try:
+            loop.add_signal_handler(
+                sigusr1,
+                PROFILER.toggle,
+                loop,
+                self.config.profile_path,
+                self.config.profile_interval,
+            )
+        except NotImplementedError:
+            pass
+
+    def add_metrics_handler(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Dump the latency histograms to the log when the process receives SIGUSR2.
+
+        (If this is possible - currently only possible on posix environments).
+        :param loop:
+        :return:
+        """
+        sigusr2 = getattr(signal, "SIGUSR2", None)
+
+        if sigusr2 is None:
+            return
+
+        try:
+            loop.add_signal_handler(sigusr2, self.log_metrics)
+        except NotImplementedError:
+            pass
+
+    def log_metrics(self) -> None:
+        """
+        Writes the latency histograms for each stage of the pipeline to the log, as JSON.
+
+        The hit and miss counts for input deduplication, the state of each output's rate
+        limit and circuit breaker, the event loop's lag, and the size of the dead-letter
+        store are logged too, if they are configured.
+        """
+        dump = io.StringIO()
+        REGISTRY.dump(dump)
+        self.logger.info("Pipeline latencies: %s", dump.getvalue())
+
+        dedup = self.input_event_queue.dedup
+        if dedup is not None:
+            self.logger.info("Input deduplication: %s", dedup.stats())
+
+        limits = {
+            str(output): {**lane.limiter.stats(), "throttled": lane.throttled}
+            for output, lane in self._output_lanes.items()
+            if lane.limiter is not None
+        }
+        if limits:
+            self.logger.info("Output rate limits: %s", limits)
+
+        circuits = {
+            str(output): {**lane.breaker.stats(), "short_circuited": lane.short_circuited}
+            for output, lane in self._output_lanes.items()
+            if lane.breaker is not None
+        }
+        if circuits:
+            self.logger.info("Output circuits: %s", circuits)
+
+        if self.lag_monitor is not None:
+            self.logger.info("Event loop lag: %s", self.lag_monitor.stats())
+
+        if self.dead_letters is not None:
+            self.logger.info(
+                "Dead letters: %s (behaviour failures: %d, output retries: %d)",
+                self.dead_letters.stats(),
+                self.behaviour_failures,
+                sum(lane.retried for lane in self._output_lanes.values()),
+            )
+
+    def setup_tracing(self) -> None:
+        """
+        Start sampling traces, if the config sets a sample rate.
+
+        Spans are appended to the config's trace_file.
+        :return:
+        """
+        if self.config.trace_sample_rate:
+            self.logger.info(
+                "Tracing %s of events to %s",
+                self.config.trace_sample_rate,
+                self.config.trace_file,
+            )
+            TRACER.configure(
+                self.config.trace_sample_rate, FileExporter(self.config.trace_file)
+            )
+
+    def setup_lag_monitor(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Start monitoring the event loop's lag, if the config sets a lag_interval.
+
+        :param loop:
+        :return:
+        """
+        if self.config.lag_interval:
+            self.lag_monitor = LoopLagMonitor(
+                self.config.lag_interval, self.config.lag_threshold
+            )
+            self.lag_monitor.start(loop)
+
     def setup_tasks(self, loop: asyncio.AbstractEventLoop) -> List[asyncio.Task[None]]:
         """
         Prepare all tasks to allow the bot to start.
@@ -281,58 +1150,603 @@ class BotRunner:
 
         # Startup the inputs
         for _input in self.inputs:
-            _input.bind(self.input_event_queue)
-            self.logger.info("Starting input %s", _input)
-            input_tasks.append(loop.create_task(_input.run()))
+            input_tasks.append(self._start_input(_input, loop))
 
         return input_tasks
 
+    def _start_input(
+        self, _input: InputInterface, loop: asyncio.AbstractEventLoop
+    ) -> asyncio.Task[None]:
+        _input.bind(self.input_target)
+        self.logger.info("Starting input %s", _input)
+        task = self._input_tasks[_input] = loop.create_task(_input.run())
+        return task
+
+    def reload(
+        self,
+        behaviours: Dict[Type[InputEvent], Set[BehaviourInterface]],
+        inputs: Set[InputInterface],
+        outputs: Dict[Type[OutputEvent], Set[OutputInterface]],
+    ) -> None:
+        """
+        Swap in a new set of components while the runner is running.
+
+        The behaviour and output dispatch tables are rebuilt and replaced in one step, so each
+        event is routed using either the old or the new components, never a mix. Inputs which
+        are in both sets keep running undisturbed; removed inputs are cancelled, and new
+        inputs are started (if the inputs have been started). The lanes of removed outputs
+        finish sending the events already queued for them, and then stop; so do the
+        schedulers of removed behaviours (see :attr:`RunnerConfig.behaviour_concurrency`).
+
+        Events already being processed by a removed behaviour are allowed to finish.
+        :param behaviours: The behaviours to use, indexed by the input events they consume
+        :param inputs: The inputs to use
+        :param outputs: The outputs to use, indexed by the output events they consume
+        """
+        self.behaviours = behaviours
+        self.outputs = outputs
+
+        kept = {output for targets in outputs.values() for output in targets}
+        for output in [output for output in self._output_lanes if output not in kept]:
+            closing = asyncio.ensure_future(self._output_lanes.pop(output).close())
+            self._closing_lanes.add(closing)
+            closing.add_done_callback(self._closing_lanes.discard)
+
+        kept_behaviours = {
+            behaviour for targets in behaviours.values() for behaviour in targets
+        }
+        for behaviour in [b for b in self._schedulers if b not in kept_behaviours]:
+            self._close_scheduler(self._schedulers.pop(behaviour))
+
+        for _input in self.inputs - inputs:
+            task = self._input_tasks.pop(_input, None)
+            if task:
+                self.logger.info("Stopping input %s", _input)
+                task.cancel()
+
+        if self._input_tasks or self._running:
+            loop = asyncio.get_event_loop()
+            for _input in inputs - self.inputs:
+                self._start_input(_input, loop)
+
+        self.inputs = inputs
+
+    def add_reload_handler(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Reload the bot's configuration (using :attr:`reloader`) when the process gets SIGHUP.
+
+        (If this is possible - currently only possible on posix environments).
+        :param loop:
+        :return:
+        """
+        sighup = getattr(signal, "SIGHUP", None)
+
+        if sighup is None or self.reloader is None:
+            return
+
+        try:
+            loop.add_signal_handler(sighup, self.reload_config)
+        except NotImplementedError:
+            pass
+
+    def reload_config(self) -> None:
+        """Calls the reloader, logging what changed, or why the reload failed."""
+        reloader = self.reloader
+        if reloader is None:
+            return
+
+        try:
+            report = reloader()  # pylint: disable=not-callable
+        except Exception:  # pylint: disable=broad-except
+            self.logger.exception("Reload failed; the running configuration is unchanged")
+            return
+
+        self.logger.info("Reloaded configuration: %s", report)
+
     async def process_input_queue(self) -> None:
         """
         Pulls events off the input queue.
 
-        Matches events to the behaviors which can process them.
-        Awaits the behaviour.process call to allow the behaviour time to respond to the event.
+        Events are taken off the queue by a pool of workers (see
+        :attr:`RunnerConfig.input_workers`), each of which matches events to the behaviors which
+        can process them and awaits the behaviour.process calls to allow the behaviours time to
+        respond to the event. A slow behaviour therefore only holds up one worker.
+
+        Events which share a :meth:`~mewbot.core.InputEvent.partition_key` are processed in the
+        order they were queued: whichever worker is handling a key also handles any events for
+        that key which arrive in the meantime, while the other workers carry on with other keys.
+
+        If :attr:`RunnerConfig.batch_size` is more than one, workers take batches of events off
+        the queue instead (see :meth:`_input_batch_worker`). If
+        :attr:`RunnerConfig.behaviour_concurrency` is set, workers only schedule the behaviours,
+        rather than waiting for them (see :meth:`_schedule_input_event`).
         :return:
         """
-        while self._running:
-            try:
-                event = await asyncio.wait_for(self.input_event_queue.get(), 5)
-            except asyncio.exceptions.TimeoutError:
+        worker = (
+            self._input_worker if self.config.batch_size == 1 else self._input_batch_worker
+        )
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.config.input_workers)))
+        finally:
+            schedulers = [*self._schedulers.values(), *self._closing_schedulers]
+            await asyncio.gather(*(scheduler.stop() for scheduler in schedulers))
+            self._schedulers = {}
+
+    async def _input_worker(self) -> None:
+        # Workers wait on the queue until cancelled; see run() and drain() for shutdown.
+        while True:
+            event = await self.input_event_queue.get()
+            key = event.partition_key()
+
+            if key is None:
+                await self._dispatch_input_event(event)
+                continue
+
+            # Another worker is processing this key; leave the event for it, in order.
+            if key in self._partitions:
+                self._partitions[key].append(event)
                 continue
 
-            for event_type in self.behaviours:
-                if not isinstance(event, event_type):
-                    continue
+            backlog = self._partitions[key] = collections.deque((event,))
+            try:
+                while backlog:
+                    await self._dispatch_input_event(backlog.popleft())
+            finally:
+                del self._partitions[key]
+
+    async def _input_batch_worker(self) -> None:
+        """
+        Takes batches of events off the input queue, and processes them together.
 
-                async_tasks = [
-                    self._process_event_for_behaviour(behaviour, event)
-                    for behaviour in self.behaviours[event_type]
-                ]
+        Partition keys are handled as for single events: events for a key another worker
+        holds are left for that worker, and the keys in the batch are held until any events
+        which arrive for them in the meantime have also been processed.
+        """
+        while True:
+            events = await self._collect_batch()
+
+            batch: List[InputEvent] = []
+            keys: Dict[Hashable, Deque[InputEvent]] = {}
+
+            for event in events:
+                key = event.partition_key()
+
+                if key is not None and key not in keys:
+                    if key in self._partitions:
+                        self._partitions[key].append(event)
+                        continue
+                    keys[key] = self._partitions[key] = collections.deque()
+
+                batch.append(event)
+
+            try:
+                while batch:
+                    await self._dispatch_input_batch(batch)
+                    batch = [event for backlog in keys.values() for event in backlog]
+                    for backlog in keys.values():
+                        backlog.clear()
+            finally:
+                for key in keys:
+                    del self._partitions[key]
+
+    async def _collect_batch(self) -> List[InputEvent]:
+        """Waits for an event, then takes up to a batch of events off the input queue."""
+        return await take_batch(
+            self.input_event_queue, self.config.batch_size, self.config.batch_wait
+        )
+
+    def _start_trace(self, event: InputEvent) -> Trace:
+        """
+        Starts the trace for an event taken off the input queue.
+
+        The event is tagged with the trace, and its correlation ID is logged (at debug
+        level), so that the trace can be followed from the event which started it.
+        """
+        trace = TRACER.start()
+        tag(event, trace)
+        self.logger.debug(
+            "Processing %s with correlation ID %s", type(event).__name__, trace.correlation_id
+        )
+        return trace
+
+    async def _dispatch_input_batch(self, events: List[InputEvent]) -> None:
+        """
+        Processes a batch of events taken off the input queue, keeping the runner's counts.
+
+        The events are marked as done on the input queue once they have been processed.
+        Each event has its own trace, as for single events. The batch also has a trace, for
+        the outputs of batch behaviours; its `batch` span links to the traces of its events,
+        and it is sampled if any of them are.
+        """
+        traces = [self._start_trace(event) for event in events]
+        trace = TRACER.start()
+        trace.sampled = trace.sampled or any(each.sampled for each in traces)
 
-                await asyncio.gather(*async_tasks)
+        context = CURRENT_TRACE.set(trace)
+        start = time.perf_counter()
+
+        self._inputs_in_progress += len(events)
+        try:
+            processed = await self._process_input_batch(events)
+            self.inputs_processed += len(processed)
+            for event in processed:
+                self.input_event_queue.ack(event)
+        finally:
+            self._inputs_in_progress -= len(events)
+            for _ in events:
+                self.input_event_queue.task_done()
+
+            CURRENT_TRACE.reset(context)
+            TRACER.span(
+                trace,
+                "batch",
+                start,
+                time.perf_counter() - start,
+                links=[each.correlation_id for each in traces],
+            )
+
+    async def _process_input_batch(self, events: List[InputEvent]) -> List[InputEvent]:
+        """
+        Passes each behaviour the events in the batch which it consumes, in order.
+
+        Behaviours which implement :class:`~mewbot.core.BatchBehaviourInterface` get their
+        events in one call; other behaviours are given them one at a time, each under the
+        event's own trace.
+        :return: The events which were processed; the others are not acknowledged.
+        """
+        batches: Dict[BehaviourInterface, List[InputEvent]] = {}
+
+        for event in events:
+            for behaviour in self._behaviour_table.lookup(type(event)):
+                batches.setdefault(behaviour, []).append(event)
+
+        await asyncio.gather(
+            *(self._process_batch_for_behaviour(b, batch) for b, batch in batches.items())
+        )
+        return events
+
+    async def _process_batch_for_behaviour(
+        self, behaviour: BehaviourInterface, events: List[InputEvent]
+    ) -> None:
+        if isinstance(behaviour, BatchBehaviourInterface):
+            try:
+                async for output in behaviour.process_batch(events):
+                    await self._queue_output(output, behaviour)
+            except Exception as error:  # pylint: disable=broad-except
+                self._behaviour_failed(behaviour, events, error)
+            return
+
+        for event in events:
+            context = CURRENT_TRACE.set(trace_of(event))
+            try:
+                await self._process_event_for_behaviour(behaviour, event)
+            finally:
+                CURRENT_TRACE.reset(context)
+
+    async def _dispatch_input_event(self, event: InputEvent) -> None:
+        """
+        Processes an event taken off the input queue, keeping the runner's counts.
+
+        The event is marked as done on the input queue once it has been processed.
+        It is processed under a new trace (see :mod:`mewbot.tracing`), which is attached to
+        each of the output events produced for it.
+        """
+        trace = self._start_trace(event)
+        context = CURRENT_TRACE.set(trace)
+        self._inputs_in_progress += 1
+
+        if self._schedule_behaviours:
+            try:
+                await self._schedule_input_event(event)
+            finally:
+                CURRENT_TRACE.reset(context)
+            return
+
+        start = time.perf_counter()
+        try:
+            if await self._process_input_event(event):
+                self.inputs_processed += 1
+                self.input_event_queue.ack(event)
+        finally:
+            self._inputs_in_progress -= 1
+            self.input_event_queue.task_done()
+
+            CURRENT_TRACE.reset(context)
+            TRACER.span(
+                trace, "process", start, time.perf_counter() - start, type(event).__name__
+            )
+
+    async def _schedule_input_event(self, event: InputEvent) -> None:
+        """
+        Schedules the event with each behaviour which consumes it, without waiting for them.
+
+        This only waits while a behaviour has its limit of events in flight, and its buffer of
+        waiting events is full; see :class:`~mewbot.scheduler.BehaviourScheduler`.
+        The event is counted as processed, and marked as done on the input queue, once every
+        behaviour has finished with it; its `process` span also ends then.
+        """
+        behaviours = self._behaviour_table.lookup(type(event))
+        key = event.partition_key()
+        trace = CURRENT_TRACE.get()
+        start = time.perf_counter()
+
+        # One extra count is held until all the behaviours have been scheduled. If the worker
+        # is cancelled part way through, the event is left in progress.
+        remaining = len(behaviours) + 1
+        completed = 0  # Behaviours which finished with the event, rather than being cancelled
+
+        def finished() -> None:
+            nonlocal remaining
+            remaining -= 1
+
+            if not remaining:
+                self.inputs_processed += 1
+                self._inputs_in_progress -= 1
+                if completed == len(behaviours):
+                    self.input_event_queue.ack(event)
+                self.input_event_queue.task_done()
+
+                if trace:
+                    TRACER.span(
+                        trace,
+                        "process",
+                        start,
+                        time.perf_counter() - start,
+                        type(event).__name__,
+                    )
+
+        async def process(behaviour: BehaviourInterface) -> None:
+            nonlocal completed
+            await self._process_event_for_behaviour(behaviour, event)
+            completed += 1
+
+        for behaviour in behaviours:
+            await self._scheduler(behaviour).submit(
+                functools.partial(process, behaviour), key, finished
+            )
+
+        finished()
+
+    def _close_scheduler(self, scheduler: BehaviourScheduler) -> None:
+        """Stops the scheduler of a removed behaviour, once it has finished its events."""
+        closing = asyncio.ensure_future(scheduler.close())
+        self._closing_schedulers[scheduler] = closing
+        closing.add_done_callback(lambda _: self._closing_schedulers.pop(scheduler, None))
+
+    def _scheduler(self, behaviour: BehaviourInterface) -> BehaviourScheduler:
+        """Gets the scheduler for a behaviour, creating one if needed."""
+        try:
+            return self._schedulers[behaviour]
+        except KeyError:
+            pass
+
+        limit = self.config.behaviour_concurrency
+        for name in (getattr(behaviour, "name", None), getattr(behaviour, "uuid", None)):
+            if name in self.config.behaviour_limits:
+                limit = self.config.behaviour_limits[name]
+                break
+
+        scheduler = self._schedulers[behaviour] = BehaviourScheduler(behaviour, limit)
+        return scheduler
+
+    async def _process_input_event(self, event: InputEvent) -> bool:
+        """
+        Passes the event to all the behaviours which consume it, and waits for them.
+
+        Behaviours are matched using the dispatch table, so each event class is only
+        matched against the behaviours' interests once.
+        :return: Whether the event was processed; if not, it is not acknowledged.
+        """
+        behaviours = self._behaviour_table.lookup(type(event))
+
+        if behaviours:
+            await asyncio.gather(
+                *(self._process_event_for_behaviour(b, event) for b in behaviours)
+            )
+        return True
 
     async def _process_event_for_behaviour(
         self, behaviour: BehaviourInterface, event: InputEvent
     ) -> None:
-        async for output in behaviour.process(event):
+        start = time.perf_counter()
+        try:
+            async for output in behaviour.process(event):
+                await self._queue_output(output, behaviour)
+        except Exception as error:  # pylint: disable=broad-except
+            self._behaviour_failed(behaviour, [event], error)
+        finally:
+            trace = CURRENT_TRACE.get()
+            if trace and trace.sampled:
+                TRACER.span(
+                    trace,
+                    "behaviour",
+                    start,
+                    time.perf_counter() - start,
+                    type(event).__name__,
+                    str(getattr(behaviour, "name", "") or type(behaviour).__name__),
+                )
+
+    def _behaviour_failed(
+        self, behaviour: BehaviourInterface, events: List[InputEvent], error: Exception
+    ) -> None:
+        """
+        Logs a behaviour's exception, and keeps the events in the dead-letter store.
+
+        The events are not retried, as the behaviour may already have produced some of
+        their outputs.
+        """
+        self.behaviour_failures += 1
+        self.logger.error(
+            "Behaviour %s failed while processing %s",
+            behaviour,
+            events[0] if len(events) == 1 else f"{len(events)} events",
+            exc_info=error,
+        )
+
+        if self.dead_letters is not None:
+            target = component_name(behaviour)
+            for event in events:
+                self.dead_letters.add(DeadLetter(event, "behaviour", target, repr(error)))
+
+    async def replay_dead_letters(self, ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Pass the events in the dead-letter store back to the components which failed them.
+
+        Output events are put on the lane of the output which failed to send them, and input
+        events are processed again by the behaviour which failed to process them (and only
+        that behaviour). Events which fail again go back into the store as new letters.
+        Letters for components which are no longer part of the bot are left in the store.
+        :param ids: The letters to replay; all of them if not given.
+        :return: The number of letters replayed.
+        """
+        if self.dead_letters is None:
+            return 0
+
+        outputs = {
+            component_name(output): output
+            for targets in self.outputs.values()
+            for output in targets
+        }
+        behaviours = {
+            component_name(behaviour): behaviour
+            for targets in self.behaviours.values()
+            for behaviour in targets
+        }
+
+        wanted = None if ids is None else set(ids)
+        letters = self.dead_letters.take(
+            letter.id
+            for letter in self.dead_letters.letters()
+            if (wanted is None or letter.id in wanted)
+            and letter.target in (outputs if letter.stage == "output" else behaviours)
+        )
+
+        for letter in letters:
+            if letter.stage == "output":
+                await self._output_lane(outputs[letter.target]).put(letter.event)
+            else:
+                await self._process_event_for_behaviour(
+                    behaviours[letter.target], letter.event
+                )
+
+        return len(letters)
+
+    async def _queue_output(self, output: OutputEvent, source: Any) -> None:
+        """
+        Puts an event on the output queue, logging it if the queue rejects it.
+
+        The event is tagged with the trace of the input event being processed.
+        """
+        trace = CURRENT_TRACE.get()
+        if trace:
+            tag(output, trace)
+
+        try:
             await self.output_event_queue.put(output)
+        except asyncio.QueueFull:
+            self.logger.warning("Output queue full; rejected %s from %s", output, source)
 
     async def process_output_queue(self) -> None:
         """
         Consumes events off the output queue.
 
         Matches these events to the outputs which can handle events of that type.
-        Calls the outputs' output method to transmit the contents of that message to the world.
+        Each output has its own :class:`~mewbot.delivery.OutputLane`, which calls the output's
+        output method to transmit the contents of that message to the world.
+        Outputs therefore send concurrently, and a slow or failing output does not hold up
+        events for any other output. Events for any one output are sent in order, except
+        that events which are retried (see :attr:`RunnerConfig.output_retries`) are sent
+        again after the events which were queued behind them.
+
+        This runs until cancelled, at which point the lanes are stopped. Use :meth:`drain`
+        beforehand to let queued events be sent. If the queues have a journal, each event is
+        acknowledged once every lane it was given to has handled it.
         :return:
         """
-        while self._running:
-            try:
-                event = await asyncio.wait_for(self.output_event_queue.get(), 5)
-            except asyncio.exceptions.TimeoutError:
-                continue
+        try:
+            while True:
+                event = await self.output_event_queue.get()
+                try:
+                    outputs = self._output_table.lookup(type(event))
+                    if self.journal:
+                        self._track_output(event, len(outputs))
+
+                    for output in outputs:
+                        await self._output_lane(output).put(event)
+                finally:
+                    self.output_event_queue.task_done()
+        finally:
+            await asyncio.gather(*(lane.stop() for lane in self._output_lanes.values()))
+            self._output_lanes = {}
+
+    def _output_lane(self, output: OutputInterface) -> OutputLane:
+        """Gets the delivery lane for an output, starting one if needed."""
+        try:
+            return self._output_lanes[output]
+        except KeyError:
+            lane = self._output_lanes[output] = OutputLane(
+                output,
+                limiter=self._rate_limit(output),
+                batch_size=self.config.output_batch_size,
+                batch_wait=self.config.output_batch_wait,
+                retry=self._retry,
+                dead_letters=self.dead_letters,
+                breaker=self._circuit_breaker(output),
+                done=self._output_handled if self.journal else None,
+            )
+            lane.start()
+            return lane
+
+    def _track_output(self, event: OutputEvent, lanes: int) -> None:
+        """Waits for the lanes to handle a journaled output event before acknowledging it."""
+        if lanes:
+            self._unsent_outputs[id(event)] = lanes
+        else:
+            self.output_event_queue.ack(event)
+
+    def _output_handled(self, event: OutputEvent) -> None:
+        """Called by the lanes as they handle each event; the last acknowledges it."""
+        remaining = self._unsent_outputs.pop(id(event), 1) - 1
+        if remaining:
+            self._unsent_outputs[id(event)] = remaining
+        else:
+            self.output_event_queue.ack(event)
+
+    def _circuit_breaker(self, output: OutputInterface) -> Optional[CircuitBreaker]:
+        """
+        Gets the circuit breaker for an output, creating one if the config enables them.
 
-            for event_type in self.outputs:
-                if isinstance(event, event_type):
-                    for output in self.outputs[event_type]:
-                        await output.output(event)
+        Once created, the breaker is kept in :attr:`circuit_breakers`.
+        """
+        if output not in self.circuit_breakers:
+            self.circuit_breakers[output] = (
+                CircuitBreaker(
+                    self.config.circuit_failures,
+                    self.config.circuit_slow_call,
+                    self.config.circuit_reset,
+                    self.config.circuit_buffer,
+                )
+                if self.config.circuit_failures
+                else None
+            )
+
+        return self.circuit_breakers[output]
+
+    def _rate_limit(self, output: OutputInterface) -> Optional[TokenBucket]:
+        """
+        Gets the rate limit for an output, creating it from the config if needed.
+
+        As with event_priorities, the output's class and base classes are checked by their
+        full name, and then by the name of their module, in output_rate_limits.
+        Once created, the limit is kept in :attr:`rate_limits`.
+        """
+        if output not in self.rate_limits:
+            self.rate_limits[output] = None
+            for name in _config_names(type(output)):
+                if name in self.config.output_rate_limits:
+                    limit = self.config.output_rate_limits[name]
+                    self.rate_limits[output] = TokenBucket.from_config(limit)
+                    break
+
+        return self.rate_limits[output]
@@ -14,19 +14,33 @@ This module contains:
 
  - Interfaces for IO components (IOConfig, Input, Output)
  - Interfaces for behaviours (Behaviour, Trigger, Condition, Action)
- - Base classes for InputEvent and OutputEvent, and type hints for the event queues.
+ - Base classes for InputEvent and OutputEvent, and the event queues.
  - Component helper, including an enum of component types and a mapping to the interfaces
  - TypedDict mapping to the YAML schema for components.
 """
 
 from __future__ import annotations
 
-from collections.abc import AsyncIterable, Iterable
-from typing import Any, Protocol, TypedDict, Union, runtime_checkable
+from collections.abc import AsyncIterable, Callable, Hashable, Iterable, Sequence
+from typing import (
+    Any,
+    Generic,
+    Optional,
+    Protocol,
+    TypedDict,
+    TypeVar,
+    Union,
+    runtime_checkable,
+)
 
 import asyncio
+import collections
 import dataclasses
 import enum
+import time
+
+from mewbot.journal import QueueJournal
+from mewbot.metrics import REGISTRY
 
 
 @dataclasses.dataclass
@@ -40,6 +54,31 @@ class InputEvent:
     This base event has no data or properties. Events must be immutable.
     """
 
+    def partition_key(self) -> Hashable | None:
+        """
+        Key which groups this event with other events that must be processed in order.
+
+        When a bot runs more than one input worker, events with the same key are passed
+        to the behaviours in the order they were queued, while events with different keys
+        (or without a key) may be processed concurrently. A chat event might use the
+        channel it was sent in; a feed item might use the feed it was read from.
+
+        By default, events have no key and no ordering guarantee with other events.
+        """
+        return None
+
+    def dedup_key(self) -> Hashable | None:
+        """
+        Key which identifies this event, so that redelivered copies of it can be dropped.
+
+        If the bot's input queue has a :class:`DedupIndex`, an event whose key was seen
+        recently is discarded before it reaches the queue. A chat event might use the
+        message's ID; a feed item might use the feed and the item's guid.
+
+        By default, events have no key and are never treated as duplicates.
+        """
+        return None
+
 
 @dataclasses.dataclass
 class OutputEvent:
@@ -53,8 +92,530 @@ class OutputEvent:
     """
 
 
-InputQueue = asyncio.Queue[InputEvent]
-OutputQueue = asyncio.Queue[OutputEvent]
+class OverflowPolicy(str, enum.Enum):
+    """
+    What an event queue does with a new event when it is full.
+
+    The value of each policy is the name used for it in the bot's YAML.
+    """
+
+    BLOCK = "block"  # Wait until there is space on the queue (the default)
+    DROP_OLDEST = "drop-oldest"  # Discard the event which has been waiting longest
+    DROP_NEWEST = "drop-newest"  # Discard the new event
+    REJECT = "reject"  # Raise asyncio.QueueFull to whoever is adding the event
+
+
+QueuedEvent = TypeVar("QueuedEvent", bound=Union[InputEvent, OutputEvent])
+
+
+class PriorityLanes(Generic[QueuedEvent]):
+    """
+    Storage for an :class:`EventQueue` which keeps its events in several FIFO lanes.
+
+    Each event is placed in a lane by the `classify` function; lane 0 has the highest
+    priority. Events are taken from the lanes by weighted round-robin: in each round, a
+    lane with events waiting gives up to its weight in events, higher priority lanes first.
+    With weights of (8, 1), lane 0 gets 8 of every 9 events when both lanes are busy, but
+    lane 1 is never starved.
+
+    This implements the parts of :class:`collections.deque` which asyncio Queues use.
+    """
+
+    weights: tuple[int, ...]
+
+    _lanes: tuple[collections.deque[QueuedEvent], ...]
+    _credit: list[int]
+    _classify: Callable[[QueuedEvent], int]
+    _length: int
+
+    def __init__(
+        self, weights: Sequence[int], classify: Callable[[QueuedEvent], int]
+    ) -> None:
+        """
+        Create the lanes.
+
+        :param weights: The share of events taken from each lane, highest priority first.
+        :param classify: Gives the index of the lane an event should wait in.
+        """
+        if not weights or min(weights) < 1:
+            raise ValueError(f"Lane weights must all be at least 1 (got {weights})")
+
+        self.weights = tuple(weights)
+        self._lanes = tuple(collections.deque() for _ in weights)
+        self._credit = list(weights)
+        self._classify = classify
+        self._length = 0
+
+    def __len__(self) -> int:
+        """The number of events in all the lanes."""
+        return self._length
+
+    def __repr__(self) -> str:
+        """Shows the number of events waiting in each lane."""
+        return f"<PriorityLanes {[len(lane) for lane in self._lanes]}>"
+
+    def lane_sizes(self) -> list[int]:
+        """The number of events waiting in each lane."""
+        return [len(lane) for lane in self._lanes]
+
+    def append(self, event: QueuedEvent) -> None:
+        """Adds an event to the end of the lane it belongs in."""
+        self._lanes[self._classify(event)].append(event)
+        self._length += 1
+
+    def popleft(self) -> QueuedEvent:
+        """
+        Takes the next event to be processed.
+
+        :raise IndexError: If there are no events in any lane
+        """
+        for _ in range(2):
+            for index, lane in enumerate(self._lanes):
+                if lane and self._credit[index] > 0:
+                    self._credit[index] -= 1
+                    self._length -= 1
+                    return lane.popleft()
+
+            # Every lane with events waiting has had its share; start a new round.
+            self._credit = list(self.weights)
+
+        raise IndexError("pop from empty PriorityLanes")
+
+    def pop_lowest(self) -> QueuedEvent:
+        """
+        Takes the oldest event from the lowest priority lane which has any.
+
+        :raise IndexError: If there are no events in any lane
+        """
+        for lane in reversed(self._lanes):
+            if lane:
+                self._length -= 1
+                return lane.popleft()
+
+        raise IndexError("pop from empty PriorityLanes")
+
+
+class DedupIndex:
+    """
+    Bounded index of recently seen event keys, for dropping duplicate events.
+
+    A key is remembered for `ttl` seconds after it was first seen. Once the index holds
+    `maxsize` keys, the oldest is forgotten to make room for each new one.
+
+    Each key checked is counted in :attr:`hits` (it was already in the index) or
+    :attr:`misses` (it was not, and has been added).
+    """
+
+    maxsize: int
+    ttl: float
+    hits: int
+    misses: int
+    evicted: int  # Keys forgotten before their ttl, to keep within maxsize
+
+    # When each key expires, in the order they were added (and so the order they expire).
+    _expiries: collections.OrderedDict[Hashable, float]
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        """
+        Create an empty index.
+
+        :param maxsize: The most keys to remember at once.
+        :param ttl: How long (in seconds) to remember each key for.
+        """
+        if maxsize < 1:
+            raise ValueError(f"DedupIndex maxsize must be at least 1 (got {maxsize})")
+        if ttl <= 0:
+            raise ValueError(f"DedupIndex ttl must be positive (got {ttl})")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._expiries = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        """The number of keys currently remembered (including any which have expired)."""
+        return len(self._expiries)
+
+    def seen(self, key: Hashable) -> bool:
+        """
+        Checks whether a key was seen within the ttl, remembering it if it was not.
+
+        :return: True if the key is a duplicate.
+        """
+        now = time.monotonic()
+        self._expire(now)
+
+        if key in self._expiries:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        self._expiries[key] = now + self.ttl
+
+        if len(self._expiries) > self.maxsize:
+            self._expiries.popitem(last=False)
+            self.evicted += 1
+
+        return False
+
+    def forget(self, key: Hashable) -> None:
+        """Forget a key, so that it is not treated as a duplicate when next seen."""
+        self._expiries.pop(key, None)
+
+    def _expire(self, now: float) -> None:
+        while self._expiries:
+            key, expiry = next(iter(self._expiries.items()))
+            if expiry > now:
+                return
+            del self._expiries[key]
+
+    def stats(self) -> dict[str, int]:
+        """The counters, and the current number of keys, for logging."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "size": len(self._expiries),
+        }
+
+
+class EventQueue(asyncio.Queue[QueuedEvent], Generic[QueuedEvent]):
+    """
+    An asyncio Queue of events, which can be bounded with an overflow policy.
+
+    With a `maxsize` of 0 (the default) the queue is unbounded, and the policy is never used.
+    Otherwise, when the queue is full:
+
+     - :attr:`OverflowPolicy.BLOCK` waits for space, as a normal asyncio Queue does.
+     - :attr:`OverflowPolicy.DROP_OLDEST` discards the event at the head of the queue,
+       to make space for the new event.
+     - :attr:`OverflowPolicy.DROP_NEWEST` discards the new event.
+     - :attr:`OverflowPolicy.REJECT` raises :class:`asyncio.QueueFull` from `put`, so that the
+       producer knows the event was not accepted (an HTTP input might respond with a 429).
+
+    For all policies other than blocking, `put` never waits.
+    Discarded and rejected events are counted in :attr:`dropped` and :attr:`rejected`.
+
+    If :class:`PriorityLanes` are given, events are taken off the queue by priority rather
+    than strictly in the order they were added, and when dropping the oldest event it is
+    taken from the lowest priority lane.
+
+    The time each event spends waiting on the queue is recorded in the `queue` latency
+    histogram (see :mod:`mewbot.metrics`), labelled with the queue's class.
+
+    If a :class:`~mewbot.journal.QueueJournal` is given, each event added to the queue is
+    also written to the journal, and stays there until it is acknowledged with :meth:`ack`
+    (or dropped by the overflow policy). Events left in the journal by a previous run are
+    put back on the queue by :meth:`restore`.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The policy, counters, and the storage and journal for the events.
+
+    policy: OverflowPolicy
+    dropped: int
+    rejected: int
+    lanes: Optional[PriorityLanes[QueuedEvent]]
+    journal: Optional[QueueJournal]
+    # The same event can be queued more than once, so each event (by id) has a deque with
+    # an entry for each time it was queued: when it was added, and its journal row. The
+    # rows are kept until acknowledged, with the event, so that its id is not reused.
+    _put_times: dict[int, collections.deque[float]]
+    _rows: dict[int, tuple[QueuedEvent, collections.deque[int]]]
+    _restoring: Optional[int]  # The journal row of the event being restored, if any
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        policy: OverflowPolicy | str = OverflowPolicy.BLOCK,
+        lanes: Optional[PriorityLanes[QueuedEvent]] = None,
+        journal: Optional[QueueJournal] = None,
+    ) -> None:
+        """
+        Create a new queue.
+
+        :param maxsize: The maximum number of events in the queue; 0 for no limit.
+        :param policy: What to do with new events when the queue is full.
+        :param lanes: Priority lanes to keep the events in, instead of a single FIFO.
+        :param journal: Where to keep the events until they are acknowledged.
+        """
+        # Set before initialising the Queue, which calls _init.
+        self.lanes = lanes
+        self.journal = journal
+        self._put_times = {}
+        self._rows = {}
+        self._restoring = None
+        super().__init__(maxsize)
+
+        self.policy = OverflowPolicy(policy)
+        self.dropped = 0
+        self.rejected = 0
+
+    async def put(self, item: QueuedEvent) -> None:
+        """
+        Put an event onto the queue, applying the overflow policy if the queue is full.
+
+        :raise asyncio.QueueFull: if the queue is full, and the policy is to reject events.
+        """
+        if self.policy is OverflowPolicy.BLOCK:
+            await super().put(item)
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item: QueuedEvent) -> None:
+        """
+        Put an event onto the queue without waiting, applying the overflow policy if needed.
+
+        :raise asyncio.QueueFull: if the queue is full, and the policy is to block or reject.
+        """
+        if not self.full():
+            super().put_nowait(item)
+            return
+
+        if self.policy is OverflowPolicy.DROP_NEWEST:
+            self._discard(item)
+            return
+
+        if self.policy is OverflowPolicy.DROP_OLDEST:
+            self.drop_oldest()
+            super().put_nowait(item)
+            return
+
+        if self.policy is OverflowPolicy.REJECT:
+            self.rejected += 1
+
+        raise asyncio.QueueFull(f"Event queue is full ({self.maxsize} events)")
+
+    def _init(self, maxsize: int) -> None:
+        super()._init(maxsize)
+
+        if self.lanes is not None:
+            # The asyncio Queue keeps its items in _queue; the lanes stand in for its deque.
+            self._queue = self.lanes  # pylint: disable=attribute-defined-outside-init
+
+    def _put(self, item: QueuedEvent) -> None:
+        self._put_times.setdefault(id(item), collections.deque()).append(time.perf_counter())
+
+        # Restored events are already in the journal.
+        if self.journal is not None:
+            row = (
+                self._restoring if self._restoring is not None else self.journal.append(item)
+            )
+            self._rows.setdefault(id(item), (item, collections.deque()))[1].append(row)
+
+        super()._put(item)
+
+    def _get(self) -> QueuedEvent:
+        item = super()._get()
+
+        put_time = self._pop_put_time(item)
+        if put_time is not None:
+            REGISTRY.observe("queue", time.perf_counter() - put_time, "", type(self).__name__)
+
+        return item
+
+    def _pop_put_time(self, item: QueuedEvent) -> Optional[float]:
+        """When the oldest queued entry for an event was added, forgetting it."""
+        times = self._put_times.get(id(item))
+        if not times:
+            return None
+
+        put_time = times.popleft()
+        if not times:
+            del self._put_times[id(item)]
+        return put_time
+
+    def drop_oldest(self) -> None:
+        """
+        Discard the event which would next be taken off the queue.
+
+        With priority lanes, the oldest event in the lowest priority lane is discarded.
+        """
+        if self.empty():
+            raise asyncio.QueueEmpty()
+
+        # Bypasses _get, so that dropped events are not recorded as having been waiting.
+        if self.lanes is not None:
+            item = self.lanes.pop_lowest()
+        else:
+            item = super()._get()
+
+        self._pop_put_time(item)
+        self.ack(item)
+        self.task_done()
+        self._discard(item)
+
+    def _discard(self, item: QueuedEvent) -> None:  # pylint: disable=unused-argument
+        """Count an event which the overflow policy discarded (subclasses may clean up)."""
+        self.dropped += 1
+
+    def ack(self, item: QueuedEvent) -> None:
+        """
+        Acknowledge that an event taken off the queue has been handled.
+
+        The event is removed from the queue's journal, if it has one, so that it will not
+        be restored. Events which are not acknowledged are restored by the next run.
+        If the event was queued more than once, one of its entries is acknowledged.
+        """
+        entry = self._rows.get(id(item))
+        if entry is None or self.journal is None:
+            return
+
+        rows = entry[1]
+        self.journal.remove(rows.popleft())
+        if not rows:
+            del self._rows[id(item)]
+
+    def restore(self) -> int:
+        """
+        Put the events left in the journal by a previous run back on the queue.
+
+        The events are restored in the order they were first queued, regardless of the
+        queue's size limit.
+        :return: The number of events restored.
+        """
+        if self.journal is None:
+            return 0
+
+        events = self.journal.pending()
+
+        # The asyncio Queue has no other way to add items beyond its maxsize.
+        # pylint: disable=attribute-defined-outside-init
+        maxsize = self.maxsize
+        setattr(self, "_maxsize", 0)
+        try:
+            for row, event in events:
+                self._restoring = row
+                EventQueue.put_nowait(self, event)
+        finally:
+            self._restoring = None
+            setattr(self, "_maxsize", maxsize)
+
+        return len(events)
+
+
+Queued = TypeVar("Queued")
+
+
+async def take_batch(queue: asyncio.Queue[Queued], size: int, wait: float) -> list[Queued]:
+    """
+    Waits for an item, then takes up to a batch of items off a queue.
+
+    :param queue: The queue to take the items from.
+    :param size: The most items to take.
+    :param wait: How long (in seconds) to wait for more items, once the first has arrived.
+    :return: The items, in the order they were taken.
+    """
+    loop = asyncio.get_running_loop()
+
+    batch = [await queue.get()]
+    deadline = loop.time() + wait
+
+    while len(batch) < size:
+        try:
+            batch.append(queue.get_nowait())
+            continue
+        except asyncio.QueueEmpty:
+            pass
+
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), remaining))
+        except asyncio.TimeoutError:
+            break
+
+    return batch
+
+
+_DUPLICATE = object()  # Marker for an event which the dedup index has already seen
+
+
+class InputQueue(EventQueue[InputEvent]):
+    """
+    Queue of events from the Inputs, waiting to be processed by Behaviours.
+
+    If a :class:`DedupIndex` is given, events with a :meth:`~InputEvent.dedup_key` which
+    is already in the index are discarded as they are put, and counted in
+    :attr:`duplicates`. Events without a key are always queued. The keys of events which
+    are rejected, or discarded by the overflow policy, are forgotten, so that they are
+    accepted if they are delivered again.
+    """
+
+    dedup: Optional[DedupIndex]
+    duplicates: int
+
+    def __init__(
+        self,
+        maxsize: int = 0,
+        policy: OverflowPolicy | str = OverflowPolicy.BLOCK,
+        lanes: Optional[PriorityLanes[InputEvent]] = None,
+        dedup: Optional[DedupIndex] = None,
+        journal: Optional[QueueJournal] = None,
+    ) -> None:
+        """
+        Create a new queue.
+
+        :param maxsize: The maximum number of events in the queue; 0 for no limit.
+        :param policy: What to do with new events when the queue is full.
+        :param lanes: Priority lanes to keep the events in, instead of a single FIFO.
+        :param dedup: Index of recently seen events, used to discard duplicates.
+        :param journal: Where to keep the events until they are acknowledged.
+        """
+        super().__init__(maxsize, policy, lanes, journal)
+        self.dedup = dedup
+        self.duplicates = 0
+
+    def put_nowait(self, item: InputEvent) -> None:
+        """
+        Put an event onto the queue without waiting, unless it is a duplicate.
+
+        (`put` also adds events with this, once there is space for them, so the check is
+        made as each event is added, however long it waited.)
+        :raise asyncio.QueueFull: if the queue is full, and the policy is to block or reject.
+        """
+        key = self._dedup_key(item)
+        if key is _DUPLICATE:
+            return
+
+        try:
+            super().put_nowait(item)
+        except asyncio.QueueFull:
+            self._forget(key)
+            raise
+
+    def _dedup_key(self, item: InputEvent) -> Hashable | None:
+        """The event's dedup key, or _DUPLICATE if it has been seen recently."""
+        if self.dedup is None:
+            return None
+
+        key = item.dedup_key()
+        if key is None:
+            return None
+
+        if self.dedup.seen(key):
+            self.duplicates += 1
+            return _DUPLICATE
+
+        return key
+
+    def _discard(self, item: InputEvent) -> None:
+        super()._discard(item)
+        if self.dedup is not None:
+            self._forget(item.dedup_key())
+
+    def _forget(self, key: Hashable | None) -> None:
+        # An event which was not accepted can be accepted when it is delivered again.
+        if self.dedup is not None and key is not None:
+            self.dedup.forget(key)
+
+
+class OutputQueue(EventQueue[OutputEvent]):
+    """Queue of events from Behaviours, waiting to be sent by Outputs."""
 
 
 @runtime_checkable
@@ -154,6 +715,25 @@ class OutputInterface(Protocol):
         """
 
 
+@runtime_checkable
+class BatchOutputInterface(OutputInterface, Protocol):
+    """
+    An Output which can send several events in one call.
+
+    When the BotRunner is configured to batch output events, events waiting for outputs
+    implementing this interface are passed to them together. Other outputs are given the
+    events one at a time.
+    """
+
+    async def output_many(self, events: Sequence[OutputEvent]) -> bool:
+        """
+        Send the given events to the service, in the order given.
+
+        :param: events The events to transmit.
+        :return: Whether all the events were successfully written.
+        """
+
+
 @runtime_checkable
 class TriggerInterface(Protocol):
     """
@@ -294,6 +874,27 @@ class BehaviourInterface(Protocol):
         yield OutputEvent()  # pragma: no cover (not reachable)
 
 
+@runtime_checkable
+class BatchBehaviourInterface(BehaviourInterface, Protocol):
+    """
+    A Behaviour which can process several InputEvents in one call.
+
+    When the BotRunner is configured to batch events, behaviours implementing this
+    interface are given all the events in a batch which they consume together. Other
+    behaviours are given the events one at a time.
+    """
+
+    async def process_batch(self, events: Sequence[InputEvent]) -> AsyncIterable[OutputEvent]:
+        """
+        Processes several InputEvents, in the order given.
+
+        The outputs must be the same as processing each event in turn, but the behaviour
+        can share work between the events (such as checking the triggers and conditions
+        of all the events in one pass).
+        """
+        yield OutputEvent()  # pragma: no cover (not reachable)
+
+
 Component = Union[
     IOConfigInterface,
     TriggerInterface,
@@ -310,7 +911,8 @@ class ComponentKind(str, enum.Enum):
 
     These are all the components that a bot is built out of.
     These all have a matching interface above (except for DataSource
-    and Template which are not yet implemented, but in the specification)
+    and Template which are not yet implemented, but in the specification,
+    and Runner, which configures how the bot is run rather than being a component)
     """
 
     Behaviour = "Behaviour"
@@ -320,6 +922,7 @@ class ComponentKind(str, enum.Enum):
     IOConfig = "IOConfig"
     Template = "Template"
     DataSource = "DataSource"
+    Runner = "Runner"
 
     @classmethod
     def values(cls) -> list[str]:
@@ -368,14 +971,21 @@ __all__ = [
     "IOConfigInterface",
     "InputInterface",
     "OutputInterface",
+    "BatchOutputInterface",
     "BehaviourInterface",
+    "BatchBehaviourInterface",
     "TriggerInterface",
     "ConditionInterface",
     "ActionInterface",
     "InputEvent",
     "OutputEvent",
+    "EventQueue",
     "InputQueue",
     "OutputQueue",
+    "OverflowPolicy",
+    "PriorityLanes",
+    "DedupIndex",
+    "take_batch",
     "ConfigBlock",
     "BehaviourConfigBlock",
 ]
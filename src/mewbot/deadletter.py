@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides a dead-letter store, which keeps the events a bot failed to handle.
+
+When a behaviour raises an exception while processing an input event, or an output keeps
+raising exceptions while sending an output event (after any retries; see
+:class:`~mewbot.delivery.RetryPolicy`), the :class:`~mewbot.bot.BotRunner` logs the error
+and carries on with the next event. If the runner has a :class:`DeadLetterStore` (see
+`dead_letter_size` in :class:`~mewbot.bot.RunnerConfig`), the event is also kept there as
+a :class:`DeadLetter`, with what failed and why.
+
+The letters can be inspected with :meth:`DeadLetterStore.letters`, and once the problem
+is fixed, passed back to the component which failed with
+:meth:`~mewbot.bot.BotRunner.replay_dead_letters`.
+
+The store holds at most `maxsize` letters; when it is full, the oldest letter is discarded
+to make space. If a `path` is given, the letters are also kept in an SQLite database
+there, so that they survive a restart. Events which can not be pickled are only kept in
+memory.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import collections
+import dataclasses
+import logging
+import pickle
+import sqlite3
+import time
+
+
+@dataclasses.dataclass
+class DeadLetter:
+    """
+    An event which could not be handled, and why.
+
+    `stage` is `behaviour` for input events a behaviour failed to process, and `output`
+    for output events an output failed to send. `target` identifies the component which
+    failed (see :func:`component_name`). `time` is when the event was given up on, in
+    seconds since the epoch.
+    """
+
+    event: Any
+    stage: str
+    target: str
+    error: str
+    attempts: int = 1
+    time: float = dataclasses.field(default_factory=time.time)
+    id: int = 0  # pylint: disable=invalid-name
+
+
+def component_name(component: Any) -> str:
+    """
+    The name a component is identified by in the dead-letter store.
+
+    This is the component's uuid where it has one (which stays the same across restarts
+    of a bot loaded from YAML), and otherwise its class name.
+    """
+    return str(getattr(component, "uuid", None) or type(component).__qualname__)
+
+
+class DeadLetterStore:
+    """
+    Bounded store of the events which could not be handled, oldest first.
+
+    The number of letters added, and the number discarded to make space for newer ones,
+    are counted in :attr:`added` and :attr:`evicted`.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The settings and counters, the letters, and the database mirroring them.
+
+    maxsize: int
+    path: str
+    added: int
+    evicted: int
+
+    _letters: collections.OrderedDict[int, DeadLetter]  # By id, oldest first
+    _next_id: int
+    _db: Optional[sqlite3.Connection]
+    _logger: logging.Logger
+
+    def __init__(self, maxsize: int, path: str = "") -> None:
+        """
+        Create the store, loading any letters kept at the path by a previous run.
+
+        :param maxsize: The most letters to keep.
+        :param path: An SQLite database to also keep the letters in, if wanted.
+        """
+        if maxsize < 1:
+            raise ValueError(f"Dead-letter store size must be at least 1 (got {maxsize})")
+
+        self.maxsize = maxsize
+        self.path = path
+        self.added = 0
+        self.evicted = 0
+
+        self._letters = collections.OrderedDict()
+        self._next_id = 1
+        self._db = None
+        self._logger = logging.getLogger(__name__ + "DeadLetterStore")
+
+        if path:
+            self._open(path)
+
+    def __len__(self) -> int:
+        """The number of letters in the store."""
+        return len(self._letters)
+
+    def _open(self, path: str) -> None:
+        """Open the database, and load the letters in it."""
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS letters (id INTEGER PRIMARY KEY, stage TEXT, "
+            "target TEXT, error TEXT, attempts INTEGER, time REAL, event BLOB)"
+        )
+        self._db.commit()
+
+        rows = self._db.execute(
+            "SELECT id, stage, target, error, attempts, time, event FROM letters ORDER BY id"
+        ).fetchall()
+
+        for row, stage, target, error, attempts, when, data in rows:
+            self._next_id = row + 1
+            try:
+                event = pickle.loads(data)
+            except Exception:  # pylint: disable=broad-except
+                self._logger.exception(
+                    "Discarding dead letter %d, which can not be loaded", row
+                )
+                self._delete([row])
+                continue
+            self._letters[row] = DeadLetter(event, stage, target, error, attempts, when, row)
+
+        # The size may have been reduced since the letters were stored.
+        self._evict()
+
+    def add(self, letter: DeadLetter) -> DeadLetter:
+        """
+        Keep a letter, discarding the oldest letter if the store is full.
+
+        :return: The letter, with its id set.
+        """
+        letter.id = self._next_id
+        self._next_id += 1
+
+        self._letters[letter.id] = letter
+        self.added += 1
+        self._insert(letter)
+        self._evict()
+        return letter
+
+    def letters(self) -> List[DeadLetter]:
+        """The letters in the store, oldest first."""
+        return list(self._letters.values())
+
+    def take(self, ids: Optional[Iterable[int]] = None) -> List[DeadLetter]:
+        """
+        Remove letters from the store, e.g. to replay them.
+
+        :param ids: The letters to take; all of them if not given. Unknown ids are ignored.
+        :return: The letters taken, oldest first.
+        """
+        wanted = list(self._letters) if ids is None else sorted(set(ids))
+        taken = [self._letters.pop(row) for row in wanted if row in self._letters]
+        self._delete(letter.id for letter in taken)
+        return taken
+
+    def stats(self) -> Dict[str, int]:
+        """The store's size and counters, for logging."""
+        return {"size": len(self._letters), "added": self.added, "evicted": self.evicted}
+
+    def close(self) -> None:
+        """Close the database, if there is one."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _evict(self) -> None:
+        """Discard the oldest letters until the store is within its size."""
+        evicted = []
+        while len(self._letters) > self.maxsize:
+            evicted.append(self._letters.popitem(last=False)[0])
+
+        self.evicted += len(evicted)
+        self._delete(evicted)
+
+    def _insert(self, letter: DeadLetter) -> None:
+        if self._db is None:
+            return
+
+        try:
+            data = pickle.dumps(letter.event, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as err:
+            self._logger.warning("Not storing %s, as it can not be pickled: %s", letter, err)
+            return
+
+        with self._db:
+            self._db.execute(
+                "INSERT INTO letters (id, stage, target, error, attempts, time, event) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    letter.id,
+                    letter.stage,
+                    letter.target,
+                    letter.error,
+                    letter.attempts,
+                    letter.time,
+                    data,
+                ),
+            )
+
+    def _delete(self, ids: Iterable[int]) -> None:
+        if self._db is None:
+            return
+
+        with self._db:
+            self._db.executemany("DELETE FROM letters WHERE id = ?", ((row,) for row in ids))
+
+
+__all__ = ["DeadLetter", "DeadLetterStore", "component_name"]
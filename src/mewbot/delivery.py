@@ -0,0 +1,629 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides the delivery lanes the BotRunner uses to send events to outputs.
+
+Each output gets its own lane: a small queue and a task which passes events to
+:meth:`~mewbot.core.OutputInterface.output` one at a time. Events are delivered to a
+given output in the order they were produced, but each output runs independently, so
+a slow or failing output only delays its own events.
+
+Lanes for outputs which implement :class:`~mewbot.core.BatchOutputInterface` can coalesce
+waiting events, passing up to `batch_size` of them to the output in one call.
+
+A lane can also be given a :class:`TokenBucket`, which limits how often events are
+passed to its output. Events beyond the limit wait in the lane for a token, or are
+dropped if they would have to wait too long.
+
+Events the output raises an exception for can be retried, after a delay set by a
+:class:`RetryPolicy`. Events which still fail are kept in a
+:class:`~mewbot.deadletter.DeadLetterStore`, if the lane has one.
+
+A lane can also be given a :class:`CircuitBreaker`, which stops passing events to an
+output which keeps failing (or is very slow), so that a service which is down does not
+hold every event up for its timeout. After a while, one event is let through to check
+whether the output has recovered.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping, Sequence
+from typing import Any, Callable, Optional, Set, Tuple
+
+import asyncio
+import dataclasses
+import enum
+import logging
+import math
+import random
+import time
+
+from mewbot.core import BatchOutputInterface, OutputEvent, OutputInterface, take_batch
+from mewbot.deadletter import DeadLetter, DeadLetterStore, component_name
+from mewbot.metrics import REGISTRY
+from mewbot.tracing import TRACER, trace_of
+
+DEFAULT_LANE_SIZE = 1000
+
+
+class TokenBucket:
+    """
+    Rate limit for an output, as a bucket of tokens which refills at a steady rate.
+
+    Sending an event takes a token. The bucket holds at most `burst` tokens, so up to
+    `burst` events can be sent at once, after which events are sent `rate` times a second.
+    An event which would have to wait more than `max_wait` seconds for its token is
+    refused instead.
+
+    Tokens are taken as soon as an event is accepted, even if it must wait for it; the
+    bucket's token count goes negative while events are waiting.
+    """
+
+    rate: float  # Tokens added per second
+    burst: float  # The most tokens the bucket holds
+    max_wait: float  # The longest an event may wait for a token, in seconds
+
+    tokens: float
+    _updated: float
+
+    def __init__(self, rate: float, burst: float = 1, max_wait: float = math.inf) -> None:
+        """
+        Create a full bucket.
+
+        :param rate: The number of events allowed per second, on average.
+        :param burst: The number of events which may be sent together.
+        :param max_wait: The longest an event may wait to be sent; 0 never waits.
+        """
+        if rate <= 0:
+            raise ValueError(f"Rate limit rate must be positive (got {rate})")
+        if burst < 1:
+            raise ValueError(f"Rate limit burst must be at least 1 (got {burst})")
+        if max_wait < 0:
+            raise ValueError(f"Rate limit max_wait can not be negative (got {max_wait})")
+
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+
+        self.tokens = burst
+        self._updated = time.monotonic()
+
+    @classmethod
+    def from_config(cls, limit: Mapping[str, float]) -> TokenBucket:
+        """
+        Create a bucket from a rate limit in the runner config (see RunnerConfig).
+
+        :param limit: The rate, and optionally the burst and max_wait, of the limit.
+        """
+        unknown = set(limit).difference(("rate", "burst", "max_wait"))
+        if unknown:
+            raise ValueError(f"Unknown rate limit settings: {', '.join(sorted(unknown))}")
+        if "rate" not in limit:
+            raise ValueError("Rate limits must have a rate")
+
+        return cls(limit["rate"], limit.get("burst", 1), limit.get("max_wait", math.inf))
+
+    def reserve(self) -> Optional[float]:
+        """
+        Take a token for an event.
+
+        :return: How long the event must wait before it is sent, in seconds, or None if
+                 it would have to wait longer than max_wait (in which case no token is taken).
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > self.max_wait:
+            return None
+
+        self.tokens -= 1
+        return wait
+
+    def stats(self) -> dict[str, float]:
+        """The limit and current token count, for logging."""
+        return {"rate": self.rate, "burst": self.burst, "tokens": self.tokens}
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    """
+    How often, and after how long, to retry sending an event when the output fails.
+
+    The delay before each retry grows exponentially from `backoff`, doubling each time, up
+    to `max_backoff` seconds. So that outputs which failed together do not all retry
+    together, each delay is picked at random between zero and that limit ("full jitter").
+    """
+
+    retries: int  # Attempts after the first
+    backoff: float = 1.0  # The longest delay before the first retry, in seconds
+    max_backoff: float = 60.0  # The longest delay before any retry, in seconds
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        if self.retries < 0:
+            raise ValueError(f"Retries can not be negative (got {self.retries})")
+        if self.backoff < 0 or self.max_backoff < 0:
+            raise ValueError(
+                f"Retry backoff can not be negative (got {self.backoff}, {self.max_backoff})"
+            )
+
+    def delay(self, attempt: int) -> float:
+        """
+        The delay before retrying an event.
+
+        :param attempt: The number of attempts which have failed so far (from 1).
+        :return: The delay, in seconds.
+        """
+        limit = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return random.uniform(0, limit)
+
+
+class CircuitState(str, enum.Enum):
+    """
+    The state of a :class:`CircuitBreaker`.
+
+    The value of each state is the name it is logged with.
+    """
+
+    CLOSED = "closed"  # Events are passed to the output as normal
+    OPEN = "open"  # The output has failed; events are not passed to it
+    HALF_OPEN = "half-open"  # The next event is passed to the output, to test it
+
+
+class CircuitOpenError(Exception):
+    """
+    Given as the error for events which were not sent because an output's circuit was open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops events being passed to an output after it has failed several times in a row.
+
+    A call to the output fails if it raises an exception or, if `slow_call` is set, if it
+    takes longer than `slow_call` seconds (whether or not it succeeded). Once `failures`
+    calls in a row have failed, the circuit opens. After `reset_timeout` seconds it is
+    half-open: the next call is let through, and closes the circuit again if it succeeds,
+    or re-opens it for another `reset_timeout` if it fails.
+
+    While the circuit is open, the lane either fails the events straight away (so they are
+    retried or dead-lettered as if the output had failed) or, if `buffer` is set, holds
+    them until the circuit is half-open. Held events fill the lane, after which the output
+    queue processor waits for space, as for any slow output.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The settings are public so that they can be logged, along with the state.
+
+    failures: int  # Failed calls in a row which open the circuit
+    slow_call: float  # Calls longer than this count as failures, in seconds; 0 for none
+    reset_timeout: float  # How long the circuit stays open, in seconds
+    buffer: bool  # Whether to hold events while the circuit is open, instead of failing them
+
+    state: CircuitState
+    consecutive_failures: int
+    opened: int  # The number of times the circuit has opened
+    _opened_at: float
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        failures: int,
+        slow_call: float = 0.0,
+        reset_timeout: float = 30.0,
+        buffer: bool = False,
+    ) -> None:
+        """
+        Create a closed circuit.
+
+        :param failures: The number of failed calls in a row which open the circuit.
+        :param slow_call: Calls which take longer than this, in seconds, count as failures;
+                          0 counts only exceptions.
+        :param reset_timeout: How long to wait before testing the output again, in seconds.
+        :param buffer: Hold events while the circuit is open, rather than failing them.
+        """
+        if failures < 1:
+            raise ValueError(f"Circuit breaker failures must be at least 1 (got {failures})")
+        if slow_call < 0 or reset_timeout < 0:
+            raise ValueError(
+                f"Circuit breaker times can not be negative (got {slow_call}, {reset_timeout})"
+            )
+
+        self.failures = failures
+        self.slow_call = slow_call
+        self.reset_timeout = reset_timeout
+        self.buffer = buffer
+
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+
+    def wait_time(self) -> float:
+        """
+        How long until the output may be called again, in seconds; 0 if it may be now.
+
+        An open circuit whose reset timeout has passed becomes half-open.
+        """
+        if self.state is not CircuitState.OPEN:
+            return 0.0
+
+        wait = self._opened_at + self.reset_timeout - time.monotonic()
+        if wait > 0:
+            return wait
+
+        self.state = CircuitState.HALF_OPEN
+        return 0.0
+
+    def record(self, elapsed: float, raised: bool) -> None:
+        """
+        Record the outcome of a call to the output.
+
+        :param elapsed: How long the call took, in seconds.
+        :param raised: Whether the output raised an exception.
+        """
+        if not raised and not (self.slow_call and elapsed > self.slow_call):
+            self.consecutive_failures = 0
+            self.state = CircuitState.CLOSED
+            return
+
+        self.consecutive_failures += 1
+        if self.state is CircuitState.HALF_OPEN or self.consecutive_failures >= self.failures:
+            if self.state is not CircuitState.OPEN:
+                self.opened += 1
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict[str, Any]:
+        """The circuit's state and counters, for logging."""
+        return {
+            "state": self.state.value,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+        }
+
+
+class OutputLane:
+    """
+    Delivers events to a single output, in order, isolated from every other output.
+
+    Exceptions raised by the output are logged and counted; they do not stop the lane.
+    If the output falls behind, the lane's queue fills and :meth:`put` waits for space,
+    which applies backpressure to the output queue processor.
+
+    With a rate limit, each event takes a token from the bucket as it is put on the lane,
+    and waits in the lane until its token is due. Events refused by the bucket are dropped
+    and counted in :attr:`throttled`. The time each event waited for its token is recorded
+    in the `throttle` latency histogram (see :mod:`mewbot.metrics`).
+
+    If the output implements :class:`~mewbot.core.BatchOutputInterface` and the lane has a
+    `batch_size` above one, the lane takes all the waiting events (up to the batch size,
+    waiting up to `batch_wait` seconds for more) and passes them to the output's
+    `output_many` together. The outcome of the call is counted for every event in it.
+
+    With a :class:`RetryPolicy`, events the output raised an exception for are put back on
+    the lane after the policy's delay, and counted in :attr:`retried`. The lane carries on
+    with the following events in the meantime, so a retried event may be sent after events
+    which were produced after it. Events which fail on their last attempt are added to the
+    lane's dead-letter store, if it has one, and counted in :attr:`dead_lettered`.
+
+    With a :class:`CircuitBreaker`, events which are not passed to the output because its
+    circuit is open are counted in :attr:`short_circuited`, and are then retried or
+    dead-lettered in the same way as events the output failed, with a
+    :class:`CircuitOpenError` as the error.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The counters are public so that the runner (and metrics) can report on each lane.
+
+    output: OutputInterface
+
+    delivered: int  # Events the output reported as sent
+    rejected: int  # Events the output reported it could not send
+    failed: int  # Events where the output raised an exception
+    throttled: int  # Events dropped by the rate limit
+    retried: int  # Failed attempts which were retried
+    dead_lettered: int  # Events which failed on their last attempt
+    short_circuited: int  # Events not passed to the output as its circuit was open
+
+    limiter: Optional[TokenBucket]
+    retry: Optional[RetryPolicy]
+    dead_letters: Optional[DeadLetterStore]
+    breaker: Optional[CircuitBreaker]
+    batch_size: int  # The most events passed to the output at once
+    batch_wait: float  # How long to wait for more events to fill a batch, in seconds
+    done: Optional[Callable[[OutputEvent], None]]  # Called once each event is handled
+
+    # Events, when they may be sent, and how many times they have already failed.
+    _queue: asyncio.Queue[Tuple[OutputEvent, float, int]]
+    _task: Optional[asyncio.Task[None]]
+    _retries: Set[asyncio.Task[None]]  # Events waiting to be retried
+    _sending: int  # The number of events currently being sent
+    _logger: logging.Logger
+
+    # pylint: disable=too-many-arguments
+    # The optional settings are keyword only, and all default to a plain lane.
+    def __init__(
+        self,
+        output: OutputInterface,
+        maxsize: int = DEFAULT_LANE_SIZE,
+        *,
+        limiter: Optional[TokenBucket] = None,
+        batch_size: int = 1,
+        batch_wait: float = 0.0,
+        retry: Optional[RetryPolicy] = None,
+        dead_letters: Optional[DeadLetterStore] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        done: Optional[Callable[[OutputEvent], None]] = None,
+    ) -> None:
+        """
+        Create a lane for the given output.
+
+        The lane does not deliver anything until :meth:`start` is called.
+        :param output: The output to deliver events to
+        :param maxsize: The number of events which may be waiting for delivery
+        :param limiter: The rate limit for the output, if it has one
+        :param batch_size: The most events to send in one call, if the output can batch
+        :param batch_wait: How long to wait for more events to fill a batch, in seconds
+        :param retry: When to retry events the output raised an exception for, if at all
+        :param dead_letters: Where to keep events which failed on their last attempt
+        :param breaker: The circuit breaker for the output, if it has one
+        :param done: Called with each event once it has been passed to the output (whatever
+                     the outcome, after any retries), or dropped by the rate limit. Events
+                     discarded by :meth:`stop` are not passed to it.
+        """
+        self.output = output
+        self.delivered = 0
+        self.rejected = 0
+        self.failed = 0
+        self.throttled = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.short_circuited = 0
+        self.limiter = limiter
+        self.retry = retry
+        self.dead_letters = dead_letters
+        self.breaker = breaker
+        self.batch_size = batch_size if isinstance(output, BatchOutputInterface) else 1
+        self.batch_wait = batch_wait
+        self.done = done
+
+        self._queue = asyncio.Queue(maxsize)
+        self._task = None
+        self._retries = set()
+        self._sending = 0
+        self._logger = logging.getLogger(__name__ + "OutputLane")
+
+    @property
+    def pending(self) -> int:
+        """The number of events waiting to be delivered."""
+        return self._queue.qsize()
+
+    @property
+    def unsent(self) -> int:
+        """The number of events waiting to be delivered (or retried), or being delivered."""
+        return self._queue.qsize() + len(self._retries) + self._sending
+
+    @property
+    def attempted(self) -> int:
+        """The number of events which have been passed to the output."""
+        return self.delivered + self.rejected + self.failed
+
+    def start(self) -> None:
+        """Start delivering events. Must be called from within a running event loop."""
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, event: OutputEvent, failures: int = 0) -> None:
+        """
+        Queue an event for delivery, waiting if the lane is full.
+
+        If the lane has a rate limit which refuses the event, it is dropped.
+        :param event: The event to send
+        :param failures: The number of attempts to send the event which have already failed
+        """
+        now = time.monotonic()
+
+        if self.limiter is None:
+            await self._queue.put((event, now, failures))
+            return
+
+        wait = self.limiter.reserve()
+        if wait is None:
+            self.throttled += 1
+            self._logger.debug("Rate limit for %s exceeded; dropping %s", self.output, event)
+            if self.done:
+                self.done(event)
+            return
+
+        await self._queue.put((event, now + wait, failures))
+
+    async def join(self) -> None:
+        """Wait until every queued event has been passed to the output, including retries."""
+        await self._queue.join()
+        while self._retries:
+            await asyncio.gather(*self._retries, return_exceptions=True)
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        """
+        Stop the lane immediately.
+
+        Any event currently being sent is cancelled, and queued events are discarded.
+        """
+        for retry in self._retries:
+            retry.cancel()
+
+        if not self._task:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def close(self) -> None:
+        """Wait for all queued events to be delivered, then stop the lane."""
+        await self.join()
+        await self.stop()
+
+    async def _run(self) -> None:
+        while True:
+            batch = await take_batch(self._queue, self.batch_size, self.batch_wait)
+            self._sending = len(batch)
+            try:
+                if self.limiter is not None:
+                    # Tokens are due in order, so the batch waits for its last event's.
+                    await self._throttle(batch[-1][1])
+
+                events = [event for event, _, _ in batch]
+                if await self._circuit_allows():
+                    error = await self._attempt(events)
+                else:
+                    error = self._short_circuit(events)
+
+                for event, _, failures in batch:
+                    retrying = error is not None and self._retry_later(
+                        event, failures + 1, error
+                    )
+                    if self.done and not retrying:
+                        self.done(event)
+            finally:
+                self._sending = 0
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _throttle(self, send_at: float) -> None:
+        """Wait until an event's token is due, recording how long that took."""
+        start = time.monotonic()
+        if send_at > start:
+            await asyncio.sleep(send_at - start)
+        REGISTRY.observe("throttle", time.monotonic() - start, "", type(self.output).__name__)
+
+    async def _circuit_allows(self) -> bool:
+        """Whether the output may be called, first waiting for the circuit if it buffers."""
+        if self.breaker is None:
+            return True
+
+        wait = self.breaker.wait_time()
+        while wait and self.breaker.buffer:
+            await asyncio.sleep(wait)
+            wait = self.breaker.wait_time()
+        return not wait
+
+    def _short_circuit(self, events: Sequence[OutputEvent]) -> Exception:
+        """Count events which were not sent as the output's circuit is open."""
+        self.short_circuited += len(events)
+        self._logger.debug(
+            "Circuit for %s is open; not sending %d events", self.output, len(events)
+        )
+        return CircuitOpenError(f"Circuit for {self.output} is open")
+
+    def _retry_later(self, event: OutputEvent, failures: int, error: Exception) -> bool:
+        """
+        Schedule a failed event to be put back on the lane, if it has retries left.
+
+        If it has none left, it is added to the dead-letter store (if there is one).
+        :return: Whether the event will be retried.
+        """
+        if self.retry is not None and failures <= self.retry.retries:
+            self.retried += 1
+            retry = asyncio.create_task(self._requeue(event, failures))
+            self._retries.add(retry)
+            retry.add_done_callback(self._retries.discard)
+            return True
+
+        if self.dead_letters is not None:
+            self.dead_lettered += 1
+            self.dead_letters.add(
+                DeadLetter(
+                    event, "output", component_name(self.output), repr(error), failures
+                )
+            )
+        return False
+
+    async def _requeue(self, event: OutputEvent, failures: int) -> None:
+        """Wait for the retry delay, then put the event back on the lane."""
+        assert self.retry is not None
+        await asyncio.sleep(self.retry.delay(failures))
+        await self.put(event, failures)
+
+    async def _attempt(self, events: Sequence[OutputEvent]) -> Optional[Exception]:
+        """
+        Send one event, or a batch of events to a batching output, recording the outcome.
+
+        :return: The exception raised by the output, if it raised one.
+        """
+        start = time.perf_counter()
+        try:
+            if len(events) == 1:
+                sent = await self.output.output(events[0])
+            else:
+                assert isinstance(self.output, BatchOutputInterface)
+                sent = await self.output.output_many(events)
+        except Exception as error:  # pylint: disable=broad-except
+            self.failed += len(events)
+            self._logger.exception(
+                "Output %s failed while sending %s",
+                self.output,
+                events[0] if len(events) == 1 else f"{len(events)} events",
+            )
+            self._trip(start, True)
+            return error
+        finally:
+            self._record(start, events)
+
+        self._trip(start, False)
+        if sent:
+            self.delivered += len(events)
+        else:
+            self.rejected += len(events)
+        return None
+
+    def _trip(self, start: float, raised: bool) -> None:
+        """Record the outcome of a call to the output with the circuit breaker, if any."""
+        if self.breaker is None:
+            return
+
+        state = self.breaker.state
+        self.breaker.record(time.perf_counter() - start, raised)
+        if self.breaker.state is not state:
+            self._logger.warning(
+                "Circuit for %s is now %s", self.output, self.breaker.state.value
+            )
+
+    def _record(self, start: float, events: Sequence[OutputEvent]) -> None:
+        """Record the time taken to send some events, and a span for each sampled event."""
+        elapsed = time.perf_counter() - start
+        REGISTRY.observe("output", elapsed, "", type(self.output).__name__)
+
+        for event in events:
+            trace = trace_of(event)
+            if trace and trace.sampled:
+                TRACER.span(
+                    trace,
+                    "output",
+                    start,
+                    elapsed,
+                    type(event).__name__,
+                    component=type(self.output).__name__,
+                )
+
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "CircuitState",
+    "OutputLane",
+    "RetryPolicy",
+    "TokenBucket",
+    "DEFAULT_LANE_SIZE",
+]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides the type-indexed dispatch tables the BotRunner uses to route events.
+
+Behaviours and Outputs register against base event classes, and receive all subclasses
+of those classes. Rather than checking every event against every registered type, a
+dispatch table resolves each concrete event class once and caches the result, so that
+routing an event costs a single dictionary lookup.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from typing import Generic, TypeVar
+
+EventType = TypeVar("EventType")  # pylint: disable=invalid-name
+HandlerType = TypeVar("HandlerType")  # pylint: disable=invalid-name
+
+
+class TypeDispatchTable(Generic[EventType, HandlerType]):
+    """
+    Maps concrete event classes to the handlers registered for that class or its bases.
+
+    The table is built from a mapping of event type to handlers, as produced by
+    :meth:`~mewbot.bot.Bot._marshal_behaviours` and :meth:`~mewbot.bot.Bot._marshal_outputs`.
+    The registrations are copied on construction; the table does not observe later
+    changes to the mapping it was built from. Build a new table (or call :meth:`invalidate`
+    after :meth:`register`) when the set of handlers changes.
+
+    Resolution uses `issubclass`, so events are routed exactly as an `isinstance` check
+    against each registered type would route them (including ABC virtual subclasses).
+    Each handler appears at most once per event class, even if it is registered against
+    several of that class' bases.
+    """
+
+    _registrations: dict[type[EventType], tuple[HandlerType, ...]]
+    _cache: dict[type[EventType], tuple[HandlerType, ...]]
+
+    def __init__(
+        self, registrations: Mapping[type[EventType], Iterable[HandlerType]] | None = None
+    ) -> None:
+        """
+        Create a dispatch table from a mapping of event type to handlers.
+
+        :param registrations: The base event types, and the handlers for each of them.
+        """
+        self._registrations = {}
+        self._cache = {}
+
+        for event_type, handlers in (registrations or {}).items():
+            self.register(event_type, handlers)
+
+    def register(self, event_type: type[EventType], handlers: Iterable[HandlerType]) -> None:
+        """
+        Add handlers for the given event type (and all of its subclasses).
+
+        The resolution cache is cleared, as any cached class may now route differently.
+        """
+        existing = self._registrations.get(event_type, ())
+        self._registrations[event_type] = tuple(dict.fromkeys((*existing, *handlers)))
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Discard all cached resolutions; they will be rebuilt on next lookup."""
+        self._cache.clear()
+
+    def lookup(self, event_type: type[EventType]) -> tuple[HandlerType, ...]:
+        """
+        Gets the handlers which should receive an event of the given concrete class.
+
+        :param event_type: The class of the event being dispatched - i.e. `type(event)`
+        :return: The handlers, in registration order, without duplicates.
+        """
+        try:
+            return self._cache[event_type]
+        except KeyError:
+            handlers = self._cache[event_type] = self._resolve(event_type)
+            return handlers
+
+    def _resolve(self, event_type: type[EventType]) -> tuple[HandlerType, ...]:
+        handlers: dict[HandlerType, None] = {}
+
+        for registered_type, registered_handlers in self._registrations.items():
+            if issubclass(event_type, registered_type):
+                handlers.update(dict.fromkeys(registered_handlers))
+
+        return tuple(handlers)
+
+    @property
+    def registrations(self) -> Mapping[type[EventType], tuple[HandlerType, ...]]:
+        """The event types and handlers this table was built with."""
+        return dict(self._registrations)
+
+    @property
+    def handlers(self) -> set[HandlerType]:
+        """All the distinct handlers present in this table."""
+        return {handler for handlers in self._registrations.values() for handler in handlers}
+
+    def __len__(self) -> int:
+        """The number of registered base event types."""
+        return len(self._registrations)
+
+
+__all__ = ["TypeDispatchTable"]
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides a host which runs many bots in one process, sharing their connections.
+
+Running each bot with :meth:`~mewbot.bot.Bot.run` gives it its own process and event loop,
+and its own copy of every connection (a Discord client, an aiohttp session, an RSS poller).
+A :class:`BotHost` instead runs any number of bots on one event loop.
+
+IOConfigs which would make identical connections, because they have the same implementation
+and the same properties (e.g. the same Discord token, or the same list of RSS sites), are
+shared between the bots. Only the first bot's IOConfig is used; each of its inputs is run
+once, and passes every event it produces on to the input queue of each bot that uses it.
+The outputs are likewise shared, so each connection is only made once. A shared output's
+rate limit and circuit breaker (see :mod:`mewbot.delivery`) apply to all the bots sending
+to it together.
+
+Each bot keeps its own :class:`~mewbot.bot.BotRunner`, with its own queues, behaviours, and
+runner settings, so a slow bot does not hold up the others' processing.
+
+Bots run by a host are not reloaded on SIGHUP (see :attr:`~mewbot.bot.Bot.reloader`), as
+their new connections could not be shared with the other bots; restart the host instead.
+
+.. code-block:: python
+
+    host = BotHost()
+    for path in ("greeter.yaml", "dice.yaml"):
+        with open(path, "r", encoding="utf-8") as config:
+            host.load(path, config)
+    host.run()
+"""
+
+from __future__ import annotations
+
+from collections.abc import Hashable, Iterable
+from typing import Any, Dict, List, Optional, TextIO
+
+import asyncio
+import json
+import logging
+
+from mewbot.bot import Bot, BotRunner, DrainReport
+from mewbot.core import (
+    InputEvent,
+    InputInterface,
+    InputQueue,
+    IOConfigInterface,
+    OutputInterface,
+)
+from mewbot.delivery import CircuitBreaker, TokenBucket
+from mewbot.loader import configure_bot
+from mewbot.offload import BLOCKING_POOL
+from mewbot.profiler import PROFILER
+from mewbot.tracing import TRACER
+
+
+def connection_key(config: IOConfigInterface) -> Hashable:
+    """
+    Key which is equal for IOConfigs that would make identical connections.
+
+    The key is built from the IOConfig's implementation and properties (but not its uuid),
+    as serialised by :meth:`mewbot.api.v1.Component.serialise`. IOConfigs which can not be
+    serialised are never shared.
+    """
+    try:
+        block = getattr(config, "serialise")()
+    except AttributeError:
+        return id(config)
+
+    return block["implementation"], json.dumps(
+        block["properties"], sort_keys=True, default=str
+    )
+
+
+class FanOutQueue(InputQueue):
+    """
+    Input queue which passes each event on to the input queues of several bots.
+
+    Nothing is kept on this queue itself; putting an event puts it on each of the bots'
+    queues in turn, waiting for each as their overflow policy requires.
+    """
+
+    targets: List[InputQueue]
+
+    def __init__(self, targets: Iterable[InputQueue]) -> None:
+        """
+        Create a queue which passes events on to the given queues.
+
+        :param targets: The input queues of the bots to receive the events
+        """
+        super().__init__()
+        self.targets = list(targets)
+
+    async def put(self, item: InputEvent) -> None:
+        """
+        Put an event onto each of the bots' queues.
+
+        :raise asyncio.QueueFull: if any of the queues rejected the event. The event is still
+                                  put on the other queues.
+        """
+        rejected = False
+
+        for target in self.targets:
+            try:
+                await target.put(item)
+            except asyncio.QueueFull:
+                rejected = True
+
+        if rejected:
+            raise asyncio.QueueFull("Event rejected by at least one bot")
+
+    def put_nowait(self, item: InputEvent) -> None:
+        """
+        Put an event onto each of the bots' queues without waiting.
+
+        :raise asyncio.QueueFull: if any of the queues was full and did not drop an event.
+        """
+        rejected = False
+
+        for target in self.targets:
+            try:
+                target.put_nowait(item)
+            except asyncio.QueueFull:
+                rejected = True
+
+        if rejected:
+            raise asyncio.QueueFull("Event rejected by at least one bot")
+
+
+class BotHost:
+    """
+    Runs several bots on one event loop, sharing identical connections between them.
+
+    Bots should be added with :meth:`add_bot` or :meth:`load` before the host is run.
+    """
+
+    bots: List[Bot]
+    runners: List[BotRunner]
+
+    _shared: Dict[Hashable, IOConfigInterface]  # The IOConfig in use for each connection
+    _logger: logging.Logger
+    _running: bool
+
+    def __init__(self) -> None:
+        """Create a host with no bots."""
+        self.bots = []
+        self.runners = []
+
+        self._shared = {}
+        self._logger = logging.getLogger(__name__ + "BotHost")
+        self._running = False
+
+    @property
+    def connections(self) -> int:
+        """The number of distinct IOConfigs used by all the bots."""
+        return len(self._shared)
+
+    def load(self, name: str, stream: TextIO) -> Bot:
+        """
+        Load a bot from YAML (see :func:`mewbot.loader.configure_bot`), and add it.
+
+        :param name: The name of the bot
+        :param stream: YAML which defines the bot
+        :return: The bot which was added
+        """
+        bot = configure_bot(name, stream)
+        self.add_bot(bot)
+        return bot
+
+    def add_bot(self, bot: Bot) -> None:
+        """
+        Add a bot to the host.
+
+        Any of the bot's IOConfigs which would make the same connection as one already in
+        use by another bot are replaced with that bot's IOConfig.
+        :param bot: The bot to add
+        """
+        if self._running:
+            raise RuntimeError("Bots can not be added while the host is running")
+
+        for config in bot.io_configs:
+            shared = self._shared.setdefault(connection_key(config), config)
+
+            if shared is not config:
+                self._logger.info("Bot %s sharing connection %s", bot.name, shared)
+                bot.replace_io_config(config, shared)
+
+        self.bots.append(bot)
+
+    def run(self, _loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        Run all the bots until the loop is stopped (e.g. by SIGINT or SIGTERM).
+
+        The event loop, and the tracing settings, are taken from the first bot's runner
+        settings (see :class:`~mewbot.bot.RunnerConfig`). On stopping, each bot's
+        queues are drained, as :meth:`mewbot.bot.BotRunner.run` does. Unlike a bot run on
+        its own, SIGHUP does not reload the bots' configurations.
+        :param _loop:
+        :return:
+        """
+        if self._running:
+            raise RuntimeError("Host is already running")
+
+        self.runners = [bot.create_runner() for bot in self.bots]
+        if not self.runners:
+            raise RuntimeError("Host has no bots to run")
+
+        # Shared outputs are rate limited, and have their circuit broken, as one, using the
+        # settings of the first bot to send to them.
+        rate_limits: Dict[OutputInterface, Optional[TokenBucket]] = {}
+        breakers: Dict[OutputInterface, Optional[CircuitBreaker]] = {}
+        for runner in self.runners:
+            runner.rate_limits = rate_limits
+            runner.circuit_breakers = breakers
+
+        loop = _loop if _loop else self.runners[0].event_loop()
+        self._running = True
+
+        def stop(info: Optional[Any] = None) -> None:
+            self._logger.warning("Stop called: %s", info)
+            if self._running and loop.is_running():
+                loop.stop()
+            self._running = False
+
+        processors = [
+            loop.create_task(processor)
+            for runner in self.runners
+            for processor in (runner.process_input_queue(), runner.process_output_queue())
+        ]
+        for task in processors:
+            task.add_done_callback(stop)
+
+        input_tasks = self.setup_tasks(loop)
+
+        # The metrics, traces, and profiler are shared by the whole process.
+        # No reload handler is added, as reloaded connections would not be shared.
+        BotRunner.add_signal_handlers(loop, stop)
+        self.runners[0].add_profiler_handler(loop)
+        self.runners[0].add_metrics_handler(loop)
+        self.runners[0].setup_tracing()
+        self.runners[0].setup_lag_monitor(loop)
+        BLOCKING_POOL.configure(self.runners[0].config.blocking_workers)
+
+        self._logger.info(
+            "Running %d bots with %d connections", len(self.runners), self.connections
+        )
+
+        try:
+            loop.run_forever()
+        finally:
+            for task in input_tasks:
+                task.cancel()
+
+            reports = loop.run_until_complete(self.drain())
+            for bot, report in zip(self.bots, reports):
+                self._logger.info("Drained queues for %s: %s", bot.name, report)
+
+            for task in processors:
+                task.remove_done_callback(stop)
+            loop.run_until_complete(self._cancel(processors))
+            TRACER.configure(0.0, None)
+            if PROFILER.running:
+                PROFILER.toggle(loop, self.runners[0].config.profile_path)
+            if self.runners[0].lag_monitor:
+                self.runners[0].lag_monitor.stop()
+            BLOCKING_POOL.shutdown()
+
+            for runner in self.runners:
+                runner.close()
+
+    async def drain(self) -> List[DrainReport]:
+        """
+        Wait for the events already queued for each bot to be processed and sent.
+
+        Each bot waits for at most its runner's drain_timeout (see :meth:`BotRunner.drain`).
+        :return: What was handled while draining, and what remains, for each bot in turn.
+        """
+        return list(
+            await asyncio.gather(
+                *(runner.drain(runner.config.drain_timeout) for runner in self.runners)
+            )
+        )
+
+    @staticmethod
+    async def _cancel(tasks: List[asyncio.Task[None]]) -> None:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def setup_tasks(self, loop: asyncio.AbstractEventLoop) -> List[asyncio.Task[None]]:
+        """
+        Start each input once, sending its events to every bot which uses it.
+
+        :param loop:
+        :return:
+        """
+        subscribers: Dict[InputInterface, List[InputQueue]] = {}
+
+        for runner in self.runners:
+            for _input in runner.inputs:
+                subscribers.setdefault(_input, []).append(runner.input_target)
+
+        input_tasks: List[asyncio.Task[None]] = []
+
+        for _input, queues in subscribers.items():
+            _input.bind(queues[0] if len(queues) == 1 else FanOutQueue(queues))
+            self._logger.info("Starting input %s for %d bots", _input, len(queues))
+            input_tasks.append(loop.create_task(_input.run()))
+
+        return input_tasks
+
+
+__all__ = ["BotHost", "FanOutQueue", "connection_key"]
@@ -17,6 +17,7 @@ from __future__ import annotations
 
 from typing import Set, Type
 
+import asyncio
 import dataclasses
 import logging
 import time
@@ -87,7 +88,11 @@ class HTTPInputListener(SocketInput):
 
         # Get the message on the wire
         r_text = await request.text()
-        await self.queue.put(IncomingWebhookEvent(text=r_text))
+        try:
+            await self.queue.put(IncomingWebhookEvent(text=r_text))
+        except asyncio.QueueFull:
+            self._logger.warning("Input queue full; rejecting webhook")
+            return web.Response(status=429, text=f"Queue full - {time.time()}")
 
         self._logger.info(r_text)
         return web.Response(text=f"Received - {time.time()}")
@@ -14,6 +14,7 @@ from __future__ import annotations
 
 from typing import (
     Any,
+    Hashable,
     Iterable,
     List,
     Mapping,
@@ -86,6 +87,14 @@ class RSSInputEvent(InputEvent):
 
     startup: bool  # Was this feed read as part of first read for any given site?
 
+    def partition_key(self) -> Hashable:
+        """Items from the same site are processed in the order they were read."""
+        return self.site_url
+
+    def dedup_key(self) -> Hashable:
+        """Items are the same if they have the same guid on the same site."""
+        return self.site_url, self.guid
+
 
 class RSSIO(IOConfig):
     """
@@ -498,6 +507,9 @@ class RSSInput(Input):
             except IndexError:
                 # Not enough entries in the retrieved feed to exhaust startup requirements?
                 break
+            except asyncio.QueueFull:
+                self._logger.warning("Input queue full; stopping startup for %s", site_url)
+                break
 
             self.state.note_event_transmitted(site_url=site_url, site_uid=entry_internal_id)
 
@@ -524,7 +536,12 @@ class RSSInput(Input):
             if self.state.check_for_event(site_url=site_url, site_uid=entry_uid):
                 break
 
-            await self._send_entry(entry=entry, site_url=site_url, startup=False)
+            try:
+                await self._send_entry(entry=entry, site_url=site_url, startup=False)
+            except asyncio.QueueFull:
+                # The remaining entries have not been marked as sent, so will be retried.
+                self._logger.warning("Input queue full; will retry %s next poll", site_url)
+                break
             transmitted_count += 1
 
             self.state.note_event_transmitted(site_url=site_url, site_uid=entry_uid)
@@ -181,7 +181,13 @@ class SocketInput(Input):
                 writer.write(b"No queue attached, aborting.\n")
                 break
 
-            await self.queue.put(SocketInputEvent(data=data))
+            try:
+                await self.queue.put(SocketInputEvent(data=data))
+            except asyncio.QueueFull:
+                self._logger.warning("Input queue full; rejecting socket data")
+                writer.write(b"Queue full, event rejected\r\n")
+                continue
+
             writer.write(
                 b"Accepted event of "
                 + hex(len(data)).encode("utf-8")
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides an on-disk journal which keeps a bot's queued events across restarts.
+
+By default the :class:`~mewbot.bot.BotRunner`'s event queues are held in memory, and every
+event waiting on them is lost if the process dies. If the runner is given a `queue_path`,
+each event put on its input or output queue is also written to an :class:`EventJournal`
+(an SQLite database at that path), and is only removed once it has been handled: once the
+behaviours have processed an input event, or the outputs have sent an output event.
+When the runner starts, any events left in the journal are put back on their queues.
+
+Writes are grouped into transactions: changes are committed once `commit_size` of them
+are waiting, or `commit_interval` seconds after the first of them, whichever is sooner.
+An event which is put on a queue and handled within one commit interval is never written
+to disk at all. Events from the last commit interval before a crash may be lost.
+
+Events are stored with :mod:`pickle`. Events which can not be pickled are still queued,
+but are not written to the journal (and so are lost if the process dies).
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import asyncio
+import logging
+import pickle
+import sqlite3
+import time
+
+from mewbot.metrics import REGISTRY
+
+DEFAULT_COMMIT_INTERVAL = 0.05
+DEFAULT_COMMIT_SIZE = 256
+
+
+class EventJournal:
+    """
+    SQLite database holding the events on a bot's queues until they have been handled.
+
+    Each queue writes to the journal through a :class:`QueueJournal`, from :meth:`queue`.
+    The time each commit takes is recorded in the `commit` latency histogram
+    (see :mod:`mewbot.metrics`).
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The settings, the database, and the changes waiting for the next commit.
+
+    path: str
+    commit_interval: float
+    commit_size: int
+
+    _db: sqlite3.Connection
+    _next_row: int
+    _inserts: Dict[int, Tuple[str, Any]]  # Events waiting to be written, by row id
+    _deletes: List[int]  # Rows waiting to be removed
+    _timer: Optional[asyncio.TimerHandle]  # The scheduled commit, if there is one
+    _logger: logging.Logger
+
+    def __init__(
+        self,
+        path: str,
+        commit_interval: float = DEFAULT_COMMIT_INTERVAL,
+        commit_size: int = DEFAULT_COMMIT_SIZE,
+    ) -> None:
+        """
+        Open (or create) the journal.
+
+        :param path: The SQLite database to keep the events in.
+        :param commit_interval: The longest a change waits to be committed, in seconds.
+        :param commit_size: The number of waiting changes which causes an immediate commit.
+        """
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_size = commit_size
+
+        self._db = sqlite3.connect(path)
+        # WAL commits survive the process crashing without waiting for the disk on each one.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS events "
+            "(id INTEGER PRIMARY KEY, queue TEXT NOT NULL, event BLOB NOT NULL)"
+        )
+        self._db.commit()
+
+        (last,) = self._db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()
+        self._next_row = last + 1
+
+        self._inserts = {}
+        self._deletes = []
+        self._timer = None
+        self._logger = logging.getLogger(__name__ + "EventJournal")
+
+    def queue(self, name: str) -> QueueJournal:
+        """The journal for one of the bot's queues."""
+        return QueueJournal(self, name)
+
+    @property
+    def uncommitted(self) -> int:
+        """The number of changes waiting to be committed."""
+        return len(self._inserts) + len(self._deletes)
+
+    def append(self, queue: str, event: Any) -> int:
+        """
+        Add an event to the journal.
+
+        The event is only pickled when it is committed, so events which are removed before
+        then are never pickled.
+        :param queue: The name of the queue the event was put on.
+        :param event: The event.
+        :return: The event's row in the journal.
+        """
+        row = self._next_row
+        self._next_row += 1
+
+        self._inserts[row] = (queue, event)
+        if self._timer is None or len(self._inserts) >= self.commit_size:
+            self._changed()
+        return row
+
+    def remove(self, row: int) -> None:
+        """Remove an event from the journal, once it has been handled."""
+        if self._inserts.pop(row, None) is None:
+            self._deletes.append(row)
+            if self._timer is None or len(self._deletes) >= self.commit_size:
+                self._changed()
+
+    def pending(self, queue: str) -> List[Tuple[int, Any]]:
+        """
+        The events in the journal for a queue, oldest first.
+
+        Events which can no longer be unpickled (e.g. because their class has been removed)
+        are logged and discarded.
+        :return: Each event with its row.
+        """
+        self.flush()
+
+        rows = self._db.execute(
+            "SELECT id, event FROM events WHERE queue = ? ORDER BY id", (queue,)
+        ).fetchall()
+
+        events: List[Tuple[int, Any]] = []
+        for row, data in rows:
+            try:
+                events.append((row, pickle.loads(data)))
+            except Exception:  # pylint: disable=broad-except
+                self._logger.exception("Discarding journaled event %d from %s", row, queue)
+                self.remove(row)
+
+        return events
+
+    def _changed(self) -> None:
+        """
+        Commits the waiting changes, or schedules a commit for them.
+
+        This is only called when no commit is scheduled, or when enough changes may be
+        waiting for an immediate one.
+        """
+        if self.uncommitted >= self.commit_size:
+            self.flush()
+            return
+
+        if self._timer is not None:
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+
+        self._timer = loop.call_later(self.commit_interval, self.flush)
+
+    def flush(self) -> None:
+        """Commit all the waiting changes, in one transaction."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self.uncommitted:
+            return
+
+        start = time.perf_counter()
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO events (id, queue, event) VALUES (?, ?, ?)",
+                self._pickled(),
+            )
+            self._db.executemany(
+                "DELETE FROM events WHERE id = ?", ((row,) for row in self._deletes)
+            )
+        REGISTRY.observe("commit", time.perf_counter() - start, "", type(self).__name__)
+
+        self._inserts = {}
+        self._deletes = []
+
+    def _pickled(self) -> Iterator[Tuple[int, str, bytes]]:
+        """The rows to insert, skipping any events which can not be pickled."""
+        for row, (queue, event) in self._inserts.items():
+            try:
+                yield row, queue, pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError) as err:
+                self._logger.warning(
+                    "Not journaling %s, as it can not be pickled: %s", event, err
+                )
+
+    def close(self) -> None:
+        """Commit any waiting changes, and close the database."""
+        self.flush()
+        self._db.close()
+
+
+class QueueJournal:
+    """The part of an :class:`EventJournal` which holds the events for one queue."""
+
+    journal: EventJournal
+    name: str
+
+    def __init__(self, journal: EventJournal, name: str) -> None:
+        """
+        Create the journal for a queue.
+
+        :param journal: The journal to write the events to.
+        :param name: The name of the queue, which its events are stored under.
+        """
+        self.journal = journal
+        self.name = name
+
+    def append(self, event: Any) -> int:
+        """Add an event to the journal, returning its row."""
+        return self.journal.append(self.name, event)
+
+    def remove(self, row: int) -> None:
+        """Remove an event from the journal, once it has been handled."""
+        self.journal.remove(row)
+
+    def pending(self) -> List[Tuple[int, Any]]:
+        """The events in the journal for this queue, oldest first, with their rows."""
+        return self.journal.pending(self.name)
+
+
+__all__ = [
+    "EventJournal",
+    "QueueJournal",
+    "DEFAULT_COMMIT_INTERVAL",
+    "DEFAULT_COMMIT_SIZE",
+]
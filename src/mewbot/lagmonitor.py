@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides a monitor which measures how far the event loop is lagging, and what blocked it.
+
+Every input, behaviour, and output of a bot shares one event loop, so a component which
+does synchronous work (running a subprocess, parsing a large feed) stalls all of them.
+The :class:`LoopLagMonitor` finds these stalls in two ways:
+
+ - a heartbeat task sleeps for `interval` seconds at a time, and records how much later
+   than that it woke up. This is the loop's lag; its percentiles are reported by
+   :meth:`LoopLagMonitor.stats`, which a running bot logs with its metrics.
+ - a watchdog thread checks that the heartbeat is on time. If it is more than `threshold`
+   seconds late, the loop is blocked, and the watchdog logs a warning with the stack the
+   loop is stuck in, and the behaviours and components in that stack (see :func:`blame`).
+
+The watchdog reads the stack while the stall is still happening, so the component which
+caused it is named even if it never returns. Nothing is added to the handling of each
+event; the cost is the heartbeat and watchdog waking up once an interval.
+"""
+
+from __future__ import annotations
+
+from types import FrameType
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncio
+import inspect
+import logging
+import sys
+import threading
+import time
+
+from mewbot.core import (
+    ActionInterface,
+    BehaviourInterface,
+    ConditionInterface,
+    InputInterface,
+    OutputInterface,
+    TriggerInterface,
+)
+from mewbot.metrics import Histogram
+from mewbot.profiler import running_stack
+
+# What each kind of component is called, innermost first, for the components of a
+# behaviour are called from inside it.
+COMPONENT_KINDS: Tuple[Tuple[type, str], ...] = (
+    (TriggerInterface, "trigger"),
+    (ConditionInterface, "condition"),
+    (ActionInterface, "action"),
+    (BehaviourInterface, "behaviour"),
+    (OutputInterface, "output"),
+    (InputInterface, "input"),
+)
+
+_MISSING = object()
+
+
+def _members(interface: type) -> Tuple[str, ...]:
+    """The public methods of an interface, including those of the interfaces it extends."""
+    return tuple(
+        name
+        for base in interface.__mro__
+        if base is not object
+        for name in vars(base)
+        if not name.startswith("_")
+    )
+
+
+_KIND_MEMBERS = tuple((_members(interface), kind) for interface, kind in COMPONENT_KINDS)
+
+
+def _describe(component: Any) -> Optional[str]:
+    """
+    The kind and class name of a component; None if the object is not a component.
+
+    The object belongs to the loop thread, so its attributes are only looked up statically;
+    isinstance checks against the interfaces could run its properties, or its __getattr__.
+    """
+    for members, kind in _KIND_MEMBERS:
+        if all(
+            inspect.getattr_static(component, name, _MISSING) is not _MISSING
+            for name in members
+        ):
+            return f"{kind} {type(component).__qualname__}"
+    return None
+
+
+def blame(frame: FrameType) -> List[str]:
+    """
+    The components with a method in a stack, innermost first.
+
+    Each is given as its kind and class name, e.g. `action DiceRollAction`.
+    :param frame: The innermost frame of the stack.
+    """
+    components: List[str] = []
+    current: Optional[FrameType] = frame
+    while current is not None:
+        try:
+            name = _describe(current.f_locals.get("self"))
+        except Exception:  # pylint: disable=broad-except
+            # The frame is still running on the loop thread, so can be in any state.
+            name = None
+
+        if name and name not in components:
+            components.append(name)
+        current = current.f_back
+    return components
+
+
+class LoopLagMonitor:
+    """
+    Measures the lag of an event loop with a heartbeat, and names what blocks it.
+
+    The number of times the loop has been blocked for longer than the threshold is counted
+    in :attr:`stalls`, and the lag of each heartbeat recorded in :attr:`lag`.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The settings and results are public; the rest is the state of the heartbeat.
+
+    interval: float  # Seconds between heartbeats
+    threshold: float  # How late a heartbeat can be before the loop is blocked, in seconds
+    lag: Histogram
+    stalls: int
+    beats: int
+
+    _due: float  # When the next heartbeat should happen, from time.monotonic
+    _task: Optional[asyncio.Task[None]]
+    _thread: Optional[threading.Thread]
+    _stopping: threading.Event
+    _logger: logging.Logger
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1) -> None:
+        """
+        Create a monitor; it does not run until started.
+
+        :param interval: How often the heartbeat checks the loop, in seconds.
+        :param threshold: How long the loop can be blocked before a warning is logged.
+        """
+        if interval <= 0 or threshold <= 0:
+            raise ValueError(
+                f"Lag monitor times must be positive (got {interval}, {threshold})"
+            )
+
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = Histogram()
+        self.stalls = 0
+        self.beats = 0
+
+        self._due = 0.0
+        self._task = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._logger = logging.getLogger(__name__ + "LoopLagMonitor")
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Start the heartbeat and the watchdog.
+
+        Must be called from the thread which runs the loop.
+        """
+        if self._task is not None:
+            return
+
+        self._due = time.monotonic() + self.interval
+        self._task = loop.create_task(self._heartbeat())
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._watch,
+            args=(threading.get_ident(),),
+            name="mewbot-lag-monitor",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the heartbeat and the watchdog."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """The lag percentiles and the number of stalls, for logging."""
+        return {
+            "p50": self.lag.percentile(0.5),
+            "p99": self.lag.percentile(0.99),
+            "max": self.lag.maximum,
+            "stalls": self.stalls,
+        }
+
+    async def _heartbeat(self) -> None:
+        """Sleep for an interval at a time, recording how late each wake up was."""
+        while True:
+            self._due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag.observe(max(0.0, time.monotonic() - self._due))
+            self.beats += 1
+
+    def _watch(self, thread_id: int) -> None:
+        """Check the heartbeat is on time, and report on the loop when it is not."""
+        reported = -1
+        while not self._stopping.wait(min(self.interval, self.threshold) / 2):
+            late = time.monotonic() - self._due
+            if late < self.threshold or reported == self.beats:
+                continue
+
+            # Each stall is reported once; the next heartbeat ends it.
+            reported = self.beats
+            self.stalls += 1
+
+            # pylint: disable=protected-access
+            # This is the documented way of getting another thread's stack.
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+
+            self._logger.warning(
+                "Event loop blocked for %.3fs in %s: %s",
+                late,
+                ", ".join(blame(frame)) or "no known component",
+                ";".join(running_stack(frame)),
+            )
+            del frame
+
+
+__all__ = ["LoopLagMonitor", "blame"]
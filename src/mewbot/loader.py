@@ -12,12 +12,14 @@ from __future__ import annotations
 
 from typing import Any, TextIO, Type
 
+import functools
 import importlib
+import os
 import sys
 
 import yaml
 
-from mewbot.bot import Bot
+from mewbot.bot import Bot, BotRunner, ReloadReport, RunnerConfig
 from mewbot.core import (
     ActionInterface,
     BehaviourConfigBlock,
@@ -47,13 +49,21 @@ def configure_bot(name: str, stream: TextIO) -> Bot:
     """
     Loads a series of components from a YAML file to crate a bot.
 
-    The YAML is expected to be a series of IOConfig, DataSource, and Behaviour blocks.
+    The YAML is expected to be a series of IOConfig, DataSource, and Behaviour blocks,
+    optionally with a Runner block setting how the bot's events are processed.
+
+    If the stream is a file, the bot's reloader is set to re-read that file
+    (see :func:`reload_bot`), which the running bot does when the process gets SIGHUP.
 
     :param name: The name of the bot
     :param stream: YAML which defined the bot.
     """
 
     bot = Bot(name)
+
+    path = getattr(stream, "name", None)
+    if isinstance(path, str) and os.path.isfile(path):
+        bot.reloader = functools.partial(reload_bot_file, bot, path)
     number = 0
 
     for document in yaml.load_all(stream, Loader=yaml.CSafeLoader):
@@ -74,10 +84,57 @@ def configure_bot(name: str, stream: TextIO) -> Bot:
                 component, IOConfigInterface
             )
             bot.add_io_config(component)
+        if document["kind"] == ComponentKind.Runner:
+            bot.configure_runner(*load_runner(document))
 
     return bot
 
 
+def reload_bot(bot: Bot, stream: TextIO) -> ReloadReport:
+    """
+    Re-reads a bot's YAML, and updates the bot with any components which have changed.
+
+    Components are matched by their uuid, and only those whose configuration has changed are
+    replaced (see :meth:`~mewbot.bot.Bot.update`). Runner blocks are ignored; the runner's
+    settings can only be changed by restarting the bot.
+
+    :param bot: The bot to update
+    :param stream: YAML which defines the bot.
+    :return: Which components were added, replaced, removed, and kept.
+    """
+
+    loaded = configure_bot(bot.name, stream)
+    return bot.update(loaded.behaviours, loaded.io_configs)
+
+
+def reload_bot_file(bot: Bot, path: str) -> ReloadReport:
+    """Re-reads a bot's YAML from a file; see :func:`reload_bot`."""
+
+    with open(path, "r", encoding="utf-8") as stream:
+        return reload_bot(bot, stream)
+
+
+def load_runner(config: ConfigBlock) -> tuple[RunnerConfig, Type[BotRunner]]:
+    """
+    Reads the settings and implementation class for a BotRunner from a configuration block.
+
+    The properties of the block are the fields of :class:`~mewbot.bot.RunnerConfig`.
+    """
+
+    if not _REQUIRED_KEYS.issubset(config.keys()):
+        raise ValueError(
+            f"Config missing some keys: {_REQUIRED_KEYS.difference(config.keys())}"
+        )
+
+    runner_class = get_implementation(config["implementation"])
+
+    if not (isinstance(runner_class, type) and issubclass(runner_class, BotRunner)):
+        raise TypeError(f"Class {runner_class} is not a BotRunner, requested by {config}")
+
+    # As with components, unknown properties will cause this to TypeError.
+    return RunnerConfig(**(config["properties"] or {})), runner_class
+
+
 def load_behaviour(config: BehaviourConfigBlock) -> BehaviourInterface:
     """Creates a behaviour and its components based on a configuration block."""
 
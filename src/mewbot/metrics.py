@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides latency histograms for the stages of the event pipeline.
+
+Each stage of handling an event records how long it took into a :class:`Histogram`,
+labelled with the stage, the name of the behaviour (where there is one), and the class of
+the component doing the work. The stages recorded are:
+
+ - `queue`: time an event spent waiting on an event queue
+ - `trigger`: a trigger checking whether it matches an event
+ - `condition`: a condition checking whether it allows an event
+ - `action`: an action processing an event (excluding time spent by whoever consumes the
+   action's outputs)
+ - `output`: an output sending an event
+ - `throttle`: an output event waiting for its output's rate limit
+
+The histograms are kept in the process-wide :data:`REGISTRY`, which can be queried with
+:meth:`MetricsRegistry.snapshot` or written out as JSON with :meth:`MetricsRegistry.dump`.
+A running bot also dumps them to its log when it receives SIGUSR2.
+
+Recording costs a couple of clock reads and a dictionary lookup per stage. It can be
+turned off by setting `REGISTRY.enabled = False`.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, TextIO, Tuple
+
+import json
+
+# Buckets are powers of two in microseconds: bucket i holds values below 2**i us, so the
+# last regular bucket is for values up to ~134s. Anything larger goes in the final bucket.
+BUCKET_COUNT = 28
+
+HistogramKey = Tuple[str, str, str]  # stage, behaviour, component
+
+
+class Histogram:
+    """
+    A histogram of durations, with exponentially sized buckets.
+
+    Percentiles are estimated as the upper bound of the bucket they fall in, so are accurate
+    to within a factor of two.
+    """
+
+    count: int
+    total: float  # The sum of all the observed durations, in seconds
+    minimum: float
+    maximum: float
+    buckets: List[int]
+
+    def __init__(self) -> None:
+        """Create an empty histogram."""
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+        self.buckets = [0] * (BUCKET_COUNT + 1)
+
+    def observe(self, seconds: float) -> None:
+        """Record a duration, in seconds."""
+        self.count += 1
+        self.total += seconds
+        self.minimum = min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+        self.buckets[min(int(seconds * 1_000_000).bit_length(), BUCKET_COUNT)] += 1
+
+    @staticmethod
+    def bucket_bound(index: int) -> float:
+        """The upper bound of a bucket, in seconds."""
+        return float("inf") if index >= BUCKET_COUNT else (2**index) / 1_000_000
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Estimate a percentile of the durations, in seconds.
+
+        :param fraction: The percentile wanted, between 0 and 1 (e.g. 0.99)
+        :return: The upper bound of the bucket the percentile falls in; 0 if empty.
+        """
+        if not self.count:
+            return 0.0
+
+        target = fraction * self.count
+        seen = 0
+
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min(self.bucket_bound(index), self.maximum)
+
+        return self.maximum
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Summarise the histogram, with durations in seconds, for dumping."""
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.minimum if self.count else 0.0,
+            "max": self.maximum,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": {
+                str(self.bucket_bound(index)): count
+                for index, count in enumerate(self.buckets)
+                if count
+            },
+        }
+
+
+class MetricsRegistry:
+    """
+    The collection of latency histograms, indexed by stage, behaviour, and component.
+    """
+
+    enabled: bool
+
+    _histograms: Dict[HistogramKey, Histogram]
+
+    def __init__(self) -> None:
+        """Create an empty, enabled, registry."""
+        self.enabled = True
+        self._histograms = {}
+
+    def histogram(self, stage: str, behaviour: str = "", component: str = "") -> Histogram:
+        """Get the histogram for a stage, creating it if needed."""
+        key = (stage, behaviour, component)
+
+        try:
+            return self._histograms[key]
+        except KeyError:
+            histogram = self._histograms[key] = Histogram()
+            return histogram
+
+    def observe(
+        self, stage: str, seconds: float, behaviour: str = "", component: str = ""
+    ) -> None:
+        """Record a duration for a stage, if the registry is enabled."""
+        if self.enabled:
+            self.histogram(stage, behaviour, component).observe(seconds)
+
+    def histograms(self) -> Dict[HistogramKey, Histogram]:
+        """All the histograms, by (stage, behaviour, component)."""
+        return dict(self._histograms)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Summaries of all the histograms, with their labels, slowest total time first."""
+        return [
+            {"stage": stage, "behaviour": behaviour, "component": component, **h.as_dict()}
+            for (stage, behaviour, component), h in sorted(
+                self._histograms.items(), key=lambda item: -item[1].total
+            )
+        ]
+
+    def dump(self, stream: TextIO) -> None:
+        """Write the snapshot as JSON to the stream."""
+        json.dump(self.snapshot(), stream, indent=2)
+
+    def reset(self) -> None:
+        """Discard all the recorded durations."""
+        self._histograms = {}
+
+
+REGISTRY = MetricsRegistry()
+
+
+__all__ = ["Histogram", "MetricsRegistry", "REGISTRY", "BUCKET_COUNT"]
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides a BotRunner which runs the bot's behaviours in a pool of worker processes.
+
+The standard :class:`~mewbot.bot.BotRunner` processes every event on one event loop, so
+CPU heavy behaviours are limited to a single core. The :class:`MultiProcessBotRunner`
+keeps the inputs, queues, and outputs in the main process, but starts a number of worker
+processes which each load their own copy of the behaviours (using :mod:`mewbot.loader`).
+Input events are pickled and sent to a worker, and the output events the behaviours
+produce are sent back to the main process to be delivered.
+
+Events are assigned to a worker by their :meth:`~mewbot.core.InputEvent.partition_key`,
+so all events with the same key are processed by the same copy of the behaviours.
+Events without a key go to whichever worker has the least work outstanding.
+When the runner is reloaded (see :meth:`~mewbot.bot.BotRunner.reload`), a new set of
+workers is started with the new behaviours, and the old workers stop once they have
+finished the events they were sent. If a worker process exits, a new one is started in its
+place, and the events it was processing are counted as failures of their behaviours.
+
+To use it, select it in the bot's Runner block:
+
+.. code-block:: yaml
+
+    kind: Runner
+    implementation: mewbot.multiprocess.MultiProcessBotRunner
+    uuid: aaaaaaaa-aaaa-4aaa-0000-aaaaaaaaaa00
+    properties:
+      processes: 4
+      input_workers: 16
+
+Each input worker waits for one event at a time, so `input_workers` should be at least the
+number of processes to keep them all busy.
+
+Behaviours must be serialisable (see :meth:`mewbot.api.v1.Behaviour.serialise`), and the
+events they consume and produce must be picklable. Events which can not be pickled are
+processed in the main process instead. Each worker has its own copy of the behaviours, so
+state in a behaviour is only shared between events with the same partition key.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Hashable
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Set, Tuple, Type
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import traceback
+
+from mewbot.bot import BotRunner, RunnerConfig
+from mewbot.core import (
+    BehaviourConfigBlock,
+    BehaviourInterface,
+    InputEvent,
+    InputInterface,
+    OutputEvent,
+    OutputInterface,
+)
+from mewbot.dispatch import TypeDispatchTable
+from mewbot.loader import load_behaviour
+
+if TYPE_CHECKING:
+    # Messages between the processes: a token and a pickled event, or None to stop.
+    MessageQueue = multiprocessing.Queue[Optional[Tuple[int, bytes]]]
+else:
+    MessageQueue = multiprocessing.Queue  # pylint: disable=invalid-name
+
+# A behaviour which failed in a worker process: its index in the worker's behaviours, the
+# exception it raised, and that exception's formatted traceback.
+Failure = Tuple[int, Exception, str]
+
+# What a worker process sends back for an event: the outputs, and the behaviours which failed.
+Reply = Tuple[List[OutputEvent], List[Failure]]
+
+# How long a worker process is given to finish its events when stopping, in seconds.
+STOP_TIMEOUT = 5.0
+
+# How often the result reader checks that its worker process is still alive, in seconds.
+_LIVENESS_INTERVAL = 1.0
+
+# Used by the worker processes, to log outputs which can not be sent to the main process.
+_WORKER_LOGGER = logging.getLogger(__name__ + "Worker")
+
+
+class MultiProcessBotRunner(BotRunner):
+    """
+    BotRunner which shards the bot's behaviours across several worker processes.
+
+    The number of processes is set by :attr:`~mewbot.bot.RunnerConfig.processes`.
+    """
+
+    _workers: List[WorkerProcess]
+    _retiring: Set[asyncio.Future[Any]]  # Stopping the workers which have been replaced
+
+    def __init__(
+        self,
+        behaviours: Dict[Type[InputEvent], Set[BehaviourInterface]],
+        inputs: Set[InputInterface],
+        outputs: Dict[Type[OutputEvent], Set[OutputInterface]],
+        config: Optional[RunnerConfig] = None,
+    ) -> None:
+        """
+        Prepares the runner. The worker processes are started with the input processor.
+
+        :param behaviours: The behaviours, which are copied into each worker process
+        :param inputs: The inputs, which run in the main process
+        :param outputs: The outputs, which run in the main process
+        :param config: Settings for the runner
+        """
+        super().__init__(behaviours, inputs, outputs, config)
+        self._workers = []
+        self._retiring = set()
+
+        # The behaviours run in the worker processes, so are not scheduled in this one.
+        if self._schedule_behaviours:
+            self.logger.warning("behaviour_concurrency is not used with worker processes")
+            self._schedule_behaviours = False
+
+    async def process_input_queue(self) -> None:
+        """
+        Starts the worker processes, then passes input events to them until cancelled.
+
+        The worker processes are stopped when this is cancelled; use :meth:`drain` first
+        to allow them to finish the events which are queued.
+        :return:
+        """
+        self._workers = self._start_workers()
+
+        try:
+            await super().process_input_queue()
+        finally:
+            await asyncio.gather(
+                *(worker.stop() for worker in self._workers), *self._retiring
+            )
+            self._workers = []
+
+    def reload(
+        self,
+        behaviours: Dict[Type[InputEvent], Set[BehaviourInterface]],
+        inputs: Set[InputInterface],
+        outputs: Dict[Type[OutputEvent], Set[OutputInterface]],
+    ) -> None:
+        """
+        Swap in a new set of components, restarting the worker processes.
+
+        If the workers are running, a new set is started with the new behaviours, and is
+        sent every event from then on. The old workers finish the events they have already
+        been sent, and then stop.
+        :param behaviours: The behaviours to use, indexed by the input events they consume
+        :param inputs: The inputs to use
+        :param outputs: The outputs to use, indexed by the output events they consume
+        """
+        super().reload(behaviours, inputs, outputs)
+
+        if not self._workers:
+            return
+
+        old, self._workers = self._workers, self._start_workers()
+        self._retire(old)
+
+    def _start_workers(self) -> List[WorkerProcess]:
+        """Starts the configured number of worker processes, with the current behaviours."""
+        count = self.config.processes or os.cpu_count() or 1
+        behaviours = list(self._behaviour_table.handlers)
+
+        workers = [WorkerProcess(behaviours) for _ in range(count)]
+        for worker in workers:
+            worker.start()
+        self.logger.info("Started %d behaviour worker processes", count)
+
+        return workers
+
+    def _replace_worker(self, worker: WorkerProcess) -> None:
+        """Starts a new worker process in place of one which has exited."""
+        if worker not in self._workers:
+            return  # Already replaced, or retired by a reload
+
+        replacement = WorkerProcess(list(self._behaviour_table.handlers))
+        replacement.start()
+
+        self._workers[self._workers.index(worker)] = replacement
+        self._retire([worker])
+        self.logger.warning("Started a behaviour worker process to replace one which exited")
+
+    def _retire(self, workers: List[WorkerProcess]) -> None:
+        """Stops worker processes which are no longer sent events, in the background."""
+        retiring = asyncio.ensure_future(asyncio.gather(*(w.stop() for w in workers)))
+        self._retiring.add(retiring)
+        retiring.add_done_callback(self._retiring.discard)
+
+    async def _process_input_event(self, event: InputEvent) -> bool:
+        """
+        Sends the event to a worker process, and queues the outputs it produces.
+
+        Events which can not be pickled are processed in this process instead.
+        Behaviours which raise an exception in the worker process are handled as if they had
+        failed in this one (see :meth:`~mewbot.bot.BotRunner._behaviour_failed`).
+        If the worker process exits before finishing the event, it is replaced, and the
+        event is counted as a failure of each of its behaviours. The event is then not
+        acknowledged, so stays in the journal (if there is one) for the next run.
+        :return: Whether the event was processed.
+        """
+        if not self._behaviour_table.lookup(type(event)):
+            return True
+
+        try:
+            message = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as err:
+            self.logger.warning("Processing %s in the main process: %s", event, err)
+            return await super()._process_input_event(event)
+
+        worker = self._worker_for(event)
+        try:
+            outputs, failures = await worker.process(message)
+        except ChildProcessError as error:
+            self._replace_worker(worker)
+            for behaviour in self._behaviour_table.lookup(type(event)):
+                self._behaviour_failed(behaviour, [event], error)
+            return False
+
+        for output in outputs:
+            await self._queue_output(output, worker)
+
+        self._worker_failures(worker, event, failures)
+        return True
+
+    def _worker_failures(
+        self, worker: WorkerProcess, event: InputEvent, failures: List[Failure]
+    ) -> None:
+        """Handles the behaviours which failed in a worker process, as if they failed here."""
+        for index, exception, trace in failures:
+            exception.__cause__ = RemoteTraceback(trace)
+            self._behaviour_failed(worker.behaviours[index], [event], exception)
+
+    async def _process_input_batch(self, events: List[InputEvent]) -> List[InputEvent]:
+        """
+        Sends the events in a batch to the worker processes.
+
+        Events with the same partition key are sent one after another, in order; the rest
+        are sent concurrently.
+        :return: The events which were processed.
+        """
+        sequences: Dict[Hashable, List[InputEvent]] = {}
+        processed: List[InputEvent] = []
+
+        for event in events:
+            key = event.partition_key()
+            sequences.setdefault(id(event) if key is None else key, []).append(event)
+
+        async def send(sequence: List[InputEvent]) -> None:
+            for event in sequence:
+                if await self._process_input_event(event):
+                    processed.append(event)
+
+        await asyncio.gather(*(send(sequence) for sequence in sequences.values()))
+        return processed
+
+    def _worker_for(self, event: InputEvent) -> WorkerProcess:
+        """Selects the worker process for an event, based on its partition key."""
+        key = event.partition_key()
+
+        if key is None:
+            return min(self._workers, key=lambda worker: worker.in_flight)
+
+        return self._workers[hash(key) % len(self._workers)]
+
+
+def serialise_behaviour(behaviour: BehaviourInterface) -> BehaviourConfigBlock:
+    """
+    Gets the loader config for a behaviour, so that it can be loaded in another process.
+
+    :raise TypeError: If the behaviour can not be serialised
+    """
+    serialise = getattr(behaviour, "serialise", None)
+
+    if not callable(serialise):
+        raise TypeError(f"Behaviour {behaviour} can not be serialised for a worker process")
+
+    config: BehaviourConfigBlock = serialise()
+    return config
+
+
+class RemoteTraceback(Exception):
+    """
+    The traceback of an exception raised in a worker process.
+
+    Tracebacks are lost when exceptions are pickled, so this is set as the cause of the
+    exceptions which are sent back to the main process, for them to be logged with.
+    """
+
+    def __str__(self) -> str:
+        """The formatted traceback."""
+        return str(self.args[0])
+
+
+class WorkerProcess:
+    """
+    A worker process with its own copy of the behaviours, and the pipes to talk to it.
+
+    Events are sent to the process as pickled messages, each with a token. When the
+    behaviours have finished with an event, the process sends back the token with the
+    pickled output events and failures (see :data:`Reply`), which resolves the future for
+    that token.
+    A thread in the main process waits for those results, so the event loop never blocks
+    on the process.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The process, its queues, and the thread reading them are all needed to manage it.
+
+    behaviours: List[BehaviourInterface]  # The behaviours the process has copies of
+    in_flight: int  # Events sent to the process which it has not finished with
+
+    _process: multiprocessing.process.BaseProcess
+    _inbox: MessageQueue
+    _outbox: MessageQueue
+    _pending: Dict[int, asyncio.Future[Reply]]
+    _tokens: Iterator[int]
+    _loop: Optional[asyncio.AbstractEventLoop]
+    _reader: Optional[threading.Thread]
+
+    def __init__(self, behaviours: List[BehaviourInterface]) -> None:
+        """
+        Prepares a worker process which will load copies of the given behaviours.
+
+        :param behaviours: The behaviours, which must be serialisable (see serialise_behaviour)
+        """
+        configs = [serialise_behaviour(behaviour) for behaviour in behaviours]
+
+        # Processes are spawned rather than forked, as forking a running event loop (and
+        # the threads of any inputs) is not safe.
+        context = multiprocessing.get_context("spawn")
+
+        self._inbox = context.Queue()
+        self._outbox = context.Queue()
+        self._process = context.Process(
+            target=run_worker, args=(configs, self._inbox, self._outbox), daemon=True
+        )
+
+        self.behaviours = behaviours
+        self.in_flight = 0
+        self._pending = {}
+        self._tokens = itertools.count()
+        self._loop = None
+        self._reader = None
+
+    def start(self) -> None:
+        """Starts the process. Must be called from within a running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._process.start()
+
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    async def process(self, message: bytes) -> Reply:
+        """
+        Has the process run the behaviours on a pickled input event.
+
+        :param message: The pickled input event
+        :return: The output events the behaviours produced, and the behaviours which failed
+        :raise ChildProcessError: If the process exits before finishing the event
+        """
+        if not self._loop or not self._process.is_alive():
+            raise ChildProcessError("Worker process is not running")
+
+        token = next(self._tokens)
+        future: asyncio.Future[Reply] = self._loop.create_future()
+        self._pending[token] = future
+
+        self.in_flight += 1
+        try:
+            self._inbox.put((token, message))
+            return await future
+        finally:
+            self.in_flight -= 1
+            self._pending.pop(token, None)
+
+    async def stop(self) -> None:
+        """
+        Stops the process once it has finished the events it has been sent.
+
+        If it has not exited after :data:`STOP_TIMEOUT` seconds, it is terminated.
+        """
+        if not self._loop:
+            return
+
+        if self._process.is_alive():
+            self._inbox.put(None)
+            await self._loop.run_in_executor(None, self._process.join, STOP_TIMEOUT)
+
+        if self._process.is_alive():
+            self._process.terminate()
+            await self._loop.run_in_executor(None, self._process.join)
+
+        if self._reader:
+            await self._loop.run_in_executor(None, self._reader.join)
+
+        self._inbox.close()
+        self._outbox.close()
+        self._loop = None
+
+    def _read_results(self) -> None:
+        """Passes results from the process to the event loop, until the process stops."""
+        assert self._loop
+
+        while True:
+            try:
+                result = self._outbox.get(timeout=_LIVENESS_INTERVAL)
+            except queue.Empty:
+                if self._process.is_alive():
+                    continue
+                result = None
+
+            if result is None:
+                break
+
+            self._loop.call_soon_threadsafe(self._resolve, *result)
+
+        self._loop.call_soon_threadsafe(self._fail_pending)
+
+    def _resolve(self, token: int, message: bytes) -> None:
+        future = self._pending.get(token)
+
+        if future and not future.done():
+            future.set_result(pickle.loads(message))
+
+    def _fail_pending(self) -> None:
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ChildProcessError("Worker process exited"))
+
+
+def run_worker(
+    configs: List[BehaviourConfigBlock],
+    inbox: MessageQueue,
+    outbox: MessageQueue,
+) -> None:
+    """
+    Entry point of a worker process.
+
+    Loads the behaviours, then processes events from the inbox until it receives None.
+    """
+    behaviours = [load_behaviour(config) for config in configs]
+
+    asyncio.run(_worker_loop(behaviours, inbox, outbox))
+    outbox.put(None)
+
+
+async def _worker_loop(
+    behaviours: List[BehaviourInterface],
+    inbox: MessageQueue,
+    outbox: MessageQueue,
+) -> None:
+    """Processes each event from the inbox as a task, until the inbox gives None."""
+    loop = asyncio.get_running_loop()
+
+    table: TypeDispatchTable[InputEvent, BehaviourInterface] = TypeDispatchTable()
+    for behaviour in behaviours:
+        for event_type in behaviour.consumes_inputs():
+            table.register(event_type, [behaviour])
+
+    indexes = {behaviour: index for index, behaviour in enumerate(behaviours)}
+    tasks: Set[asyncio.Task[None]] = set()
+
+    while (item := await loop.run_in_executor(None, inbox.get)) is not None:
+        task = asyncio.create_task(_process_message(table, indexes, outbox, *item))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def _process_message(
+    table: TypeDispatchTable[InputEvent, BehaviourInterface],
+    indexes: Dict[BehaviourInterface, int],
+    outbox: MessageQueue,
+    token: int,
+    message: bytes,
+) -> None:
+    """Decodes an event, passes it to its behaviours, and replies with their outputs."""
+    event: InputEvent = pickle.loads(message)
+    behaviours = table.lookup(type(event))
+    results = await asyncio.gather(
+        *(_collect_outputs(behaviour, event) for behaviour in behaviours)
+    )
+
+    outputs = [output for result, _ in results for output in result]
+    failures = [
+        (indexes[behaviour], _picklable(error), "".join(traceback.format_exception(error)))
+        for behaviour, (_, error) in zip(behaviours, results)
+        if error is not None
+    ]
+    outbox.put((token, _encode_reply(event, (outputs, failures))))
+
+
+async def _collect_outputs(
+    behaviour: BehaviourInterface, event: InputEvent
+) -> Tuple[List[OutputEvent], Optional[Exception]]:
+    """The outputs of a behaviour for an event, and the exception it raised if it failed."""
+    outputs: List[OutputEvent] = []
+    try:
+        async for output in behaviour.process(event):
+            outputs.append(output)
+    except Exception as error:  # pylint: disable=broad-except
+        return outputs, error
+    return outputs, None
+
+
+def _picklable(error: Exception) -> Exception:
+    """The exception, or a RuntimeError with its repr if it can not be sent back."""
+    try:
+        pickle.loads(pickle.dumps(error, pickle.HIGHEST_PROTOCOL))
+    except Exception:  # pylint: disable=broad-except
+        return RuntimeError(repr(error))
+    return error
+
+
+def _encode_reply(event: InputEvent, reply: Reply) -> bytes:
+    """Pickles the reply for an event; without the outputs if they can not be pickled."""
+    try:
+        return pickle.dumps(reply, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        _WORKER_LOGGER.exception("Unable to send outputs for %s to the main process", event)
+        return pickle.dumps(([], reply[1]), pickle.HIGHEST_PROTOCOL)
+
+
+__all__ = [
+    "MultiProcessBotRunner",
+    "RemoteTraceback",
+    "WorkerProcess",
+    "serialise_behaviour",
+    "STOP_TIMEOUT",
+]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides the thread pool which components that block are run on.
+
+A component which does blocking work (calling a slow library, running a subprocess) stalls
+the event loop, and so every input and output of the bot. Components which declare that
+they block (see :func:`mewbot.api.v1.blocking`) are instead run on the process-wide
+:data:`BLOCKING_POOL` by their behaviour, which waits for the result without blocking the
+loop.
+
+The pool's threads are started when first needed. A running bot sets the pool's size from
+`blocking_workers` in its :class:`~mewbot.bot.RunnerConfig`, and shuts it down when it stops.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Optional, TypeVar
+
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+Result = TypeVar("Result")
+
+
+class BlockingPool:
+    """
+    A thread pool which runs blocking calls for the event loop.
+
+    The context of the caller (including the current trace; see :mod:`mewbot.tracing`) is
+    copied to the thread for each call. The number of calls made is counted in :attr:`calls`.
+    """
+
+    workers: int  # The most calls run at once; 0 uses the ThreadPoolExecutor default
+    calls: int
+    _executor: Optional[ThreadPoolExecutor]
+
+    def __init__(self, workers: int = 0) -> None:
+        """
+        Create a pool; its threads are started when first needed.
+
+        :param workers: The number of threads; 0 for the ThreadPoolExecutor default.
+        """
+        self.workers = workers
+        self.calls = 0
+        self._executor = None
+
+    def configure(self, workers: int) -> None:
+        """
+        Change the number of threads, shutting down the current threads if it changes.
+
+        Calls already running finish on the old threads.
+        """
+        if workers < 0:
+            raise ValueError(f"Blocking pool workers can not be negative (got {workers})")
+
+        if workers != self.workers:
+            self.shutdown()
+        self.workers = workers
+
+    async def run(self, func: Callable[..., Result], *args: Any) -> Result:
+        """
+        Call a function on one of the pool's threads, and wait for it to return.
+
+        :return: What the function returned. Exceptions it raises are raised here.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.workers or None, thread_name_prefix="mewbot-blocking"
+            )
+
+        self.calls += 1
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(context.run, func, *args)
+        )
+
+    def shutdown(self) -> None:
+        """Stop the pool's threads once their current calls finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+BLOCKING_POOL = BlockingPool()
+
+__all__ = ["BLOCKING_POOL", "BlockingPool"]
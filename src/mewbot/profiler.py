@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides a sampling profiler which can be started and stopped while a bot is running.
+
+A running bot starts the process-wide :data:`PROFILER` when it receives SIGUSR1, and stops
+it when it receives SIGUSR1 again, writing what it saw to `profile_path` (see
+:class:`~mewbot.bot.RunnerConfig`). While it runs, a thread takes a sample every
+`profile_interval` seconds, of:
+
+ - the stack the event loop is running, under `[running]`. Time the loop spends waiting
+   for something to happen is counted as `[idle]`, and the loop's own frames are left
+   out, so each stack starts at the coroutine of the task being run.
+ - where every other task is suspended, under `[awaiting]`, found by following the chain
+   of awaits from each task's coroutine. Each task is counted in every sample, so this
+   shows where tasks spend their time waiting (e.g. on a slow service), rather than where
+   the process spends its time.
+
+Frames are named by module and qualified name (e.g. `mewbot.api.v1:Behaviour.process`),
+so time is attributed to the behaviours and components which spent it. On Python 3.10,
+which does not record qualified names, only the function name is used.
+
+The samples are written in the "folded" format used by flamegraph.pl, inferno, and
+speedscope: one line for each distinct stack, with the frames from the outermost in,
+separated by semicolons, and then the number of samples.
+
+Nothing runs while the profiler is stopped, so it costs nothing until it is started.
+"""
+
+from __future__ import annotations
+
+from types import FrameType
+from typing import Any, List, Optional
+
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+
+DEFAULT_PROFILE_INTERVAL = 0.005
+DEFAULT_PROFILE_PATH = "mewbot-profile-%Y%m%d-%H%M%S.folded"
+
+# The loop's own frames, which are left out of the running stack.
+LOOP_FRAME = "asyncio.events:Handle._run"
+IDLE_MODULES = ("selectors", "asyncio.base_events", "asyncio.events")
+
+
+def frame_name(frame: FrameType) -> str:
+    """The name of a frame in a stack: its module and (qualified) function name."""
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{frame.f_globals.get('__name__', '?')}:{name}"
+
+
+def running_stack(frame: FrameType) -> List[str]:
+    """
+    The names of the frames in a running stack, from the outermost in.
+
+    Frames up to the event loop running a task or callback are left out. A stack which is
+    entirely the event loop (waiting in its selector) is given as `[idle]`.
+    """
+    names: List[str] = []
+    current: Optional[FrameType] = frame
+    while current is not None:
+        names.append(frame_name(current))
+        current = current.f_back
+    names.reverse()
+
+    if LOOP_FRAME in names:
+        start = len(names) - names[::-1].index(LOOP_FRAME)  # Just after the last loop frame
+        return ["[running]", *names[start:]]
+
+    if frame.f_globals.get("__name__") in IDLE_MODULES:
+        return ["[idle]"]
+    return ["[running]", *names]
+
+
+def await_stack(awaitable: Any) -> List[str]:
+    """
+    The names of the frames a suspended coroutine is waiting in, from the outermost in.
+
+    The chain of awaits is followed through coroutines, generators, and async generators;
+    whatever is at the end of it is named by its class (e.g. `FutureIter`, for a future).
+    """
+    names: List[str] = []
+    while awaitable is not None:
+        frame = next(
+            (
+                getattr(awaitable, attr)
+                for attr in ("cr_frame", "gi_frame", "ag_frame")
+                if getattr(awaitable, attr, None) is not None
+            ),
+            None,
+        )
+        if frame is None:
+            names.append(type(awaitable).__name__)
+            break
+
+        names.append(frame_name(frame))
+        awaitable = next(
+            (
+                getattr(awaitable, attr)
+                for attr in ("cr_await", "gi_yieldfrom", "ag_await")
+                if getattr(awaitable, attr, None) is not None
+            ),
+            None,
+        )
+    return names
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of an event loop's thread, and of its tasks, from a separate thread.
+
+    The running stack is read by the profiler's thread. The tasks' stacks are read by a
+    callback on the event loop (as the tasks can only be safely listed from there), which
+    the thread schedules for each sample, unless the previous one has not run yet.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The samples and counters are public; the rest is the state of the sampling thread.
+
+    interval: float  # Seconds between samples
+    samples: collections.Counter[str]  # Number of samples of each stack, folded
+    sample_count: int  # The number of samples taken
+    started: float  # When the profiler was started, in seconds since the epoch
+
+    _loop: Optional[asyncio.AbstractEventLoop]
+    _thread: Optional[threading.Thread]
+    _stopping: threading.Event
+    _lock: threading.Lock
+    _tasks_pending: bool
+    _logger: logging.Logger
+
+    def __init__(self) -> None:
+        """Create a stopped profiler."""
+        self.interval = DEFAULT_PROFILE_INTERVAL
+        self.samples = collections.Counter()
+        self.sample_count = 0
+        self.started = 0.0
+
+        self._loop = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._tasks_pending = False
+        self._logger = logging.getLogger(__name__ + "SamplingProfiler")
+
+    @property
+    def running(self) -> bool:
+        """Whether the profiler is taking samples."""
+        return self._thread is not None
+
+    def start(
+        self, loop: asyncio.AbstractEventLoop, interval: float = DEFAULT_PROFILE_INTERVAL
+    ) -> None:
+        """
+        Start sampling, discarding any previous samples.
+
+        Must be called from the thread running the event loop.
+        :param loop: The event loop to sample.
+        :param interval: How often to take a sample, in seconds.
+        """
+        if interval <= 0:
+            raise ValueError(f"Profile interval must be positive (got {interval})")
+        if self._thread is not None:
+            raise RuntimeError("Profiler is already running")
+
+        self.interval = interval
+        self.samples = collections.Counter()
+        self.sample_count = 0
+        self.started = time.time()
+
+        self._loop = loop
+        self._tasks_pending = False
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(threading.get_ident(),),
+            name="mewbot-profiler",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling, keeping the samples taken."""
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+        self._loop = None
+
+    def write(self, path: str) -> None:
+        """Write the samples to a file, in the folded stack format."""
+        with self._lock:
+            lines = [f"{stack} {count}\n" for stack, count in sorted(self.samples.items())]
+
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.writelines(lines)
+
+    def toggle(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        path: str = DEFAULT_PROFILE_PATH,
+        interval: float = DEFAULT_PROFILE_INTERVAL,
+    ) -> Optional[str]:
+        """
+        Start the profiler if it is stopped; otherwise stop it, and write out the samples.
+
+        :param loop: The event loop to sample.
+        :param path: The file to write the samples to. It is passed through
+                     :func:`time.strftime`, with the time the profiler was started.
+        :param interval: How often to take a sample, in seconds.
+        :return: The file the samples were written to, if the profiler was stopped.
+        """
+        if not self.running:
+            self.start(loop, interval)
+            self._logger.info("Profiler started, sampling every %ss", interval)
+            return None
+
+        self.stop()
+        filename = time.strftime(path, time.localtime(self.started))
+        self.write(filename)
+        self._logger.info(
+            "Profiler stopped after %d samples; written to %s", self.sample_count, filename
+        )
+        return filename
+
+    def _run(self, thread_id: int) -> None:
+        """Take samples until stopped."""
+        while not self._stopping.wait(self.interval):
+            # pylint: disable=protected-access
+            # This is the documented way of getting another thread's stack.
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self._add(running_stack(frame))
+            del frame
+
+            if self._tasks_pending or self._loop is None:
+                continue
+            self._tasks_pending = True
+            try:
+                self._loop.call_soon_threadsafe(self._sample_tasks)
+            except RuntimeError:
+                # The loop has been closed.
+                self._tasks_pending = False
+
+    def _sample_tasks(self) -> None:
+        """Take a sample of where each task is suspended. Runs on the event loop."""
+        self._tasks_pending = False
+        if self._loop is None:
+            return
+
+        for task in asyncio.all_tasks(self._loop):
+            if not task.done():
+                self._add(["[awaiting]", *await_stack(task.get_coro())], count_sample=False)
+
+    def _add(self, stack: List[str], count_sample: bool = True) -> None:
+        with self._lock:
+            self.samples[";".join(stack)] += 1
+            if count_sample:
+                self.sample_count += 1
+
+
+PROFILER = SamplingProfiler()
+
+__all__ = [
+    "PROFILER",
+    "SamplingProfiler",
+    "await_stack",
+    "frame_name",
+    "running_stack",
+    "DEFAULT_PROFILE_INTERVAL",
+    "DEFAULT_PROFILE_PATH",
+]
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides recording of a bot's input events, and replaying them to load test its behaviours.
+
+If a :class:`~mewbot.bot.BotRunner` is given a `record_path`, every event its inputs
+produce is appended to a recording at that path, with the time it arrived. A recording is
+a gzip compressed stream of pickled `(offset, event)` pairs, where the offset is the time
+in seconds since recording started; it is read back with :func:`read_recording`.
+
+:func:`replay` feeds a recording through a runner, either at the recorded pace (`speed` 1),
+faster or slower (`speed` 2 replays twice as fast), or as fast as the runner will accept
+the events (`speed` 0). :func:`replay_runner` creates a runner for a bot which does not
+start the bot's inputs and sends every output event to a :class:`CountingOutput`, so
+a new version of a bot's behaviours can be measured against real traffic without
+connecting to any services.
+
+.. code-block:: python
+
+    with open("bot.yaml", "r", encoding="utf-8") as config:
+        bot = configure_bot("replay", config)
+
+    runner, sink = replay_runner(bot)
+    report = asyncio.run(replay(runner, "traffic.rec.gz", speed=0))
+    print(report.events_per_second, sink.counts)
+
+Events which can not be pickled are not recorded.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Set, Tuple, Type
+
+import asyncio
+import collections
+import dataclasses
+import gzip
+import logging
+import pickle
+import time
+
+from mewbot.core import InputEvent, InputQueue, OutputEvent
+from mewbot.metrics import REGISTRY
+
+if TYPE_CHECKING:
+    # The runner records events with this module, so it can only be imported for typing.
+    from mewbot.bot import Bot, BotRunner
+
+RECORDING_FORMAT = "mewbot-recording"
+RECORDING_VERSION = 1
+
+
+class EventRecorder:
+    """Appends input events to a recording, with the time each one arrived."""
+
+    path: str
+    recorded: int  # Events written to the recording
+    skipped: int  # Events which could not be pickled
+
+    _stream: gzip.GzipFile
+    _unpicklable: Set[Type[InputEvent]]  # Event classes already warned about
+    _start: float
+    _logger: logging.Logger
+
+    def __init__(self, path: str) -> None:
+        """
+        Start a new recording.
+
+        :param path: The file to write the recording to; it is replaced if it exists.
+        """
+        self.path = path
+        self.recorded = 0
+        self.skipped = 0
+        self._unpicklable = set()
+
+        # The file stays open until the recorder is closed.
+        # pylint: disable=consider-using-with
+        self._stream = gzip.open(path, "wb", compresslevel=6)
+        self._start = time.perf_counter()
+        self._logger = logging.getLogger(__name__ + "EventRecorder")
+
+        header = {
+            "format": RECORDING_FORMAT,
+            "version": RECORDING_VERSION,
+            "time": time.time(),
+        }
+        pickle.dump(header, self._stream, pickle.HIGHEST_PROTOCOL)
+
+    def record(self, event: InputEvent) -> None:
+        """
+        Append an event to the recording, unless it can not be pickled.
+
+        Events which can not be pickled are counted in :attr:`skipped`; a warning is logged
+        for the first of each class.
+        """
+        offset = time.perf_counter() - self._start
+
+        try:
+            data = pickle.dumps((offset, event), pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as err:
+            self.skipped += 1
+            if type(event) not in self._unpicklable:
+                self._unpicklable.add(type(event))
+                self._logger.warning(
+                    "Not recording %s events, as they can not be pickled: %s",
+                    type(event).__name__,
+                    err,
+                )
+            return
+
+        self._stream.write(data)
+        self.recorded += 1
+
+    def close(self) -> None:
+        """Finish and close the recording."""
+        self._stream.close()
+
+
+def read_recording(path: str) -> Iterator[Tuple[float, InputEvent]]:
+    """
+    Read back the events from a recording.
+
+    A recording which was cut short (e.g. because the bot was killed) is read up to the
+    last complete event.
+    :param path: The recording, as written by :class:`EventRecorder`.
+    :return: Each event, with the time (in seconds since recording started) it arrived.
+    """
+    with gzip.open(path, "rb") as stream:
+        header = pickle.load(stream)
+
+        if not isinstance(header, dict) or header.get("format") != RECORDING_FORMAT:
+            raise ValueError(f"{path} is not a mewbot recording")
+        if header.get("version") != RECORDING_VERSION:
+            raise ValueError(f"{path} has unsupported version {header.get('version')}")
+
+        while True:
+            try:
+                offset, event = pickle.load(stream)
+            except EOFError:
+                return
+            yield offset, event
+
+
+class RecordingQueue(InputQueue):
+    """
+    Input queue which records each event, then passes it on to the bot's input queue.
+
+    Nothing is kept on this queue itself. Events are recorded as the input puts them,
+    so the recording has the times they arrived, even if they then wait for space.
+    """
+
+    target: InputQueue
+    recorder: EventRecorder
+
+    def __init__(self, target: InputQueue, recorder: EventRecorder) -> None:
+        """
+        Create a queue which records events before queueing them.
+
+        :param target: The queue to pass the events on to
+        :param recorder: The recording to add the events to
+        """
+        super().__init__()
+        self.target = target
+        self.recorder = recorder
+
+    async def put(self, item: InputEvent) -> None:
+        """Record the event, and put it on the target queue."""
+        self.recorder.record(item)
+        await self.target.put(item)
+
+    def put_nowait(self, item: InputEvent) -> None:
+        """Record the event, and put it on the target queue without waiting."""
+        self.recorder.record(item)
+        self.target.put_nowait(item)
+
+
+class CountingOutput:
+    """Output which accepts every output event, and only counts them by class."""
+
+    counts: collections.Counter[str]
+
+    def __init__(self) -> None:
+        """Create an output which has not counted any events."""
+        self.counts = collections.Counter()
+
+    @staticmethod
+    def consumes_outputs() -> Set[Type[OutputEvent]]:
+        """Consumes all output events."""
+        return {OutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Count the event."""
+        self.counts[type(event).__name__] += 1
+        return True
+
+
+@dataclasses.dataclass
+class ReplayReport:
+    """
+    The results of replaying a recording.
+
+    `behind` is the furthest the replay fell behind the pace it was asked for, in seconds,
+    because the runner was not accepting events (e.g. its input queue was full).
+    `latencies` is the snapshot of the pipeline latency histograms for the replay
+    (see :meth:`mewbot.metrics.MetricsRegistry.snapshot`).
+    """
+
+    events: int = 0
+    elapsed: float = 0.0
+    behind: float = 0.0
+    drained: bool = True
+    latencies: List[Dict[str, Any]] = dataclasses.field(default_factory=list)
+
+    @property
+    def events_per_second(self) -> float:
+        """The rate the events were processed at."""
+        return self.events / self.elapsed if self.elapsed else 0.0
+
+
+def replay_runner(bot: Bot) -> Tuple[BotRunner, CountingOutput]:
+    """
+    Create a runner for a bot which is fed by a replay, rather than the bot's inputs.
+
+    The runner uses the bot's behaviours and runner settings, but no inputs, and all output
+    events are sent to a :class:`CountingOutput` instead of the bot's outputs. The bot's
+    queue_path, record_path, dead_letter_path, and trace_file are not used (dead letters
+    are only kept in memory, and events are not traced), so a replay does not disturb a
+    running bot.
+    :param bot: The bot whose behaviours are to be measured
+    :return: The runner, and the output counting the events it sends
+    """
+    config = dataclasses.replace(
+        bot.runner_config,
+        queue_path="",
+        record_path="",
+        dead_letter_path="",
+        trace_sample_rate=0.0,
+        trace_file="",
+    )
+
+    runner = bot.create_runner(config)
+    runner.inputs = set()
+
+    sink = CountingOutput()
+    runner.outputs = {OutputEvent: {sink}}
+    return runner, sink
+
+
+async def replay(
+    runner: BotRunner, path: str, speed: float = 1.0, drain_timeout: float = 60.0
+) -> ReplayReport:
+    """
+    Feed the events in a recording through a runner, and wait for them to be handled.
+
+    The runner's queue processors are started, and stopped once the events are drained.
+    The process-wide latency histograms are reset before the replay starts, so the report
+    only covers the replayed events.
+    :param runner: The runner to process the events, e.g. from :func:`replay_runner`
+    :param path: The recording to replay
+    :param speed: How many times faster than recorded to replay the events; 0 puts each
+                  event on the queue as soon as the runner accepts it.
+    :param drain_timeout: The longest to wait, after the last event, for all the events to
+                          be processed and their outputs sent.
+    :return: How long the replay took, and the pipeline latencies during it.
+    """
+    if speed < 0:
+        raise ValueError(f"speed can not be negative (got {speed})")
+
+    loop = asyncio.get_running_loop()
+    report = ReplayReport()
+
+    REGISTRY.reset()
+    processors = [
+        loop.create_task(runner.process_input_queue()),
+        loop.create_task(runner.process_output_queue()),
+    ]
+
+    start = loop.time()
+    try:
+        for offset, event in read_recording(path):
+            if speed:
+                due = start + offset / speed
+                if due > loop.time():
+                    await asyncio.sleep(due - loop.time())
+                report.behind = max(report.behind, loop.time() - due)
+
+            await runner.input_event_queue.put(event)
+            report.events += 1
+
+        report.drained = not (await runner.drain(drain_timeout)).timed_out
+    finally:
+        for task in processors:
+            task.cancel()
+        await asyncio.gather(*processors, return_exceptions=True)
+
+    report.elapsed = loop.time() - start
+    report.latencies = REGISTRY.snapshot()
+    return report
+
+
+__all__ = [
+    "CountingOutput",
+    "EventRecorder",
+    "RecordingQueue",
+    "ReplayReport",
+    "read_recording",
+    "replay",
+    "replay_runner",
+]
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides the schedulers the BotRunner uses to run behaviours as independent tasks.
+
+By default, an input worker waits for every behaviour which consumes an event before it
+takes the next event, so the slowest behaviour sets the pace for all of them. When the
+runner is configured with a behaviour concurrency, each behaviour instead gets its own
+:class:`BehaviourScheduler`, with a bounded buffer of events waiting for the behaviour to
+have room for them. The worker only waits if that buffer is full, so a saturated behaviour
+does not hold up the events which other behaviours consume.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any, Dict, Optional, Set, Tuple
+
+import asyncio
+import contextvars
+import logging
+
+# An event waiting to be processed: how to process it, its partition key, its callback,
+# and the context it was submitted from (which it is processed in).
+Submission = Tuple[
+    Callable[[], Awaitable[None]],
+    Optional[Hashable],
+    Optional[Callable[[], None]],
+    contextvars.Context,
+]
+
+
+class BehaviourScheduler:
+    """
+    Runs the processing of events for one behaviour as tasks, with a limit on how many run.
+
+    Once `limit` events are in flight for the behaviour, further events wait in a buffer
+    until one of them finishes. Once the buffer is also full, :meth:`submit` waits for room,
+    applying backpressure to whoever is submitting. Events with the same partition key are
+    processed one after another, in the order they were submitted.
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # The settings are public; the rest is the state of the buffer and the tasks in flight.
+
+    behaviour: Any
+    limit: int
+
+    _slots: asyncio.Semaphore
+    _pending: asyncio.Queue[Submission]  # Events waiting for the behaviour to have room
+    _dispatcher: Optional[asyncio.Task[None]]  # Starts pending events as slots free up
+    _tasks: Set[asyncio.Task[None]]
+    _tails: Dict[Hashable, asyncio.Task[None]]  # The latest task for each partition key
+    _logger: logging.Logger
+
+    def __init__(self, behaviour: Any, limit: int, buffer: int = 0) -> None:
+        """
+        Create a scheduler for the given behaviour.
+
+        :param behaviour: The behaviour being scheduled (used in logging)
+        :param limit: The maximum number of events which may be in flight at once
+        :param buffer: The number of events which may wait for room; 0 to use the limit
+        """
+        if limit < 1:
+            raise ValueError(f"Behaviour limit must be at least 1 (got {limit})")
+        if buffer < 0:
+            raise ValueError(f"Behaviour buffer can not be negative (got {buffer})")
+
+        self.behaviour = behaviour
+        self.limit = limit
+
+        self._slots = asyncio.Semaphore(limit)
+        self._pending = asyncio.Queue(buffer or limit)
+        self._dispatcher = None
+        self._tasks = set()
+        self._tails = {}
+        self._logger = logging.getLogger(__name__ + "BehaviourScheduler")
+
+    @property
+    def in_flight(self) -> int:
+        """The number of events which are being (or waiting to be) processed."""
+        return len(self._tasks) + self._pending.qsize()
+
+    async def submit(
+        self,
+        process: Callable[[], Awaitable[None]],
+        key: Optional[Hashable] = None,
+        done: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Schedule an event to be processed, waiting only if the buffer is full.
+
+        :param process: Called to create the coroutine which processes the event
+        :param key: The event's partition key; events with the same key run in order
+        :param done: Called once the event has been processed (or has failed)
+        """
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        await self._pending.put((process, key, done, contextvars.copy_context()))
+
+    async def stop(self) -> None:
+        """
+        Cancel all the events in flight, and wait for them to finish.
+
+        Events still in the buffer are never processed, but their callbacks are called.
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+        tasks = list(self._tasks)
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        while not self._pending.empty():
+            _, _, done, _ = self._pending.get_nowait()
+            self._pending.task_done()
+            if done:
+                done()
+
+    async def close(self) -> None:
+        """
+        Wait for the events which have been submitted to be processed, then stop.
+
+        Used once the behaviour has been removed, so no more events are submitted.
+        """
+        await self._pending.join()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.stop()
+
+    async def _dispatch(self) -> None:
+        """Start the buffered events in order, as the behaviour has room for them."""
+        while True:
+            await self._slots.acquire()
+            try:
+                submission = await self._pending.get()
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+            self._start(*submission)
+            self._pending.task_done()
+
+    def _start(
+        self,
+        process: Callable[[], Awaitable[None]],
+        key: Optional[Hashable],
+        done: Optional[Callable[[], None]],
+        context: contextvars.Context,
+    ) -> None:
+        """Create the task for an event, once a slot has been acquired for it."""
+        previous = self._tails.get(key) if key is not None else None
+        # Tasks copy the current context, so are created in the one the event was submitted in.
+        task = context.run(asyncio.create_task, self._run(process, previous))
+        self._tasks.add(task)
+
+        if key is not None:
+            self._tails[key] = task
+
+        def finished(_: asyncio.Task[None]) -> None:
+            self._tasks.discard(task)
+            self._slots.release()
+            if key is not None and self._tails.get(key) is task:
+                del self._tails[key]
+            if done:
+                done()
+
+        task.add_done_callback(finished)
+
+    async def _run(
+        self, process: Callable[[], Awaitable[None]], previous: Optional[asyncio.Task[None]]
+    ) -> None:
+        if previous:
+            # Exceptions from the previous event were logged by its own task.
+            await asyncio.wait((previous,))
+
+        try:
+            await process()
+        except Exception:  # pylint: disable=broad-except
+            self._logger.exception("Behaviour %s failed while processing", self.behaviour)
+
+
+__all__ = ["BehaviourScheduler"]
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Provides correlation IDs and sampled tracing for events passing through a bot.
+
+Each input event the :class:`~mewbot.bot.BotRunner` processes is given a :class:`Trace`,
+which holds a correlation ID for the event. The input event is tagged with the trace, and
+its ID logged at debug level, when it is taken off the queue. While the event is being
+processed, the trace is held in the :data:`CURRENT_TRACE` context variable, and every
+output event produced is also tagged with it; the ID of an event (input or output) can be
+found with :func:`correlation_id`.
+This allows (for example) a slow reply to be connected back to the message that caused it.
+
+A fraction of traces (set by the runner's `trace_sample_rate`) are sampled. For those,
+each stage of handling the event is recorded as a :class:`Span` and passed to the
+exporter of the process-wide :data:`TRACER`. The stages are:
+
+ - `process`: passing the input event to all of its behaviours
+ - `batch`: passing a batch of input events to their behaviours; a batch has its own trace,
+   and its span links to the traces of the events in it
+ - `behaviour`: one behaviour processing the event
+ - `trigger`, `condition`, and `action`: each component of a behaviour
+ - `output`: an output sending one of the output events
+
+Unsampled traces only cost creating the ID and tagging the outputs.
+The :class:`FileExporter` writes spans to a file, one JSON object per line.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Optional, Protocol, Sequence, TextIO, Tuple
+
+import dataclasses
+import itertools
+import json
+import os
+import random
+import time
+from contextvars import ContextVar
+
+TRACE_ATTRIBUTE = "_mewbot_trace"
+
+
+@dataclasses.dataclass
+class Trace:
+    """The correlation ID given to an input event, and whether it is being sampled."""
+
+    correlation_id: str
+    sampled: bool = False
+
+
+@dataclasses.dataclass
+class Span:
+    """
+    The time taken by one stage of handling a sampled event.
+
+    `start` is the wall clock time, in seconds since the epoch, and `duration` is in seconds.
+    `event` is the class of the event being handled; `behaviour` and `component` name what
+    handled it, where there is one. `links` are the correlation IDs of other traces the span
+    is part of (the events in a batch).
+    """
+
+    # pylint: disable=too-many-instance-attributes
+    # These are the fields exported for each span.
+
+    correlation_id: str
+    stage: str
+    start: float
+    duration: float
+    event: str = ""
+    behaviour: str = ""
+    component: str = ""
+    links: Tuple[str, ...] = ()
+
+
+class SpanExporter(Protocol):
+    """Somewhere to send the spans of sampled traces."""
+
+    def export(self, span: Span) -> None:
+        """Record a finished span."""
+
+    def close(self) -> None:
+        """Write out any buffered spans, and release any resources."""
+
+
+class FileExporter:
+    """Appends spans to a file, as one JSON object per line."""
+
+    path: str
+    _stream: TextIO
+
+    def __init__(self, path: str) -> None:
+        """
+        Open the file to write spans to.
+
+        :param path: The file to append spans to; it is created if it does not exist.
+        """
+        self.path = path
+        # The file stays open until the exporter is closed.
+        # pylint: disable=consider-using-with
+        self._stream = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span) -> None:
+        """Write the span to the file."""
+        self._stream.write(json.dumps(dataclasses.asdict(span)) + "\n")
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        self._stream.close()
+
+
+class Tracer:
+    """
+    Creates the traces for input events, and exports the spans of those being sampled.
+    """
+
+    sample_rate: float
+    exporter: Optional[SpanExporter]
+
+    _prefix: str
+    _ids: itertools.count[int]
+    _offset: float  # Difference between the wall clock and the performance counter
+
+    def __init__(
+        self, sample_rate: float = 0.0, exporter: Optional[SpanExporter] = None
+    ) -> None:
+        """
+        Create a tracer.
+
+        :param sample_rate: The fraction of traces to sample, between 0 and 1
+        :param exporter: Where to send the spans of sampled traces
+        """
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+        self._prefix = os.urandom(4).hex()
+        self._ids = itertools.count()
+        self._offset = time.time() - time.perf_counter()
+
+    def configure(self, sample_rate: float, exporter: Optional[SpanExporter]) -> None:
+        """
+        Change the sampling rate and exporter, closing the previous exporter.
+
+        Traces are only sampled if there is an exporter to send their spans to.
+        """
+        if self.exporter and self.exporter is not exporter:
+            self.exporter.close()
+
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def start(self) -> Trace:
+        """Create a trace, with a new correlation ID, deciding whether it is sampled."""
+        sampled = (
+            self.sample_rate > 0
+            and self.exporter is not None
+            and random.random() < self.sample_rate
+        )
+        return Trace(f"{self._prefix}-{next(self._ids):x}", sampled)
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    # The arguments are the fields of the span.
+    def span(
+        self,
+        trace: Trace,
+        stage: str,
+        start: float,
+        duration: float,
+        event: str = "",
+        behaviour: str = "",
+        component: str = "",
+        links: Sequence[str] = (),
+    ) -> None:
+        """
+        Export a span for a sampled trace.
+
+        :param trace: The trace the span belongs to; nothing is exported if it is not sampled
+        :param stage: The stage of handling the event
+        :param start: When the stage started, from :func:`time.perf_counter`
+        :param duration: How long the stage took, in seconds
+        """
+        if not (trace.sampled and self.exporter):
+            return
+
+        self.exporter.export(
+            Span(
+                trace.correlation_id,
+                stage,
+                start + self._offset,
+                duration,
+                event,
+                behaviour,
+                component,
+                tuple(links),
+            )
+        )
+
+
+TRACER = Tracer()
+
+CURRENT_TRACE: ContextVar[Optional[Trace]] = ContextVar("mewbot_trace", default=None)
+
+
+def sampled_trace() -> Optional[Trace]:
+    """The trace for the event currently being processed, if it is being sampled."""
+    trace = CURRENT_TRACE.get()
+    return trace if trace and trace.sampled else None
+
+
+def tag(event: Any, trace: Trace) -> None:
+    """Attach a trace to an event, unless the event does not allow new attributes."""
+    try:
+        object.__setattr__(event, TRACE_ATTRIBUTE, trace)
+    except AttributeError:
+        pass
+
+
+def trace_of(event: Any) -> Optional[Trace]:
+    """The trace attached to an event, if it has one."""
+    trace: Optional[Trace] = getattr(event, TRACE_ATTRIBUTE, None)
+    return trace
+
+
+def correlation_id(event: Any) -> Optional[str]:
+    """
+    The correlation ID of an input event, or of the input event an output was produced for.
+    """
+    trace = trace_of(event)
+    return trace.correlation_id if trace else None
+
+
+__all__ = [
+    "Trace",
+    "Span",
+    "SpanExporter",
+    "FileExporter",
+    "Tracer",
+    "TRACER",
+    "CURRENT_TRACE",
+    "sampled_trace",
+    "tag",
+    "trace_of",
+    "correlation_id",
+]
@@ -11,9 +11,20 @@ from __future__ import annotations
 from typing import Any, AsyncIterable
 
 import dataclasses
-
-from mewbot.api.v1 import Action, Behaviour, Condition, InputEvent, Trigger
-from mewbot.core import OutputEvent
+import threading
+
+import pytest
+
+from mewbot.api.v1 import (
+    Action,
+    BatchBehaviour,
+    Behaviour,
+    Condition,
+    InputEvent,
+    Trigger,
+    blocking,
+)
+from mewbot.core import BatchBehaviourInterface, OutputEvent
 from mewbot.io.common import EventWithReplyMixIn, ReplyAction
 
 
@@ -101,6 +112,49 @@ class Reply(OutputEvent):
     message: str
 
 
+class FailingEvent(ReplyableEvent):
+    """Event which the ThreadAction fails on."""
+
+
+@blocking
+class ThreadCondition(Condition):
+    """Blocking Condition which records the thread it was run on."""
+
+    threads: list[str] = []
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Accept any Event for checking."""
+        return {InputEvent}
+
+    def allows(self, event: InputEvent) -> bool:
+        """Record the thread, and approve any Event."""
+        self.threads.append(threading.current_thread().name)
+        return True
+
+
+class ThreadAction(Action):
+    """Blocking Action which replies with the thread it was run on, or fails."""
+
+    blocking = True
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Accept any kind of Event."""
+        return {InputEvent}
+
+    @staticmethod
+    def produces_outputs() -> set[type[OutputEvent]]:
+        """Replies with the thread name."""
+        return {Reply}
+
+    async def act(self, event: InputEvent, state: dict[str, Any]) -> AsyncIterable[Reply]:
+        """Reply with the thread name, or fail for a FailingEvent."""
+        if isinstance(event, FailingEvent):
+            raise ValueError("Asked to fail")
+        yield Reply(threading.current_thread().name)
+
+
 class TestBehaviourProcess:
     """
     Test cases for the process() logic of the API v1 Behaviour class.
@@ -164,12 +218,88 @@ class TestBehaviourProcess:
 
         assert len(events) == 0
 
+    async def test_process_batch(self) -> None:
+        """Test a batch gives the same outputs as processing the events one at a time."""
+
+        behaviour = self.create_behaviour("Hello!", BatchBehaviour)
+        batch = [ReplyableEvent(), InputEvent(), ReplyableEvent()]
+        assert isinstance(behaviour, BatchBehaviour)
+
+        events = [e async for e in behaviour.process_batch(batch)]
+
+        assert events == [Reply("Hello!"), Reply("Hello!")]
+
+    async def test_process_batch_denied_condition(self) -> None:
+        """Test a batch is not processed where denied by a Condition."""
+
+        behaviour = self.create_behaviour("Hello!", BatchBehaviour)
+        behaviour.add(Dissident())
+        assert isinstance(behaviour, BatchBehaviour)
+
+        events = [e async for e in behaviour.process_batch([ReplyableEvent()] * 3)]
+
+        assert len(events) == 0
+
+    async def test_process_batch_uses_overridden_process(self) -> None:
+        """Test a Behaviour which overrides process has each event in a batch passed to it."""
+
+        class CountingBehaviour(BatchBehaviour):
+            """Behaviour which replies with the number of events it has processed."""
+
+            count = 0
+
+            async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+                """Count the event."""
+                self.count += 1
+                yield Reply(str(self.count))
+
+        behaviour = CountingBehaviour()
+        events = [e async for e in behaviour.process_batch([InputEvent(), InputEvent()])]
+
+        assert events == [Reply("1"), Reply("2")]
+
+    async def test_process_blocking_components(self) -> None:
+        """Test blocking components are run on the blocking pool's threads."""
+
+        # pylint: disable=unexpected-keyword-arg
+        behaviour = Behaviour(name="Test")  # type: ignore
+        behaviour.add(ReplyTrigger())
+        behaviour.add(ThreadCondition())
+        behaviour.add(ThreadAction())
+
+        events = [e async for e in behaviour.process(ReplyableEvent())]
+
+        assert ThreadCondition.blocking and ThreadAction.blocking
+        assert not NullAction.blocking
+        assert isinstance(events[0], Reply)
+        assert events[0].message.startswith("mewbot-blocking")
+        assert ThreadCondition.threads[-1].startswith("mewbot-blocking")
+
+    async def test_process_blocking_exception_raised(self) -> None:
+        """Test exceptions from blocking components are raised by process."""
+
+        # pylint: disable=unexpected-keyword-arg
+        behaviour = Behaviour(name="Test")  # type: ignore
+        behaviour.add(ReplyTrigger())
+        behaviour.add(ThreadAction())
+
+        with pytest.raises(ValueError):
+            _ = [e async for e in behaviour.process(FailingEvent())]
+
+    async def test_batching_is_opt_in(self) -> None:
+        """Test only BatchBehaviours are given batches by the runner."""
+
+        assert not isinstance(self.create_behaviour("Hello!"), BatchBehaviourInterface)
+        assert isinstance(
+            self.create_behaviour("Hello!", BatchBehaviour), BatchBehaviourInterface
+        )
+
     @staticmethod
-    def create_behaviour(message: str) -> Behaviour:
+    def create_behaviour(message: str, cls: type[Behaviour] = Behaviour) -> Behaviour:
         """Creates a Test Behaviour (without linting issues)."""
 
         # pylint: disable=unexpected-keyword-arg
-        behaviour = Behaviour(name="Test")  # type: ignore
+        behaviour = cls(name="Test")  # type: ignore
         behaviour.add(ReplyTrigger())
         behaviour.add(ReplyAction(message=message))  # type: ignore
         behaviour.add(NullAction())
@@ -13,9 +13,11 @@ from __future__ import annotations
 from typing import Type
 
 import copy
+import logging
 
 from mewbot.api.v1 import IOConfig
-from mewbot.io.http import HTTPServlet
+from mewbot.core import InputQueue
+from mewbot.io.http import HTTPInputListener, HTTPServlet, IncomingWebhookEvent
 from mewbot.io.socket import SocketIO
 from mewbot.test import BaseTestClassWithConfig
 
@@ -53,3 +55,48 @@ class TestIoHttpsPost(BaseTestClassWithConfig[HTTPServlet]):
         new_port = 0
         temp_component.port = new_port
         assert temp_component.port == new_port
+
+
+class StubRequest:
+    """Stands in for an aiohttp request in the webhook listener tests."""
+
+    def __init__(self, text: str) -> None:
+        self._text = text
+
+    async def text(self) -> str:
+        """The body of the request."""
+        return self._text
+
+
+class TestHTTPInputListener:
+    """
+    Tests for how the webhook listener puts events on the input queue.
+    """
+
+    @staticmethod
+    async def test_post_queues_event() -> None:
+        """A post request puts its body on the input queue."""
+
+        listener = HTTPInputListener("localhost", 0, logging.getLogger(__name__))
+        queue = InputQueue()
+        listener.bind(queue)
+
+        response = await listener.post_response(StubRequest("hello"))  # type: ignore
+
+        assert response.status == 200
+        assert queue.get_nowait() == IncomingWebhookEvent(text="hello")
+
+    @staticmethod
+    async def test_post_rejected_when_queue_full() -> None:
+        """If the input queue rejects the event, the request gets a 429 response."""
+
+        listener = HTTPInputListener("localhost", 0, logging.getLogger(__name__))
+        queue = InputQueue(1, "reject")
+        listener.bind(queue)
+
+        await listener.post_response(StubRequest("first"))  # type: ignore
+        response = await listener.post_response(StubRequest("second"))  # type: ignore
+
+        assert response.status == 429
+        assert queue.qsize() == 1
+        assert queue.rejected == 1
@@ -0,0 +1,998 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the Bot and the BotRunner which routes events between its components.
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterable, Hashable, Iterable, Sequence
+from typing import Any, Optional
+
+import asyncio
+import contextlib
+import dataclasses
+
+import pytest
+
+from mewbot.bot import Bot, BotRunner, DrainReport, RunnerConfig
+from mewbot.core import (
+    BehaviourInterface,
+    InputEvent,
+    OutputEvent,
+    OutputInterface,
+    OverflowPolicy,
+)
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+@dataclasses.dataclass
+class OtherEvent(InputEvent):
+    """Unrelated event for the runner tests."""
+
+
+@dataclasses.dataclass
+class ParentEvent(InputEvent):
+    """Base input event for the runner tests."""
+
+    value: int = 0
+
+
+@dataclasses.dataclass
+class ChildEvent(ParentEvent):
+    """Subclass of the base test event."""
+
+
+@dataclasses.dataclass
+class KeyedEvent(InputEvent):
+    """Event with a partition key."""
+
+    key: Optional[str]
+    value: int = 0
+
+    def partition_key(self) -> Hashable:
+        """Events are partitioned by their key field."""
+        return self.key
+
+
+@dataclasses.dataclass
+class RedeliveredEvent(ParentEvent):
+    """Event which is a duplicate of any other with the same value."""
+
+    def dedup_key(self) -> Hashable:
+        """Events are identified by their value."""
+        return self.value
+
+
+@dataclasses.dataclass
+class RecordedOutputEvent(OutputEvent):
+    """Output event produced by the recording behaviour."""
+
+    value: int = 0
+
+
+class RecordingBehaviour:
+    """
+    Minimal BehaviourInterface implementation which records the events it processes.
+
+    For each event, one output event is produced with the event's value.
+    """
+
+    interests: set[type[InputEvent]]
+    seen: list[InputEvent]
+
+    def __init__(self, *interests: type[InputEvent], delay: float = 0.0) -> None:
+        self.interests = set(interests)
+        self.seen = []
+        self.delay = delay
+
+    def add(self, component: Any) -> None:
+        """Components are not supported by this test behaviour."""
+
+    def consumes_inputs(self) -> set[type[InputEvent]]:
+        """The event types given when this behaviour was created."""
+        return self.interests
+
+    async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """Wait for the configured delay, then record the event and produce an output."""
+        await asyncio.sleep(self.delay)
+        self.seen.append(event)
+        yield RecordedOutputEvent(value=getattr(event, "value", 0))
+
+
+class RecordingOutput:
+    """
+    Minimal OutputInterface implementation which records the events it sends.
+
+    The output can be made slow, or made to raise an exception for every event.
+    """
+
+    sent: list[OutputEvent]
+
+    def __init__(self, delay: float = 0.0, fail: bool = False) -> None:
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Accepts the output events from the recording behaviour."""
+        return {RecordedOutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Wait for the configured delay, then record (or fail) the event."""
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("Output failed")
+        self.sent.append(event)
+        return True
+
+
+def make_runner(
+    behaviours: Iterable[BehaviourInterface],
+    outputs: Iterable[OutputInterface] = (),
+    config: Optional[RunnerConfig] = None,
+) -> BotRunner:
+    """Build a runner with the given behaviours and outputs, and no inputs."""
+
+    bot = Bot("TestBot")
+    for behaviour in behaviours:
+        bot.add_behaviour(behaviour)
+
+    output_map: dict[type[OutputEvent], set[OutputInterface]] = {}
+    for output in outputs:
+        for event_type in output.consumes_outputs():
+            output_map.setdefault(event_type, set()).add(output)
+
+    # pylint: disable=protected-access
+    return BotRunner(bot._marshal_behaviours(), set(), output_map, config)
+
+
+async def run_input_queue(runner: BotRunner, *events: InputEvent) -> None:
+    """Push the events through the runner's input processing, then stop it."""
+
+    for event in events:
+        await runner.input_event_queue.put(event)
+
+    task = asyncio.create_task(runner.process_input_queue())
+
+    await runner.input_event_queue.join()
+
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+class TestBotRunnerInputRouting:
+    """
+    Tests that input events are routed to the behaviours which consume them.
+    """
+
+    @staticmethod
+    async def test_events_routed_by_type() -> None:
+        """Behaviours receive events of their types and subtypes, and nothing else."""
+
+        parent = RecordingBehaviour(ParentEvent)
+        child = RecordingBehaviour(ChildEvent)
+        other = RecordingBehaviour(OtherEvent)
+        runner = make_runner([parent, child, other])
+
+        events = [ParentEvent(1), ChildEvent(2), OtherEvent()]
+        await run_input_queue(runner, *events)
+
+        assert parent.seen == events[:2]
+        assert child.seen == [events[1]]
+        assert other.seen == [events[2]]
+        assert runner.output_event_queue.qsize() == 4
+
+    @staticmethod
+    async def test_behaviour_with_overlapping_interests_runs_once() -> None:
+        """A behaviour interested in an event via two bases only processes it once."""
+
+        behaviour = RecordingBehaviour(ParentEvent, InputEvent)
+        runner = make_runner([behaviour])
+
+        await run_input_queue(runner, ChildEvent(1))
+
+        assert behaviour.seen == [ChildEvent(1)]
+
+    @staticmethod
+    async def test_reassigning_behaviours_rebuilds_dispatch() -> None:
+        """Replacing the behaviours mapping takes effect for already seen event types."""
+
+        first = RecordingBehaviour(ParentEvent)
+        second = RecordingBehaviour(ParentEvent)
+        runner = make_runner([first])
+
+        await run_input_queue(runner, ParentEvent(1))
+        runner.behaviours = {ParentEvent: {second}}
+        await run_input_queue(runner, ParentEvent(2))
+
+        assert first.seen == [ParentEvent(1)]
+        assert second.seen == [ParentEvent(2)]
+
+
+class TestBotRunnerInputWorkers:
+    """
+    Tests for processing input events with more than one worker.
+    """
+
+    @staticmethod
+    async def test_slow_behaviours_run_in_parallel() -> None:
+        """With a worker per event, slow events without a key are processed concurrently."""
+
+        behaviour = RecordingBehaviour(ParentEvent, delay=0.1)
+        runner = make_runner([behaviour], config=RunnerConfig(input_workers=4))
+
+        start = asyncio.get_running_loop().time()
+        await run_input_queue(runner, *(ParentEvent(i) for i in range(4)))
+        elapsed = asyncio.get_running_loop().time() - start
+
+        assert len(behaviour.seen) == 4
+        assert elapsed < 0.3
+
+    @staticmethod
+    async def test_events_with_same_key_stay_in_order() -> None:
+        """Events sharing a partition key are processed in order, other keys in parallel."""
+
+        behaviour = RecordingBehaviour(KeyedEvent, delay=0.02)
+        runner = make_runner([behaviour], config=RunnerConfig(input_workers=4))
+
+        events = [KeyedEvent(key, i) for i in range(5) for key in ("a", "b")]
+        start = asyncio.get_running_loop().time()
+        await run_input_queue(runner, *events)
+        elapsed = asyncio.get_running_loop().time() - start
+
+        for key in ("a", "b"):
+            expected = [event for event in events if event.key == key]
+            seen = [event for event in behaviour.seen if event.key == key]  # type: ignore
+            assert seen == expected
+
+        # The two keys are processed concurrently (10 events, but 5 sequential steps).
+        assert elapsed < 0.19
+
+    @staticmethod
+    def test_invalid_worker_count() -> None:
+        """There must be at least one input worker."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(input_workers=0)
+
+
+class TestBotRunnerQueues:
+    """
+    Tests for the bounds and overflow policies of the runner's queues.
+    """
+
+    @staticmethod
+    def test_queues_configured() -> None:
+        """The runner's queues use the sizes and policies from the config."""
+
+        config = RunnerConfig(
+            input_queue_size=10,
+            input_queue_policy="reject",
+            output_queue_size=20,
+            output_queue_policy="drop-oldest",
+        )
+        runner = make_runner([], config=config)
+
+        assert runner.input_event_queue.maxsize == 10
+        assert runner.input_event_queue.policy is OverflowPolicy.REJECT
+        assert runner.output_event_queue.maxsize == 20
+        assert runner.output_event_queue.policy is OverflowPolicy.DROP_OLDEST
+
+    @staticmethod
+    def test_invalid_policy() -> None:
+        """Unknown overflow policies are rejected when the config is created."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(output_queue_policy="sometimes")
+
+    @staticmethod
+    async def test_rejected_outputs_do_not_stop_processing() -> None:
+        """Outputs rejected by a full output queue are dropped; input processing continues."""
+
+        behaviour = RecordingBehaviour(ParentEvent)
+        config = RunnerConfig(output_queue_size=1, output_queue_policy="reject")
+        runner = make_runner([behaviour], config=config)
+
+        await run_input_queue(runner, ParentEvent(1), ParentEvent(2), ParentEvent(3))
+
+        assert len(behaviour.seen) == 3
+        assert runner.output_event_queue.qsize() == 1
+        assert runner.output_event_queue.rejected == 2
+
+    @staticmethod
+    def test_rate_limits_by_class_and_module() -> None:
+        """Outputs get the rate limit for their class, or their module."""
+
+        by_class = make_runner(
+            [],
+            config=RunnerConfig(
+                output_rate_limits={
+                    f"{RecordingOutput.__module__}.RecordingOutput": {"rate": 5, "burst": 3}
+                }
+            ),
+        )
+        by_module = make_runner(
+            [], config=RunnerConfig(output_rate_limits={__name__: {"rate": 1}})
+        )
+
+        # pylint: disable=protected-access
+        limiter = by_class._rate_limit(RecordingOutput())
+        assert limiter is not None and (limiter.rate, limiter.burst) == (5, 3)
+        assert by_module._rate_limit(RecordingOutput()) is not None
+        assert make_runner([])._rate_limit(RecordingOutput()) is None
+
+    @staticmethod
+    def test_invalid_rate_limits() -> None:
+        """Rate limits are checked when the config is created."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(output_rate_limits={__name__: {"burst": 2}})
+
+    @staticmethod
+    async def test_output_batches_passed_to_lanes() -> None:
+        """Lanes for outputs are given the configured batch size, if they can use it."""
+
+        config = RunnerConfig(output_batch_size=5, output_batch_wait=0.1)
+        runner = make_runner([], config=config)
+
+        # pylint: disable=protected-access
+        lane = runner._output_lane(RecordingOutput())
+        await lane.stop()
+
+        assert lane.batch_size == 1
+        assert lane.batch_wait == 0.1
+
+        with pytest.raises(ValueError):
+            RunnerConfig(output_batch_size=0)
+
+
+class TestBotRunnerPriorities:
+    """
+    Tests for serving input events from priority lanes.
+    """
+
+    @staticmethod
+    async def test_priority_events_overtake_bulk_events() -> None:
+        """Events in the high priority lane are processed ahead of queued bulk events."""
+
+        behaviour = RecordingBehaviour(ParentEvent, OtherEvent)
+        config = RunnerConfig(
+            priority_weights=[4, 1],
+            event_priorities={f"{ParentEvent.__module__}.ParentEvent": 1},
+        )
+        runner = make_runner([behaviour], config=config)
+
+        bulk = [ParentEvent(i) for i in range(10)]
+        await run_input_queue(runner, *bulk, OtherEvent())
+
+        assert behaviour.seen.index(OtherEvent()) == 0
+        assert [event for event in behaviour.seen if event in bulk] == bulk
+
+    @staticmethod
+    def test_priorities_inherited_and_by_module() -> None:
+        """Subclasses use their base class's lane, and modules can be given a lane."""
+
+        config = RunnerConfig(
+            priority_weights=[1, 1, 1],
+            event_priorities={f"{ParentEvent.__module__}.ParentEvent": 2, __name__: 1},
+        )
+        runner = make_runner([], config=config)
+
+        # pylint: disable=protected-access
+        assert runner._input_priority(ChildEvent()) == 2
+        assert runner._input_priority(OtherEvent()) == 1
+        assert runner._input_priority(InputEvent()) == 0
+
+    @staticmethod
+    def test_single_lane_by_default() -> None:
+        """Without priority weights, the input queue is a plain FIFO."""
+
+        assert make_runner([]).input_event_queue.lanes is None
+
+    @staticmethod
+    def test_invalid_priorities() -> None:
+        """Priorities must refer to a configured lane."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(priority_weights=[2, 1], event_priorities={"mewbot.io.rss": 2})
+        with pytest.raises(ValueError):
+            RunnerConfig(priority_weights=[])
+
+
+class TestBotRunnerDedup:
+    """
+    Tests for dropping redelivered input events before they reach behaviours.
+    """
+
+    @staticmethod
+    async def test_duplicates_not_processed() -> None:
+        """With deduplication configured, behaviours see each event once."""
+
+        behaviour = RecordingBehaviour(ParentEvent)
+        runner = make_runner([behaviour], config=RunnerConfig(dedup_size=100))
+
+        events = [RedeliveredEvent(value) for value in (1, 2, 1, 3, 2)]
+        await run_input_queue(runner, *events)
+
+        assert behaviour.seen == [
+            RedeliveredEvent(1),
+            RedeliveredEvent(2),
+            RedeliveredEvent(3),
+        ]
+        assert runner.input_event_queue.duplicates == 2
+
+    @staticmethod
+    def test_off_by_default() -> None:
+        """Without a dedup_size, there is no index, and no events are discarded."""
+
+        assert make_runner([]).input_event_queue.dedup is None
+
+    @staticmethod
+    def test_invalid_dedup() -> None:
+        """The index size can not be negative, and keys must be kept for some time."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(dedup_size=-1)
+        with pytest.raises(ValueError):
+            RunnerConfig(dedup_size=10, dedup_ttl=0)
+
+
+async def run_output_queue(runner: BotRunner, *events: OutputEvent) -> None:
+    """Push the events through the runner's output processing, and wait for delivery."""
+
+    for event in events:
+        await runner.output_event_queue.put(event)
+
+    task = asyncio.create_task(runner.process_output_queue())
+
+    report = await runner.drain(5)
+    assert not report.timed_out
+
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+class TestBotRunnerOutputRouting:
+    """
+    Tests that output events are delivered to the outputs which consume them.
+    """
+
+    @staticmethod
+    async def test_events_delivered_in_order() -> None:
+        """Each output receives all the events for it, in the order they were produced."""
+
+        first, second = RecordingOutput(), RecordingOutput()
+        runner = make_runner([], [first, second])
+
+        events = [RecordedOutputEvent(i) for i in range(5)]
+        await run_output_queue(runner, *events, OutputEvent())
+
+        assert first.sent == events
+        assert second.sent == events
+
+    @staticmethod
+    async def test_failing_output_is_isolated() -> None:
+        """An output raising exceptions does not stop delivery to other outputs."""
+
+        failing, working = RecordingOutput(fail=True), RecordingOutput()
+        runner = make_runner([], [failing, working])
+
+        events = [RecordedOutputEvent(i) for i in range(3)]
+        await run_output_queue(runner, *events)
+
+        assert not failing.sent
+        assert working.sent == events
+
+    @staticmethod
+    async def test_slow_output_does_not_delay_others() -> None:
+        """A fast output finishes its events while a slow output is still sending."""
+
+        slow, fast = RecordingOutput(delay=0.2), RecordingOutput()
+        runner = make_runner([], [slow, fast])
+
+        task = asyncio.create_task(run_output_queue(runner, RecordedOutputEvent(1)))
+        await asyncio.sleep(0.05)
+
+        assert fast.sent == [RecordedOutputEvent(1)]
+        assert not slow.sent
+
+        await task
+        assert slow.sent == [RecordedOutputEvent(1)]
+
+
+class FailingBehaviour(RecordingBehaviour):
+    """Recording behaviour which raises an exception for the events with given values."""
+
+    def __init__(self, *interests: type[InputEvent], fail: Iterable[int] = ()) -> None:
+        super().__init__(*interests)
+        self.fail = set(fail)
+
+    async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """Fail for the chosen values (once each), otherwise record the event."""
+        value = getattr(event, "value", 0)
+        if value in self.fail:
+            self.fail.discard(value)
+            raise RuntimeError(f"Can not process {value}")
+
+        async for output in super().process(event):
+            yield output
+
+
+class TestBotRunnerFailures:
+    """
+    Tests that failing behaviours do not stop the runner, and that failures are kept.
+    """
+
+    @staticmethod
+    async def test_failing_behaviour_dead_lettered() -> None:
+        """Events a behaviour fails are kept, and the following events are still processed."""
+
+        failing = FailingBehaviour(ParentEvent, fail=[1])
+        runner = make_runner([failing], config=RunnerConfig(dead_letter_size=10))
+
+        await run_input_queue(runner, *(ParentEvent(i) for i in range(3)))
+
+        assert failing.seen == [ParentEvent(0), ParentEvent(2)]
+        assert runner.inputs_processed == 3
+        assert runner.behaviour_failures == 1
+
+        assert runner.dead_letters is not None
+        [letter] = runner.dead_letters.letters()
+        assert (letter.event, letter.stage) == (ParentEvent(1), "behaviour")
+        assert "Can not process 1" in letter.error
+
+    @staticmethod
+    async def test_replay_goes_to_failed_behaviour() -> None:
+        """Replayed events are only processed by the behaviour which failed them."""
+
+        failing = FailingBehaviour(ParentEvent, fail=[1])
+        working = RecordingBehaviour(ParentEvent)
+        runner = make_runner([failing, working], config=RunnerConfig(dead_letter_size=10))
+
+        await run_input_queue(runner, ParentEvent(1))
+        assert await runner.replay_dead_letters() == 1
+
+        assert failing.seen == [ParentEvent(1)]
+        assert working.seen == [ParentEvent(1)]
+        assert runner.dead_letters is not None and not runner.dead_letters.letters()
+
+    @staticmethod
+    def test_invalid_dead_letter_settings() -> None:
+        """A dead-letter path needs a size, and the retry settings can not be negative."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(dead_letter_path="dead-letters.db")
+        with pytest.raises(ValueError):
+            RunnerConfig(output_retries=-1)
+
+
+class TestBotRunnerDrain:
+    """
+    Tests for draining the queues when the runner stops.
+    """
+
+    @staticmethod
+    async def test_drain_processes_and_sends_queued_events() -> None:
+        """Queued input events are processed, and their outputs sent, before drain returns."""
+
+        output = RecordingOutput()
+        runner = make_runner([RecordingBehaviour(ParentEvent)], [output])
+
+        for i in range(3):
+            await runner.input_event_queue.put(ParentEvent(i))
+
+        tasks = [
+            asyncio.create_task(runner.process_input_queue()),
+            asyncio.create_task(runner.process_output_queue()),
+        ]
+        report = await runner.drain(5)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert report == DrainReport(inputs_processed=3, outputs_sent=3)
+        assert [event.value for event in output.sent] == [0, 1, 2]  # type: ignore
+
+    @staticmethod
+    async def test_drain_timeout_reports_dropped_events() -> None:
+        """Events still queued when the drain times out are reported as dropped."""
+
+        runner = make_runner([RecordingBehaviour(ParentEvent, delay=10)])
+
+        for i in range(3):
+            await runner.input_event_queue.put(ParentEvent(i))
+
+        task = asyncio.create_task(runner.process_input_queue())
+        report = await runner.drain(0.05)
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        # One event is being processed by the only worker; two have not been started.
+        assert report == DrainReport(inputs_dropped=3, timed_out=True)
+
+    @staticmethod
+    async def test_drain_returns_immediately_when_idle() -> None:
+        """An idle runner drains without waiting for a poll interval."""
+
+        runner = make_runner([RecordingBehaviour(ParentEvent)], [RecordingOutput()])
+        tasks = [
+            asyncio.create_task(runner.process_input_queue()),
+            asyncio.create_task(runner.process_output_queue()),
+        ]
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        report = await runner.drain(5)
+        elapsed = loop.time() - start
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert report == DrainReport()
+        assert elapsed < 0.1
+
+
+class BatchRecordingBehaviour(RecordingBehaviour):
+    """Recording behaviour which also records the batches it is given."""
+
+    batches: list[list[InputEvent]]
+
+    def __init__(self, *interests: type[InputEvent], delay: float = 0.0) -> None:
+        super().__init__(*interests, delay=delay)
+        self.batches = []
+
+    async def process_batch(self, events: Sequence[InputEvent]) -> AsyncIterable[OutputEvent]:
+        """Record the batch, then process the events in turn."""
+        self.batches.append(list(events))
+        for event in events:
+            async for output in self.process(event):
+                yield output
+
+
+class TestBotRunnerBatches:
+    """
+    Tests for passing batches of input events to behaviours.
+    """
+
+    @staticmethod
+    async def test_batches_passed_to_batch_behaviours() -> None:
+        """Behaviours with process_batch receive the queued events together, in order."""
+
+        batched = BatchRecordingBehaviour(ParentEvent)
+        single = RecordingBehaviour(ParentEvent)
+        runner = make_runner([batched, single], config=RunnerConfig(batch_size=4))
+
+        events = [ParentEvent(i) for i in range(6)]
+        await run_input_queue(runner, *events, OtherEvent())
+
+        assert batched.batches == [events[:4], events[4:]]
+        assert single.seen == events
+        assert runner.inputs_processed == 7
+
+    @staticmethod
+    async def test_batch_waits_for_events() -> None:
+        """A worker waits up to batch_wait for more events before processing a batch."""
+
+        batched = BatchRecordingBehaviour(ParentEvent)
+        config = RunnerConfig(batch_size=10, batch_wait=0.1)
+        runner = make_runner([batched], config=config)
+
+        async def produce() -> None:
+            for i in range(3):
+                await runner.input_event_queue.put(ParentEvent(i))
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(produce(), run_input_queue(runner))
+
+        assert [len(batch) for batch in batched.batches] == [3]
+
+    @staticmethod
+    async def test_batches_keep_partition_order() -> None:
+        """Events for a key held by another worker are processed after it, in order."""
+
+        behaviour = BatchRecordingBehaviour(KeyedEvent, delay=0.01)
+        config = RunnerConfig(input_workers=4, batch_size=2)
+        runner = make_runner([behaviour], config=config)
+
+        events = [KeyedEvent(str(i % 3), i) for i in range(12)]
+        await run_input_queue(runner, *events)
+
+        for key in "012":
+            seen = [event.value for event in behaviour.seen if event.key == key]  # type: ignore
+            assert seen == [event.value for event in events if event.key == key]
+
+
+class TestBotRunnerScheduling:
+    """
+    Tests for running behaviours as independent tasks with in-flight limits.
+    """
+
+    @staticmethod
+    async def test_slow_behaviour_does_not_hold_up_others() -> None:
+        """A fast behaviour finishes all its events while a slow one is still working."""
+
+        slow = RecordingBehaviour(ParentEvent, delay=0.1)
+        fast = RecordingBehaviour(ParentEvent)
+        runner = make_runner([slow, fast], config=RunnerConfig(behaviour_concurrency=10))
+
+        task = asyncio.create_task(
+            run_input_queue(runner, *(ParentEvent(i) for i in range(5)))
+        )
+        await asyncio.sleep(0.05)
+
+        assert len(fast.seen) == 5
+        assert not slow.seen
+
+        await task
+        assert len(slow.seen) == 5
+        assert runner.inputs_processed == 5
+
+    @staticmethod
+    async def test_saturated_behaviour_applies_backpressure() -> None:
+        """Workers wait while a behaviour is at its limit, and its buffer is full."""
+
+        slow = RecordingBehaviour(ParentEvent, delay=0.05)
+        config = RunnerConfig(behaviour_concurrency=2)
+        runner = make_runner([slow], config=config)
+
+        for i in range(6):
+            await runner.input_event_queue.put(ParentEvent(i))
+
+        task = asyncio.create_task(runner.process_input_queue())
+        await asyncio.sleep(0.01)
+
+        # Two in flight, two in the buffer, and one with the worker, waiting for room.
+        assert runner.input_event_queue.qsize() == 1
+
+        report = await runner.drain(5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert report.inputs_processed == 6
+        assert len(slow.seen) == 6
+
+    @staticmethod
+    async def test_saturated_behaviour_does_not_block_other_events() -> None:
+        """Events for other behaviours are processed while one behaviour's buffer is full."""
+
+        slow = RecordingBehaviour(ParentEvent, delay=0.2)
+        fast = RecordingBehaviour(OtherEvent)
+        config = RunnerConfig(behaviour_concurrency=1)
+        runner = make_runner([slow, fast], config=config)
+
+        # One event in flight for the slow behaviour, and one in its buffer.
+        for i in range(2):
+            await runner.input_event_queue.put(ParentEvent(i))
+        for _ in range(3):
+            await runner.input_event_queue.put(OtherEvent())
+
+        task = asyncio.create_task(runner.process_input_queue())
+        await asyncio.sleep(0.05)
+
+        assert len(fast.seen) == 3
+        assert not slow.seen
+
+        await runner.input_event_queue.join()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert runner.inputs_processed == 5
+        assert len(slow.seen) == 2
+
+    @staticmethod
+    async def test_keyed_events_stay_in_order() -> None:
+        """Events with the same key are processed in order by each behaviour."""
+
+        behaviour = RecordingBehaviour(KeyedEvent, delay=0.01)
+        config = RunnerConfig(input_workers=2, behaviour_concurrency=10)
+        runner = make_runner([behaviour], config=config)
+
+        events = [KeyedEvent("a", i) for i in range(5)]
+        await run_input_queue(runner, *events)
+
+        assert behaviour.seen == events
+
+    @staticmethod
+    def test_limits_by_name() -> None:
+        """Behaviours can be given their own limit by name."""
+
+        class NamedBehaviour(RecordingBehaviour):
+            """Recording behaviour with a name."""
+
+            name = "Named"
+
+        named, unnamed = NamedBehaviour(ParentEvent), RecordingBehaviour(ParentEvent)
+        config = RunnerConfig(behaviour_concurrency=4, behaviour_limits={"Named": 1})
+        runner = make_runner([named, unnamed], config=config)
+
+        # pylint: disable=protected-access
+        assert runner._scheduler(named).limit == 1
+        assert runner._scheduler(unnamed).limit == 4
+
+    @staticmethod
+    def test_limits_require_concurrency() -> None:
+        """Per-behaviour limits can only be given when scheduling is enabled."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(behaviour_limits={"Named": 1})
+
+
+class TestBotRunnerEventLoop:
+    """
+    Tests for choosing the event loop the runner runs on.
+    """
+
+    @staticmethod
+    def test_uvloop_used_when_installed(monkeypatch: pytest.MonkeyPatch) -> None:
+        """When uvloop is installed, asking for it (or auto) gives a new uvloop loop."""
+
+        loops: list[asyncio.AbstractEventLoop] = []
+
+        def new_event_loop() -> asyncio.AbstractEventLoop:
+            loops.append(asyncio.new_event_loop())
+            return loops[-1]
+
+        fake_uvloop = type("uvloop", (), {"new_event_loop": staticmethod(new_event_loop)})
+        monkeypatch.setattr("mewbot.bot.uvloop", fake_uvloop)
+
+        try:
+            for kind in ("uvloop", "auto"):
+                runner = make_runner([], config=RunnerConfig(event_loop=kind))
+                assert runner.event_loop() is loops[-1]
+        finally:
+            asyncio.set_event_loop(None)
+            for loop in loops:
+                loop.close()
+
+    @staticmethod
+    def test_fallback_without_uvloop(
+        monkeypatch: pytest.MonkeyPatch, caplog: pytest.LogCaptureFixture
+    ) -> None:
+        """Without uvloop, the asyncio loop is used, with a warning if uvloop was asked for."""
+
+        monkeypatch.setattr("mewbot.bot.uvloop", None)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        try:
+            runner = make_runner([], config=RunnerConfig(event_loop="auto"))
+            assert runner.event_loop() is loop
+            assert "uvloop" not in caplog.text
+
+            runner = make_runner([], config=RunnerConfig(event_loop="uvloop"))
+            assert runner.event_loop() is loop
+            assert "uvloop is not installed" in caplog.text
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    @staticmethod
+    def test_invalid_event_loop() -> None:
+        """Only the known event loops can be configured."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(event_loop="trio")
+
+
+class WaitingInput:
+    """Minimal InputInterface implementation which waits until it is cancelled."""
+
+    queue: Optional[Any] = None
+
+    @staticmethod
+    def produces_inputs() -> set[type[InputEvent]]:
+        """Produces no particular events."""
+        return {ParentEvent}
+
+    def bind(self, queue: Any) -> None:
+        """Keep the queue."""
+        self.queue = queue
+
+    async def run(self) -> None:
+        """Wait forever."""
+        await asyncio.Event().wait()
+
+
+class TestBotRunnerReload:
+    """
+    Tests for swapping a running bot's components.
+    """
+
+    @staticmethod
+    async def test_reload_swaps_behaviours_and_inputs() -> None:
+        """New behaviours get the events; unchanged inputs keep running."""
+
+        old, new = RecordingBehaviour(ParentEvent), RecordingBehaviour(ParentEvent)
+        kept, removed, added = WaitingInput(), WaitingInput(), WaitingInput()
+
+        runner = BotRunner({ParentEvent: {old}}, {kept, removed}, {})
+        started = runner.setup_tasks(asyncio.get_running_loop())
+
+        # pylint: disable=protected-access
+        kept_task = runner._input_tasks[kept]
+
+        runner.reload({ParentEvent: {new}}, {kept, added}, {})
+        await asyncio.sleep(0)
+
+        assert runner._input_tasks[kept] is kept_task
+        assert not kept_task.cancelled()
+        assert [task.cancelled() for task in started].count(True) == 1
+        assert removed not in runner._input_tasks
+        assert added.queue is runner.input_event_queue
+
+        await run_input_queue(runner, ParentEvent(1))
+        assert not old.seen
+        assert len(new.seen) == 1
+
+        for task in runner._input_tasks.values():
+            task.cancel()
+
+    @staticmethod
+    async def test_removed_outputs_finish_their_events() -> None:
+        """The lanes of removed outputs send their queued events, then stop."""
+
+        output = RecordingOutput(delay=0.01)
+        runner = make_runner([], [output])
+
+        await runner.output_event_queue.put(RecordedOutputEvent(value=1))
+        task = asyncio.create_task(runner.process_output_queue())
+        await asyncio.sleep(0)
+
+        runner.reload({}, set(), {})
+        await asyncio.sleep(0.05)
+
+        assert [event.value for event in output.sent] == [1]  # type: ignore
+        assert not runner._output_lanes  # pylint: disable=protected-access
+
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    @staticmethod
+    async def test_removed_behaviours_finish_their_events() -> None:
+        """The schedulers of removed behaviours process their events, then stop."""
+
+        behaviour = RecordingBehaviour(ParentEvent, delay=0.05)
+        runner = BotRunner(
+            {ParentEvent: {behaviour}}, set(), {}, RunnerConfig(behaviour_concurrency=2)
+        )
+        task = asyncio.create_task(runner.process_input_queue())
+
+        await runner.input_event_queue.put(ParentEvent(1))
+        await asyncio.sleep(0.01)
+
+        runner.reload({}, set(), {})
+        assert not runner._schedulers  # pylint: disable=protected-access
+        await asyncio.sleep(0.1)
+
+        assert behaviour.seen == [ParentEvent(1)]
+        assert not runner._closing_schedulers  # pylint: disable=protected-access
+
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+    @staticmethod
+    def test_failed_reload_is_logged(caplog: pytest.LogCaptureFixture) -> None:
+        """A reloader which fails leaves the runner as it was."""
+
+        def reloader() -> None:
+            raise ValueError("Bad YAML")
+
+        runner = make_runner([])
+        runner.reloader = reloader
+        runner.reload_config()
+
+        assert "Reload failed" in caplog.text
@@ -11,6 +11,12 @@ In particular, that the interfaces for the various components match expectations
 
 from __future__ import annotations
 
+from collections.abc import Hashable
+
+import asyncio
+import dataclasses
+import time
+
 import pytest
 
 from mewbot.core import (
@@ -18,7 +24,12 @@ from mewbot.core import (
     BehaviourInterface,
     ComponentKind,
     ConditionInterface,
+    DedupIndex,
+    InputEvent,
+    InputQueue,
     IOConfigInterface,
+    OverflowPolicy,
+    PriorityLanes,
     TriggerInterface,
 )
 
@@ -124,3 +135,258 @@ class TestComponent:
         values = ComponentKind.values()
         assert isinstance(values, list)
         assert "Behaviour" in values
+
+
+@dataclasses.dataclass
+class NumberedEvent(InputEvent):
+    """Input event used to check which events were kept by a queue."""
+
+    number: int
+
+
+class TestEventQueue:
+    """
+    Tests for the overflow policies of the bounded event queues.
+    """
+
+    @staticmethod
+    async def fill(queue: InputQueue, count: int) -> None:
+        """Put numbered events onto the queue."""
+        for number in range(count):
+            await queue.put(NumberedEvent(number))
+
+    @staticmethod
+    def contents(queue: InputQueue) -> list[int]:
+        """Take all events off the queue, returning their numbers."""
+        numbers = []
+        while not queue.empty():
+            event = queue.get_nowait()
+            assert isinstance(event, NumberedEvent)
+            numbers.append(event.number)
+        return numbers
+
+    async def test_unbounded_by_default(self) -> None:
+        """A queue with no size never applies its policy."""
+
+        queue = InputQueue(policy=OverflowPolicy.REJECT)
+        await self.fill(queue, 100)
+
+        assert queue.qsize() == 100
+        assert queue.dropped == queue.rejected == 0
+
+    async def test_drop_oldest(self) -> None:
+        """The oldest events are discarded to make room for new ones."""
+
+        queue = InputQueue(3, "drop-oldest")
+        await self.fill(queue, 5)
+
+        assert self.contents(queue) == [2, 3, 4]
+        assert queue.dropped == 2
+
+    async def test_drop_oldest_keeps_join_balanced(self) -> None:
+        """Dropped events count as done, so join() does not wait for them."""
+
+        queue = InputQueue(1, "drop-oldest")
+        await self.fill(queue, 3)
+        queue.get_nowait()
+        queue.task_done()
+
+        await asyncio.wait_for(queue.join(), 1)
+
+    async def test_drop_newest(self) -> None:
+        """New events are discarded while the queue is full."""
+
+        queue = InputQueue(3, "drop-newest")
+        await self.fill(queue, 5)
+
+        assert self.contents(queue) == [0, 1, 2]
+        assert queue.dropped == 2
+
+    async def test_reject(self) -> None:
+        """New events raise QueueFull to the producer while the queue is full."""
+
+        queue = InputQueue(2, OverflowPolicy.REJECT)
+        await self.fill(queue, 2)
+
+        with pytest.raises(asyncio.QueueFull):
+            await queue.put(NumberedEvent(2))
+
+        assert self.contents(queue) == [0, 1]
+        assert queue.rejected == 1
+
+    async def test_block(self) -> None:
+        """Producers wait for space on a blocking queue."""
+
+        queue = InputQueue(1, OverflowPolicy.BLOCK)
+        await self.fill(queue, 1)
+
+        put = asyncio.create_task(queue.put(NumberedEvent(1)))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+
+        assert self.contents(queue) == [0]
+        await put
+        assert self.contents(queue) == [1]
+
+    @staticmethod
+    def test_invalid_policy() -> None:
+        """Unknown policies are rejected."""
+
+        with pytest.raises(ValueError):
+            InputQueue(1, "drop-random")
+
+
+def odd_events_low_priority(event: InputEvent) -> int:
+    """Puts odd numbered events in lane 1, and even numbered events in lane 0."""
+    assert isinstance(event, NumberedEvent)
+    return event.number % 2
+
+
+class TestPriorityLanes:
+    """
+    Tests for event queues with priority lanes.
+    """
+
+    @staticmethod
+    def test_weighted_round_robin() -> None:
+        """Lanes are served by weight while both have events, then whatever remains."""
+
+        queue = InputQueue(lanes=PriorityLanes([3, 1], odd_events_low_priority))
+        for number in range(12):
+            queue.put_nowait(NumberedEvent(number))
+
+        assert queue.qsize() == 12
+        assert TestEventQueue.contents(queue) == [0, 2, 4, 1, 6, 8, 10, 3, 5, 7, 9, 11]
+
+    @staticmethod
+    def test_drop_oldest_takes_lowest_priority() -> None:
+        """When full, the oldest event in the lowest priority lane is dropped first."""
+
+        lanes = PriorityLanes([1, 1], odd_events_low_priority)
+        queue = InputQueue(3, "drop-oldest", lanes)
+        for number in (0, 1, 2, 4, 6):
+            queue.put_nowait(NumberedEvent(number))
+
+        assert lanes.lane_sizes() == [3, 0]
+        assert TestEventQueue.contents(queue) == [2, 4, 6]
+
+    @staticmethod
+    def test_invalid_weights() -> None:
+        """Lanes must all have a positive weight."""
+
+        with pytest.raises(ValueError):
+            PriorityLanes([2, 0], odd_events_low_priority)
+
+
+@dataclasses.dataclass
+class KeyedEvent(NumberedEvent):
+    """Numbered event which is a duplicate of any other with the same number."""
+
+    def dedup_key(self) -> Hashable:
+        """Events are identified by their number."""
+        return self.number
+
+
+class TestDedup:
+    """
+    Tests for discarding input events which have been seen recently.
+    """
+
+    @staticmethod
+    def test_index_counts_hits_and_misses() -> None:
+        """Keys already in the index are hits; new keys are misses, and are added."""
+
+        index = DedupIndex(10, 60)
+
+        assert [index.seen(key) for key in ("a", "b", "a", "a")] == [False, False, True, True]
+        assert index.stats() == {"hits": 2, "misses": 2, "evicted": 0, "size": 2}
+
+    @staticmethod
+    def test_index_is_bounded() -> None:
+        """The oldest keys are forgotten to keep the index within its size."""
+
+        index = DedupIndex(2, 60)
+        for key in (1, 2, 3):
+            index.seen(key)
+
+        assert len(index) == 2
+        assert index.evicted == 1
+        assert not index.seen(1)
+
+    @staticmethod
+    def test_index_keys_expire() -> None:
+        """Keys are forgotten once their ttl has passed."""
+
+        index = DedupIndex(10, 0.01)
+        index.seen("a")
+        time.sleep(0.02)
+
+        assert not index.seen("a")
+        assert len(index) == 1
+
+    @staticmethod
+    def test_invalid_index() -> None:
+        """The index must have room for a key, and keep keys for some time."""
+
+        with pytest.raises(ValueError):
+            DedupIndex(0, 60)
+        with pytest.raises(ValueError):
+            DedupIndex(10, 0)
+
+    @staticmethod
+    async def test_queue_discards_duplicates() -> None:
+        """Duplicate events are not queued; events without a key always are."""
+
+        queue = InputQueue(dedup=DedupIndex(10, 60))
+        for event in (KeyedEvent(1), KeyedEvent(2), KeyedEvent(1), NumberedEvent(1)):
+            await queue.put(event)
+        queue.put_nowait(KeyedEvent(2))
+
+        assert TestEventQueue.contents(queue) == [1, 2, 1]
+        assert queue.duplicates == 2
+
+    @staticmethod
+    async def test_rejected_events_not_remembered() -> None:
+        """An event the queue rejected is accepted when it is delivered again."""
+
+        queue = InputQueue(1, "reject", dedup=DedupIndex(10, 60))
+        await queue.put(KeyedEvent(1))
+
+        with pytest.raises(asyncio.QueueFull):
+            await queue.put(KeyedEvent(2))
+
+        queue.get_nowait()
+        await queue.put(KeyedEvent(2))
+
+        assert TestEventQueue.contents(queue) == [2]
+        assert queue.duplicates == 0
+
+    @staticmethod
+    async def test_dropped_newest_events_not_remembered() -> None:
+        """A new event the queue dropped is accepted when it is delivered again."""
+
+        queue = InputQueue(1, "drop-newest", dedup=DedupIndex(10, 60))
+        await queue.put(KeyedEvent(1))
+        await queue.put(KeyedEvent(2))
+
+        queue.get_nowait()
+        await queue.put(KeyedEvent(2))
+
+        assert TestEventQueue.contents(queue) == [2]
+        assert queue.dropped == 1
+        assert queue.duplicates == 0
+
+    @staticmethod
+    async def test_dropped_oldest_events_not_remembered() -> None:
+        """An old event the queue dropped is accepted when it is delivered again."""
+
+        queue = InputQueue(1, "drop-oldest", dedup=DedupIndex(10, 60))
+        await queue.put(KeyedEvent(1))
+        await queue.put(KeyedEvent(2))
+
+        queue.get_nowait()
+        await queue.put(KeyedEvent(1))
+
+        assert TestEventQueue.contents(queue) == [1]
+        assert queue.dropped == 1
+        assert queue.duplicates == 0
@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for keeping the events a bot failed to handle in the dead-letter store.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import pathlib
+
+import pytest
+
+from mewbot.core import OutputEvent
+from mewbot.deadletter import DeadLetter, DeadLetterStore
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+@dataclasses.dataclass
+class FailedEvent(OutputEvent):
+    """Output event which an output failed to send."""
+
+    value: int = 0
+
+
+def letter(value: int) -> DeadLetter:
+    """A dead letter for a failed output event."""
+    return DeadLetter(FailedEvent(value), "output", "FailingOutput", "RuntimeError()")
+
+
+class TestDeadLetterStore:
+    """
+    Tests for adding, inspecting, and taking dead letters.
+    """
+
+    @staticmethod
+    def test_oldest_letters_evicted() -> None:
+        """The store keeps the newest letters, up to its size."""
+
+        store = DeadLetterStore(2)
+        for value in range(3):
+            store.add(letter(value))
+
+        assert [item.event for item in store.letters()] == [FailedEvent(1), FailedEvent(2)]
+        assert store.stats() == {"size": 2, "added": 3, "evicted": 1}
+
+    @staticmethod
+    def test_take_removes_letters() -> None:
+        """Letters can be taken by id, or all at once."""
+
+        store = DeadLetterStore(5)
+        ids = [store.add(letter(value)).id for value in range(3)]
+
+        assert [item.id for item in store.take([ids[1], 99])] == [ids[1]]
+        assert [item.id for item in store.take()] == [ids[0], ids[2]]
+        assert not store
+
+    @staticmethod
+    def test_letters_kept_across_restarts(tmp_path: pathlib.Path) -> None:
+        """With a path, letters are reloaded by the next store, and taken letters are not."""
+
+        path = str(tmp_path / "dead-letters.db")
+
+        store = DeadLetterStore(5, path)
+        for value in range(3):
+            store.add(letter(value))
+        store.take([store.letters()[0].id])
+        store.close()
+
+        store = DeadLetterStore(2, path)
+        assert [item.event for item in store.letters()] == [FailedEvent(1), FailedEvent(2)]
+        assert store.add(letter(3)).id == 4
+        store.close()
+
+    @staticmethod
+    def test_invalid_size() -> None:
+        """The store must hold at least one letter."""
+
+        with pytest.raises(ValueError):
+            DeadLetterStore(0)
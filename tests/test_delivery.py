@@ -0,0 +1,399 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the per-output delivery lanes.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+
+import asyncio
+import time
+
+import pytest
+
+from mewbot.api.v1 import Output
+from mewbot.core import OutputEvent
+from mewbot.deadletter import DeadLetterStore
+from mewbot.delivery import (
+    CircuitBreaker,
+    CircuitState,
+    OutputLane,
+    RetryPolicy,
+    TokenBucket,
+)
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+class CountingOutput:
+    """Output which accepts every other event, and raises on the third."""
+
+    calls: int
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Accepts all output events."""
+        return {OutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Alternates between sending and rejecting; fails on the third call."""
+        self.calls += 1
+        if self.calls == 3:
+            raise ValueError("Third time unlucky")
+        return self.calls % 2 == 1
+
+
+class TestOutputLane:
+    """
+    Tests for delivering events through an OutputLane.
+    """
+
+    @staticmethod
+    async def test_outcomes_are_counted() -> None:
+        """Sent, rejected, and failed events are counted, and failures do not stop the lane."""
+
+        output = CountingOutput()
+        lane = OutputLane(output)
+        lane.start()
+
+        for _ in range(5):
+            await lane.put(OutputEvent())
+        await lane.close()
+
+        assert output.calls == 5
+        assert lane.delivered == 2
+        assert lane.rejected == 2
+        assert lane.failed == 1
+        assert lane.pending == 0
+
+
+class TestTokenBucket:
+    """
+    Tests for the token bucket rate limit.
+    """
+
+    @staticmethod
+    def test_burst_then_rate() -> None:
+        """A full bucket allows a burst at once; later events wait for the rate."""
+
+        bucket = TokenBucket(rate=10, burst=3)
+        waits = [bucket.reserve() for _ in range(5)]
+
+        assert waits[:3] == [0.0, 0.0, 0.0]
+        assert waits[3] == pytest.approx(0.1, abs=0.01)
+        assert waits[4] == pytest.approx(0.2, abs=0.01)
+
+    @staticmethod
+    def test_max_wait_refuses() -> None:
+        """Events which would wait longer than max_wait are refused, without taking a token."""
+
+        bucket = TokenBucket(rate=10, burst=1, max_wait=0.15)
+
+        assert [bucket.reserve() is None for _ in range(4)] == [False, False, True, True]
+        assert bucket.tokens == pytest.approx(-1, abs=0.1)
+
+    @staticmethod
+    def test_from_config() -> None:
+        """Limits from the config need a rate, and only known settings."""
+
+        assert TokenBucket.from_config({"rate": 5, "burst": 2}).burst == 2
+
+        for limit in ({"burst": 2}, {"rate": 5, "brust": 2}, {"rate": 0}):
+            with pytest.raises(ValueError):
+                TokenBucket.from_config(limit)
+
+
+class TestRateLimitedLane:
+    """
+    Tests for delivering events through a lane with a rate limit.
+    """
+
+    @staticmethod
+    async def test_events_wait_for_tokens() -> None:
+        """Events beyond the burst are sent at the limit's rate."""
+
+        output = CountingOutput()
+        lane = OutputLane(output, limiter=TokenBucket(rate=50, burst=2))
+        lane.start()
+
+        start = time.monotonic()
+        for _ in range(4):
+            await lane.put(OutputEvent())
+        await lane.close()
+
+        assert output.calls == 4
+        assert lane.throttled == 0
+        assert time.monotonic() - start >= 0.035
+
+    @staticmethod
+    async def test_events_dropped_past_max_wait() -> None:
+        """With no waiting allowed, events beyond the burst are dropped and counted."""
+
+        output = CountingOutput()
+        lane = OutputLane(output, limiter=TokenBucket(rate=1, burst=2, max_wait=0))
+        lane.start()
+
+        for _ in range(5):
+            await lane.put(OutputEvent())
+        await lane.close()
+
+        assert output.calls == 2
+        assert lane.throttled == 3
+
+
+class BatchingOutput:
+    """Output which records the size of each batch of events it is given."""
+
+    batches: list[int]
+
+    def __init__(self) -> None:
+        self.batches = []
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Accepts all output events."""
+        return {OutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Sends one event, as a batch of one."""
+        return await self.output_many([event])
+
+    async def output_many(self, events: Sequence[OutputEvent]) -> bool:
+        """Records the size of the batch."""
+        self.batches.append(len(events))
+        return True
+
+
+class CountingV1Output(Output):
+    """Version 1 output which only implements sending one event at a time."""
+
+    sent: int = 0
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Accepts all output events."""
+        return {OutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Counts the event."""
+        self.sent += 1
+        return True
+
+
+class TestBatchedLane:
+    """
+    Tests for coalescing the events waiting in a lane into batches.
+    """
+
+    @staticmethod
+    async def test_waiting_events_batched() -> None:
+        """Events which are waiting are passed to output_many, up to the batch size."""
+
+        output = BatchingOutput()
+        lane = OutputLane(output, batch_size=3)
+
+        for _ in range(7):
+            await lane.put(OutputEvent())
+        lane.start()
+        await lane.close()
+
+        assert output.batches == [3, 3, 1]
+        assert lane.delivered == 7
+
+    @staticmethod
+    async def test_batch_waits_for_more_events() -> None:
+        """With a batch_wait, the lane waits for events to fill a batch."""
+
+        output = BatchingOutput()
+        lane = OutputLane(output, batch_size=10, batch_wait=0.05)
+        lane.start()
+
+        for _ in range(4):
+            await lane.put(OutputEvent())
+            await asyncio.sleep(0.005)
+        await lane.close()
+
+        assert output.batches == [4]
+
+    @staticmethod
+    async def test_outputs_without_output_many_not_batched() -> None:
+        """Outputs which can not send batches are given one event at a time."""
+
+        output = CountingOutput()
+        lane = OutputLane(output, batch_size=3)
+
+        for _ in range(2):
+            await lane.put(OutputEvent())
+        lane.start()
+        await lane.close()
+
+        assert lane.batch_size == 1
+        assert output.calls == 2
+
+    @staticmethod
+    async def test_v1_outputs_not_batched() -> None:
+        """Version 1 outputs are only given batches if they implement output_many."""
+
+        output = CountingV1Output()
+        lane = OutputLane(output, batch_size=3)
+
+        for _ in range(2):
+            await lane.put(OutputEvent())
+        lane.start()
+        await lane.close()
+
+        assert lane.batch_size == 1
+        assert output.sent == 2
+        assert lane.delivered == 2
+
+
+class FlakyOutput:
+    """Output which raises an exception for its first few calls, then sends everything."""
+
+    failures: int
+    sent: list[OutputEvent]
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.sent = []
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Accepts all output events."""
+        return {OutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Fails while there are failures left, then records the event."""
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Service unavailable")
+        self.sent.append(event)
+        return True
+
+
+class TestRetries:
+    """
+    Tests for retrying failed events, and keeping those which keep failing.
+    """
+
+    @staticmethod
+    def test_backoff_grows_to_maximum() -> None:
+        """Delays are random, up to a limit which doubles for each attempt up to the maximum."""
+
+        policy = RetryPolicy(5, backoff=1, max_backoff=3)
+        for attempt, limit in ((1, 1), (2, 2), (3, 3), (4, 3)):
+            delays = [policy.delay(attempt) for _ in range(50)]
+            assert all(0 <= delay <= limit for delay in delays)
+
+        with pytest.raises(ValueError):
+            RetryPolicy(-1)
+
+    @staticmethod
+    async def test_failed_events_retried() -> None:
+        """Failed events are retried until they are sent, without holding up other events."""
+
+        output = FlakyOutput(failures=2)
+        handled: list[OutputEvent] = []
+        lane = OutputLane(output, retry=RetryPolicy(3, backoff=0.01), done=handled.append)
+        lane.start()
+
+        await lane.put(OutputEvent())
+        await lane.put(OutputEvent())
+        await lane.close()
+
+        assert len(output.sent) == 2
+        assert (lane.failed, lane.retried, lane.delivered) == (2, 2, 2)
+        assert len(handled) == 2
+
+    @staticmethod
+    async def test_exhausted_events_dead_lettered() -> None:
+        """Events which fail on their last attempt are kept in the dead-letter store."""
+
+        store = DeadLetterStore(10)
+        lane = OutputLane(
+            FlakyOutput(failures=5), retry=RetryPolicy(1, backoff=0.01), dead_letters=store
+        )
+        lane.start()
+
+        event = OutputEvent()
+        await lane.put(event)
+        await lane.close()
+
+        assert (lane.retried, lane.dead_lettered) == (1, 1)
+        [letter] = store.letters()
+        assert letter.event is event
+        assert (letter.stage, letter.target, letter.attempts) == ("output", "FlakyOutput", 2)
+        assert "Service unavailable" in letter.error
+
+
+class TestCircuitBreaker:
+    """
+    Tests for stopping calls to an output which keeps failing.
+    """
+
+    @staticmethod
+    async def test_opens_and_recovers() -> None:
+        """The circuit opens after failures or slow calls, and a test call closes it."""
+
+        breaker = CircuitBreaker(2, slow_call=0.5, reset_timeout=0.05)
+        breaker.record(0.01, raised=True)
+        assert breaker.stats()["state"] == "closed"
+        breaker.record(1.0, raised=False)
+        assert breaker.stats()["state"] == "open" and breaker.wait_time() > 0
+
+        await asyncio.sleep(0.06)
+        assert breaker.wait_time() == 0 and breaker.stats()["state"] == "half-open"
+        breaker.record(0.01, raised=True)
+        assert breaker.stats()["state"] == "open" and breaker.opened == 2
+
+        await asyncio.sleep(0.06)
+        assert breaker.wait_time() == 0
+        breaker.record(0.01, raised=False)
+        assert breaker.stats()["state"] == "closed" and breaker.consecutive_failures == 0
+
+    @staticmethod
+    async def test_open_circuit_fails_fast() -> None:
+        """Once the circuit is open, events are dead-lettered without calling the output."""
+
+        output = FlakyOutput(failures=10)
+        store = DeadLetterStore(10)
+        lane = OutputLane(output, breaker=CircuitBreaker(2), dead_letters=store)
+        lane.start()
+
+        for _ in range(5):
+            await lane.put(OutputEvent())
+        await lane.close()
+
+        assert output.failures == 8
+        assert (lane.failed, lane.short_circuited) == (2, 3)
+        assert len(store) == 5
+        assert "CircuitOpenError" in store.letters()[-1].error
+
+    @staticmethod
+    async def test_buffered_events_wait_for_recovery() -> None:
+        """With buffer set, events wait while the circuit is open, then are sent."""
+
+        output = FlakyOutput(failures=2)
+        breaker = CircuitBreaker(2, reset_timeout=0.05, buffer=True)
+        lane = OutputLane(output, breaker=breaker)
+        lane.start()
+
+        events = [OutputEvent() for _ in range(4)]
+        start = time.monotonic()
+        for event in events:
+            await lane.put(event)
+        await lane.close()
+
+        assert time.monotonic() - start >= 0.05
+        assert output.sent == events[2:]
+        assert lane.short_circuited == 0
+        assert breaker.state is CircuitState.CLOSED
@@ -0,0 +1,120 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the type-indexed dispatch tables used to route events in the BotRunner.
+"""
+
+from __future__ import annotations
+
+import abc
+import dataclasses
+
+from mewbot.core import InputEvent
+from mewbot.dispatch import TypeDispatchTable
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+@dataclasses.dataclass
+class ParentEvent(InputEvent):
+    """Base event for the routing tests."""
+
+
+@dataclasses.dataclass
+class ChildEvent(ParentEvent):
+    """Subclass of the base test event."""
+
+
+@dataclasses.dataclass
+class OtherEvent(InputEvent):
+    """Unrelated event for the routing tests."""
+
+
+@dataclasses.dataclass
+class DiamondEvent(ChildEvent, OtherEvent):
+    """Event with two registered bases."""
+
+
+class VirtualBase(abc.ABC):
+    """ABC which events are registered against rather than inheriting from."""
+
+
+@dataclasses.dataclass
+class VirtualEvent(InputEvent):
+    """Event which is a virtual subclass of VirtualBase."""
+
+
+VirtualBase.register(VirtualEvent)
+
+
+class TestTypeDispatchTable:
+    """
+    Tests for resolving and caching the handlers for each event class.
+    """
+
+    @staticmethod
+    def test_exact_and_subclass_lookup() -> None:
+        """Handlers registered on a base class receive all the subclasses of it."""
+
+        table: TypeDispatchTable[InputEvent, str] = TypeDispatchTable(
+            {ParentEvent: ["parent"], ChildEvent: ["child"], OtherEvent: ["other"]}
+        )
+
+        assert table.lookup(ParentEvent) == ("parent",)
+        assert set(table.lookup(ChildEvent)) == {"parent", "child"}
+        assert table.lookup(OtherEvent) == ("other",)
+        assert not table.lookup(InputEvent)
+
+    @staticmethod
+    def test_handlers_are_not_duplicated() -> None:
+        """A handler registered on several bases of an event only receives it once."""
+
+        table: TypeDispatchTable[InputEvent, str] = TypeDispatchTable(
+            {ParentEvent: ["shared"], OtherEvent: ["shared", "other"]}
+        )
+
+        assert sorted(table.lookup(DiamondEvent)) == ["other", "shared"]
+
+    @staticmethod
+    def test_virtual_subclasses_are_routed() -> None:
+        """ABC registered subclasses are routed as isinstance would route them."""
+
+        table: TypeDispatchTable[object, str] = TypeDispatchTable({VirtualBase: ["virtual"]})
+
+        assert table.lookup(VirtualEvent) == ("virtual",)
+
+    @staticmethod
+    def test_resolution_is_cached() -> None:
+        """The same tuple is returned for repeated lookups of a class."""
+
+        table: TypeDispatchTable[InputEvent, str] = TypeDispatchTable({ParentEvent: ["a"]})
+
+        assert table.lookup(ChildEvent) is table.lookup(ChildEvent)
+
+    @staticmethod
+    def test_register_invalidates_cache() -> None:
+        """Registering new handlers is reflected in classes which were already resolved."""
+
+        table: TypeDispatchTable[InputEvent, str] = TypeDispatchTable({ParentEvent: ["a"]})
+        assert table.lookup(ChildEvent) == ("a",)
+
+        table.register(InputEvent, ["b"])
+
+        assert set(table.lookup(ChildEvent)) == {"a", "b"}
+        assert table.handlers == {"a", "b"}
+        assert len(table) == 2
+
+    @staticmethod
+    def test_table_does_not_track_source_mapping() -> None:
+        """The registrations are copied when the table is built."""
+
+        source: dict[type[InputEvent], set[str]] = {ParentEvent: {"a"}}
+        table: TypeDispatchTable[InputEvent, str] = TypeDispatchTable(source)
+
+        source[ParentEvent].add("b")
+
+        assert table.lookup(ParentEvent) == ("a",)
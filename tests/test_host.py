@@ -0,0 +1,270 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for running several bots in one process, sharing their connections.
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterable, Sequence
+from typing import Any
+
+import asyncio
+import dataclasses
+
+import pytest
+
+from mewbot.api.v1 import Input, IOConfig, Output
+from mewbot.bot import Bot, RunnerConfig
+from mewbot.core import InputEvent, InputQueue, OutputEvent
+from mewbot.host import BotHost, FanOutQueue, connection_key
+from mewbot.io.socket import SocketIO
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+@dataclasses.dataclass
+class CountedEvent(InputEvent):
+    """Event produced by the counting input."""
+
+    value: int
+
+
+class CountingInput(Input):
+    """Input which produces a fixed number of events, and counts how often it is run."""
+
+    runs: int
+
+    def __init__(self, count: int) -> None:
+        super().__init__()
+        self.count = count
+        self.runs = 0
+
+    @staticmethod
+    def produces_inputs() -> set[type[InputEvent]]:
+        """Produces counted events."""
+        return {CountedEvent}
+
+    async def run(self) -> None:
+        """Put the events on the queue."""
+        self.runs += 1
+        assert self.queue
+        for value in range(self.count):
+            await self.queue.put(CountedEvent(value))
+
+
+class CountingIO(IOConfig):
+    """IOConfig with a single counting input."""
+
+    _count: int = 0
+    _input: CountingInput | None = None
+
+    @property
+    def count(self) -> int:
+        """The number of events the input produces."""
+        return self._count
+
+    @count.setter
+    def count(self, count: int) -> None:
+        self._count = int(count)
+
+    def get_inputs(self) -> Sequence[Input]:
+        """The counting input, created on first use."""
+        if not self._input:
+            self._input = CountingInput(self._count)
+        return [self._input]
+
+    def get_outputs(self) -> Sequence[Output]:
+        """No outputs."""
+        return []
+
+
+class NullOutput(Output):
+    """Output which accepts, and discards, every output event."""
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Consumes all output events."""
+        return {OutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Discard the event."""
+        return True
+
+
+class RecordingBehaviour:
+    """Minimal behaviour which records the counted events it is given."""
+
+    seen: list[InputEvent]
+
+    def __init__(self) -> None:
+        self.seen = []
+
+    def add(self, component: Any) -> None:
+        """Components are not supported by this test behaviour."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes counted events."""
+        return {CountedEvent}
+
+    async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """Record the event, without producing any output."""
+        self.seen.append(event)
+        outputs: tuple[OutputEvent, ...] = ()
+        for output in outputs:
+            yield output
+
+
+def counting_bot(name: str, count: int) -> tuple[Bot, RecordingBehaviour]:
+    """Create a bot with a counting IOConfig and a recording behaviour."""
+
+    config = CountingIO()
+    config.count = count
+
+    behaviour = RecordingBehaviour()
+
+    bot = Bot(name)
+    bot.add_io_config(config)
+    bot.add_behaviour(behaviour)
+    return bot, behaviour
+
+
+class TestConnectionSharing:
+    """
+    Tests for finding and sharing IOConfigs which make identical connections.
+    """
+
+    @staticmethod
+    def test_connection_key() -> None:
+        """IOConfigs with the same implementation and properties have the same key."""
+
+        first, second, other = SocketIO(), SocketIO(), SocketIO()
+        first.port = second.port = 1234
+        other.port = 4321
+
+        assert first.uuid != second.uuid
+        assert connection_key(first) == connection_key(second)
+        assert connection_key(first) != connection_key(other)
+
+    @staticmethod
+    def test_identical_configs_shared() -> None:
+        """Bots added with identical IOConfigs end up using the same one."""
+
+        first, _ = counting_bot("first", 5)
+        second, _ = counting_bot("second", 5)
+        third, _ = counting_bot("third", 6)
+
+        host = BotHost()
+        for bot in (first, second, third):
+            host.add_bot(bot)
+
+        assert host.connections == 2
+        assert second.io_configs[0] is first.io_configs[0]
+        assert third.io_configs[0] is not first.io_configs[0]
+
+
+class TestFanOutQueue:
+    """
+    Tests for passing events from a shared input to several bots.
+    """
+
+    @staticmethod
+    async def test_events_put_on_every_queue() -> None:
+        """Each event is put on all the target queues."""
+
+        targets = [InputQueue(), InputQueue()]
+        queue = FanOutQueue(targets)
+
+        await queue.put(CountedEvent(1))
+        queue.put_nowait(CountedEvent(2))
+
+        assert [target.qsize() for target in targets] == [2, 2]
+        assert queue.qsize() == 0
+
+    @staticmethod
+    async def test_rejection_does_not_stop_other_bots() -> None:
+        """A queue rejecting an event does not stop the other queues receiving it."""
+
+        full = InputQueue(1, "reject")
+        full.put_nowait(CountedEvent(0))
+        other = InputQueue()
+
+        with pytest.raises(asyncio.QueueFull):
+            await FanOutQueue([full, other]).put(CountedEvent(1))
+
+        assert other.qsize() == 1
+
+
+class TestBotHost:
+    """
+    Tests for running bots together.
+    """
+
+    @staticmethod
+    def test_shared_input_runs_once_for_all_bots() -> None:
+        """A shared input is only run once, and every bot sees all its events."""
+
+        first, first_behaviour = counting_bot("first", 10)
+        second, second_behaviour = counting_bot("second", 10)
+
+        host = BotHost()
+        host.add_bot(first)
+        host.add_bot(second)
+
+        loop = asyncio.new_event_loop()
+        loop.call_later(0.2, loop.stop)
+        try:
+            host.run(loop)
+        finally:
+            loop.close()
+
+        shared_input = list(first.io_configs[0].get_inputs())[0]
+        assert isinstance(shared_input, CountingInput)
+        assert shared_input.runs == 1
+
+        assert len(first_behaviour.seen) == 10
+        assert len(second_behaviour.seen) == 10
+
+    @staticmethod
+    def test_shared_outputs_share_limits() -> None:
+        """An output shared by several bots has one rate limit and circuit for all of them."""
+
+        config = RunnerConfig(
+            output_rate_limits={"mewbot.api.v1.Output": {"rate": 1}}, circuit_failures=3
+        )
+
+        host = BotHost()
+        for name in ("first", "second"):
+            bot, _ = counting_bot(name, 0)
+            bot.configure_runner(config)
+            host.add_bot(bot)
+
+        loop = asyncio.new_event_loop()
+        loop.call_later(0.1, loop.stop)
+        try:
+            host.run(loop)
+        finally:
+            loop.close()
+
+        output = NullOutput()
+        first, second = host.runners
+        # pylint: disable=protected-access
+        limit, breaker = first._rate_limit(output), first._circuit_breaker(output)
+        assert limit is not None and breaker is not None
+        assert second._rate_limit(output) is limit
+        assert second._circuit_breaker(output) is breaker
+
+    @staticmethod
+    def test_bots_not_added_while_running() -> None:
+        """Bots can only be added before the host runs."""
+
+        host = BotHost()
+        host._running = True  # pylint: disable=protected-access
+
+        with pytest.raises(RuntimeError):
+            host.add_bot(Bot("late"))
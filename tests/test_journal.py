@@ -0,0 +1,304 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for keeping queued events in an on-disk journal, and restoring them after a restart.
+"""
+
+from __future__ import annotations
+
+from typing import AsyncIterable
+
+import asyncio
+import contextlib
+import dataclasses
+import pathlib
+import threading
+
+import pytest
+
+from mewbot.bot import BotRunner, RunnerConfig
+from mewbot.core import InputEvent, InputQueue, OutputEvent
+from mewbot.journal import EventJournal
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+@dataclasses.dataclass
+class JournaledEvent(InputEvent):
+    """Input event for the journal tests."""
+
+    value: int = 0
+
+
+@dataclasses.dataclass
+class JournaledOutputEvent(OutputEvent):
+    """Output event for the journal tests."""
+
+    value: int = 0
+
+
+@dataclasses.dataclass
+class UnpicklableEvent(InputEvent):
+    """Input event which can not be written to the journal."""
+
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+
+class EchoBehaviour:
+    """Minimal behaviour which records its events, and echoes each one as an output."""
+
+    seen: list[InputEvent]
+
+    def __init__(self) -> None:
+        self.seen = []
+
+    def add(self, component: object) -> None:
+        """Components are not supported by this test behaviour."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the journaled events."""
+        return {JournaledEvent}
+
+    async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """Record the event, and produce an output with the same value."""
+        self.seen.append(event)
+        yield JournaledOutputEvent(getattr(event, "value", 0))
+
+
+class SinkOutput:
+    """Output which keeps the events it sends."""
+
+    sent: list[OutputEvent]
+
+    def __init__(self) -> None:
+        self.sent = []
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Consumes the journaled output events."""
+        return {JournaledOutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Keep the event."""
+        self.sent.append(event)
+        return True
+
+
+def journaled_runner(
+    path: pathlib.Path, behaviour: EchoBehaviour, sink: SinkOutput
+) -> BotRunner:
+    """Create a runner which keeps its queues in a journal at the given path."""
+
+    return BotRunner(
+        {JournaledEvent: {behaviour}},
+        set(),
+        {JournaledOutputEvent: {sink}},
+        RunnerConfig(queue_path=str(path)),
+    )
+
+
+async def process_queues(runner: BotRunner) -> None:
+    """Process and send everything on the runner's queues, then stop its processors."""
+
+    tasks = [
+        asyncio.create_task(runner.process_input_queue()),
+        asyncio.create_task(runner.process_output_queue()),
+    ]
+    assert not (await runner.drain(5)).timed_out
+
+    for task in tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+class TestEventJournal:
+    """
+    Tests for writing events to the journal, and reading them back.
+    """
+
+    @staticmethod
+    def test_events_kept_until_removed(tmp_path: pathlib.Path) -> None:
+        """Events are kept, in order, until they are removed."""
+
+        journal = EventJournal(str(tmp_path / "queue.db"))
+        rows = [journal.queue("input").append(JournaledEvent(value)) for value in range(3)]
+        journal.queue("output").append(JournaledOutputEvent(9))
+        journal.close()
+
+        journal = EventJournal(str(tmp_path / "queue.db"))
+        assert [row for row, _ in journal.queue("input").pending()] == rows
+        assert [event for _, event in journal.queue("output").pending()] == [
+            JournaledOutputEvent(9)
+        ]
+
+        journal.remove(rows[1])
+        assert [event for _, event in journal.pending("input")] == [
+            JournaledEvent(0),
+            JournaledEvent(2),
+        ]
+        journal.close()
+
+    @staticmethod
+    async def test_changes_committed_in_groups(tmp_path: pathlib.Path) -> None:
+        """Changes wait for the commit interval, or until there are commit_size of them."""
+
+        journal = EventJournal(
+            str(tmp_path / "queue.db"), commit_interval=0.05, commit_size=4
+        )
+        for value in range(3):
+            journal.append("input", JournaledEvent(value))
+        assert journal.uncommitted == 3
+
+        journal.append("input", JournaledEvent(3))
+        assert journal.uncommitted == 0
+
+        journal.append("input", JournaledEvent(4))
+        await asyncio.sleep(0.1)
+        assert journal.uncommitted == 0
+        journal.close()
+
+    @staticmethod
+    def test_events_removed_before_commit_never_written(tmp_path: pathlib.Path) -> None:
+        """An event handled before its commit costs nothing to remove."""
+
+        journal = EventJournal(str(tmp_path / "queue.db"), commit_size=10)
+        journal.remove(journal.append("input", JournaledEvent(1)))
+        assert journal.uncommitted == 0
+        journal.close()
+
+    @staticmethod
+    def test_unpicklable_events_not_journaled(tmp_path: pathlib.Path) -> None:
+        """Events which can not be pickled are skipped when the changes are committed."""
+
+        journal = EventJournal(str(tmp_path / "queue.db"))
+        journal.append("input", UnpicklableEvent())
+        journal.append("input", JournaledEvent(1))
+
+        assert [event for _, event in journal.pending("input")] == [JournaledEvent(1)]
+        journal.close()
+
+
+class TestJournaledQueue:
+    """
+    Tests for event queues which keep their events in a journal.
+    """
+
+    @staticmethod
+    def test_acknowledged_events_not_restored(tmp_path: pathlib.Path) -> None:
+        """Only events which were not acknowledged are restored, in their original order."""
+
+        journal = EventJournal(str(tmp_path / "queue.db"))
+        queue = InputQueue(journal=journal.queue("input"))
+        for value in range(4):
+            queue.put_nowait(JournaledEvent(value))
+
+        queue.ack(queue.get_nowait())
+        queue.get_nowait()  # Taken, but not handled before the "crash"
+        journal.close()
+
+        journal = EventJournal(str(tmp_path / "queue.db"))
+        restored = InputQueue(2, journal=journal.queue("input"))
+
+        assert restored.restore() == 3
+        assert [restored.get_nowait() for _ in range(3)] == [
+            JournaledEvent(1),
+            JournaledEvent(2),
+            JournaledEvent(3),
+        ]
+        journal.close()
+
+    @staticmethod
+    def test_dropped_events_removed(tmp_path: pathlib.Path) -> None:
+        """Events discarded by the overflow policy are removed from the journal."""
+
+        journal = EventJournal(str(tmp_path / "queue.db"))
+        queue = InputQueue(1, "drop-oldest", journal=journal.queue("input"))
+        queue.put_nowait(JournaledEvent(1))
+        queue.put_nowait(JournaledEvent(2))
+
+        assert [event for _, event in journal.pending("input")] == [JournaledEvent(2)]
+        journal.close()
+
+    @staticmethod
+    def test_repeated_events_tracked_per_entry(tmp_path: pathlib.Path) -> None:
+        """An event queued twice stays in the journal until both entries are acknowledged."""
+
+        journal = EventJournal(str(tmp_path / "queue.db"))
+        queue = InputQueue(journal=journal.queue("input"))
+        event = JournaledEvent(1)
+        queue.put_nowait(event)
+        queue.put_nowait(event)
+
+        queue.ack(queue.get_nowait())
+        assert [event for _, event in journal.pending("input")] == [JournaledEvent(1)]
+
+        queue.ack(queue.get_nowait())
+        assert not journal.pending("input")
+        journal.close()
+
+
+class TestRunnerRecovery:
+    """
+    Tests that a runner with a queue_path recovers the events left by a previous run.
+    """
+
+    @staticmethod
+    async def test_unprocessed_events_replayed(tmp_path: pathlib.Path) -> None:
+        """Events queued but not processed before a restart are processed after it."""
+
+        path = tmp_path / "queue.db"
+
+        first = journaled_runner(path, EchoBehaviour(), SinkOutput())
+        for value in range(3):
+            await first.input_event_queue.put(JournaledEvent(value))
+        assert first.journal is not None
+        first.journal.close()  # The process dies before processing anything.
+
+        behaviour, sink = EchoBehaviour(), SinkOutput()
+        second = journaled_runner(path, behaviour, sink)
+        assert second.input_event_queue.qsize() == 3
+
+        await process_queues(second)
+        assert second.journal is not None
+        second.journal.close()
+
+        assert behaviour.seen == [JournaledEvent(value) for value in range(3)]
+        assert sink.sent == [JournaledOutputEvent(value) for value in range(3)]
+
+        third = journaled_runner(path, EchoBehaviour(), SinkOutput())
+        assert third.input_event_queue.qsize() == 0
+        assert third.output_event_queue.qsize() == 0
+        assert third.journal is not None
+        third.journal.close()
+
+    @staticmethod
+    async def test_unsent_outputs_replayed(tmp_path: pathlib.Path) -> None:
+        """Output events which were not sent before a restart are sent after it."""
+
+        path = tmp_path / "queue.db"
+
+        first = journaled_runner(path, EchoBehaviour(), SinkOutput())
+        await first.output_event_queue.put(JournaledOutputEvent(7))
+        assert first.journal is not None
+        first.journal.close()
+
+        sink = SinkOutput()
+        second = journaled_runner(path, EchoBehaviour(), sink)
+        await process_queues(second)
+        assert second.journal is not None
+        second.journal.close()
+
+        assert sink.sent == [JournaledOutputEvent(7)]
+
+    @staticmethod
+    def test_invalid_commit_settings() -> None:
+        """Commits must be made for at least one change."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(queue_commit_size=0)
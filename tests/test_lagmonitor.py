@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the event loop lag monitor.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable
+from types import FrameType
+from typing import Any
+
+import asyncio
+import logging
+import sys
+import time
+
+import pytest
+
+from mewbot.core import OutputEvent
+from mewbot.lagmonitor import LoopLagMonitor, blame
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+class BlockingOutput:
+    """Output which blocks the event loop while sending."""
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Accepts all output events."""
+        return {OutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Send the event, synchronously."""
+        time.sleep(0.3)
+        return event is not None
+
+
+class PropertyOutput:
+    """Output whose output method is a property, and whose other attributes are looked up."""
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Accepts all output events."""
+        return {OutputEvent}
+
+    @property
+    def output(self) -> Callable[[OutputEvent], Awaitable[bool]]:
+        """Raise, as a component in the middle of changing might."""
+        raise RuntimeError("The lag monitor ran a property")
+
+    def __getattr__(self, name: str) -> Any:
+        """Raise, as a proxy for an object which is not ready might."""
+        raise RuntimeError(f"The lag monitor looked up {name}")
+
+    def frame(self) -> FrameType:
+        """The frame of this method, which has the output as its self."""
+        return sys._getframe()  # pylint: disable=protected-access
+
+
+class TestLoopLagMonitor:
+    """
+    Tests for measuring the event loop's lag, and finding what blocked it.
+    """
+
+    @staticmethod
+    async def test_idle_loop_not_stalled() -> None:
+        """A loop which is not blocked has heartbeats on time, and no stalls."""
+
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.2)
+        monitor.start(asyncio.get_running_loop())
+        await asyncio.sleep(0.1)
+        monitor.stop()
+
+        assert monitor.beats > 3
+        assert monitor.lag.count == monitor.beats
+        assert monitor.stats()["stalls"] == 0
+
+    @staticmethod
+    async def test_blocking_component_blamed(caplog: pytest.LogCaptureFixture) -> None:
+        """A stall is counted, and logged with the component which caused it."""
+
+        monitor = LoopLagMonitor(interval=0.02, threshold=0.05)
+        monitor.start(asyncio.get_running_loop())
+
+        await asyncio.sleep(0.05)
+        with caplog.at_level(logging.WARNING):
+            await BlockingOutput().output(OutputEvent())
+            await asyncio.sleep(0.05)
+        monitor.stop()
+
+        assert monitor.stalls == 1
+        assert monitor.lag.maximum >= 0.2
+        [record] = [record for record in caplog.records if "blocked" in record.message]
+        assert "output BlockingOutput" in record.message
+        assert f"{__name__}:BlockingOutput.output" in record.message
+
+    @staticmethod
+    def test_blame_does_not_run_properties() -> None:
+        """Components are found without running their properties, which may raise."""
+
+        assert blame(PropertyOutput().frame())[0] == "output PropertyOutput"
+
+    @staticmethod
+    def test_times_must_be_positive() -> None:
+        """The interval and threshold can not be zero."""
+
+        with pytest.raises(ValueError):
+            LoopLagMonitor(interval=0)
+        with pytest.raises(ValueError):
+            LoopLagMonitor(threshold=0)
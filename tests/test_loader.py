@@ -13,15 +13,22 @@ from __future__ import annotations
 from typing import Type
 
 import copy
+import io
 
 import pytest
 import yaml
 
 from mewbot.api.v1 import Behaviour, IOConfig
-from mewbot.bot import Bot
+from mewbot.bot import Bot, BotRunner, RunnerConfig
 from mewbot.core import ConfigBlock
 from mewbot.io.http import HTTPServlet
-from mewbot.loader import configure_bot, load_behaviour, load_component
+from mewbot.loader import (
+    configure_bot,
+    load_behaviour,
+    load_component,
+    load_runner,
+    reload_bot,
+)
 from mewbot.test import BaseTestClassWithConfig
 
 CONFIG_YAML = "examples/trivial_http_post.yaml"
@@ -88,6 +95,124 @@ class TestLoaderConfigureBot:
         assert isinstance(bot, Bot)
 
 
+class TestLoaderRunner:
+    """
+    Tests loading the runner settings from a Runner block.
+    """
+
+    @staticmethod
+    def runner_block(**properties: int | str) -> ConfigBlock:
+        """Build a Runner block with the given properties."""
+        return {
+            "kind": "Runner",
+            "implementation": "mewbot.bot.BotRunner",
+            "uuid": "aaaaaaaa-aaaa-4aaa-0000-aaaaaaaaaa00",
+            "properties": dict(properties),
+        }
+
+    def test_load_runner(self) -> None:
+        """The properties of the block are used as the RunnerConfig fields."""
+
+        config, runner_class = load_runner(self.runner_block(input_workers=3))
+
+        assert config == RunnerConfig(input_workers=3)
+        assert runner_class is BotRunner
+
+    def test_load_runner_unknown_property(self) -> None:
+        """Properties which are not runner settings are rejected."""
+
+        with pytest.raises(TypeError):
+            load_runner(self.runner_block(not_a_setting=1))
+
+    def test_load_runner_invalid_value(self) -> None:
+        """Settings are validated when loaded."""
+
+        with pytest.raises(ValueError):
+            load_runner(self.runner_block(input_workers=0))
+
+    def test_load_runner_not_a_runner(self) -> None:
+        """The implementation must be a BotRunner."""
+
+        block = self.runner_block()
+        block["implementation"] = "mewbot.bot.Bot"
+
+        with pytest.raises(TypeError):
+            load_runner(block)
+
+    def test_configure_bot_with_runner(self) -> None:
+        """A Runner block in the bot YAML configures the bot's runner."""
+
+        stream = io.StringIO(yaml.dump(self.runner_block(input_workers=2)))
+        bot = configure_bot("bot", stream)
+
+        assert bot._runner_config.input_workers == 2  # pylint: disable=protected-access
+
+
+class TestLoaderReload:
+    """
+    Tests reloading a bot's YAML, and updating only the components which changed.
+    """
+
+    @staticmethod
+    def reload_yaml(behaviour_name: str) -> str:
+        """The example HTTP bot, with its behaviour renamed, and a second behaviour added."""
+
+        with open(CONFIG_YAML, "r", encoding="utf-8") as config_file:
+            documents = list(yaml.load_all(config_file, Loader=yaml.CSafeLoader))
+
+        documents[1]["properties"]["name"] = behaviour_name
+
+        extra = copy.deepcopy(documents[1])
+        extra["uuid"] = "aaaaaaaa-aaaa-4aaa-0002-aaaaaaaaaaff"
+        documents.append(extra)
+
+        return yaml.dump_all(documents)
+
+    @staticmethod
+    def test_reload_keeps_unchanged_components() -> None:
+        """Only the changed behaviour is replaced; the IOConfig instance is kept."""
+
+        with open(CONFIG_YAML, "r", encoding="utf-8") as config_file:
+            bot = configure_bot("bot", config_file)
+
+        io_config = bot.io_configs[0]
+        behaviour = bot.behaviours[0]
+
+        report = reload_bot(bot, io.StringIO(TestLoaderReload.reload_yaml("Renamed")))
+
+        assert report.kept == [str(io_config.uuid)]  # type: ignore
+        assert report.replaced == [str(behaviour.uuid)]  # type: ignore
+        assert report.added == ["aaaaaaaa-aaaa-4aaa-0002-aaaaaaaaaaff"]
+        assert not report.removed
+
+        assert bot.io_configs[0] is io_config
+        assert bot.behaviours[0] is not behaviour
+        assert len(bot.behaviours) == 2
+
+    @staticmethod
+    def test_reload_removes_components() -> None:
+        """Components no longer in the YAML are removed."""
+
+        bot = configure_bot("bot", io.StringIO(TestLoaderReload.reload_yaml("Echo Inputs")))
+        with open(CONFIG_YAML, "r", encoding="utf-8") as config_file:
+            report = reload_bot(bot, config_file)
+
+        assert report.removed == ["aaaaaaaa-aaaa-4aaa-0002-aaaaaaaaaaff"]
+        assert len(report.kept) == 2
+        assert len(bot.behaviours) == 1
+
+    @staticmethod
+    def test_file_bots_can_reload() -> None:
+        """Bots loaded from a file get a reloader which re-reads it."""
+
+        with open(CONFIG_YAML, "r", encoding="utf-8") as config_file:
+            bot = configure_bot("bot", config_file)
+
+        assert bot.reloader is not None
+        assert len(bot.reloader().kept) == 2
+        assert configure_bot("bot", io.StringIO("")).reloader is None
+
+
 # Tester for mewbot.loader.load_component
 class TestLoaderHttpsPost(BaseTestClassWithConfig[HTTPServlet]):
     """
@@ -0,0 +1,216 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the latency histograms recorded for each stage of the event pipeline.
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterable
+
+import dataclasses
+import io
+import json
+
+from mewbot.api.v1 import Action, Behaviour, Condition, Trigger
+from mewbot.core import InputEvent, InputQueue, OutputEvent
+from mewbot.delivery import OutputLane
+from mewbot.metrics import REGISTRY, Histogram, MetricsRegistry
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+class TestHistogram:
+    """
+    Tests for recording durations and estimating percentiles.
+    """
+
+    @staticmethod
+    def test_observe() -> None:
+        """Observations are counted in power of two microsecond buckets."""
+
+        histogram = Histogram()
+        for seconds in (0.0000005, 0.000003, 0.000003, 0.001):
+            histogram.observe(seconds)
+
+        assert histogram.count == 4
+        assert histogram.minimum == 0.0000005
+        assert histogram.maximum == 0.001
+        assert histogram.buckets[0] == 1
+        assert histogram.buckets[2] == 2
+        assert histogram.buckets[10] == 1
+
+    @staticmethod
+    def test_percentiles() -> None:
+        """Percentiles are the upper bound of their bucket, capped at the maximum."""
+
+        histogram = Histogram()
+        for _ in range(99):
+            histogram.observe(0.000003)
+        histogram.observe(0.5)
+
+        assert histogram.percentile(0.5) == 0.000004
+        assert histogram.percentile(0.99) == 0.000004
+        assert histogram.percentile(1.0) == 0.5
+        assert Histogram().percentile(0.5) == 0.0
+
+
+class TestMetricsRegistry:
+    """
+    Tests for querying and dumping the collection of histograms.
+    """
+
+    @staticmethod
+    def test_snapshot_and_dump() -> None:
+        """Histograms are labelled, sorted by total time, and dumped as JSON."""
+
+        registry = MetricsRegistry()
+        registry.observe("trigger", 0.001, "Behaviour", "FastTrigger")
+        registry.observe("action", 0.5, "Behaviour", "SlowAction")
+
+        snapshot = registry.snapshot()
+        assert [entry["component"] for entry in snapshot] == ["SlowAction", "FastTrigger"]
+        assert snapshot[0]["stage"] == "action"
+        assert snapshot[0]["behaviour"] == "Behaviour"
+
+        stream = io.StringIO()
+        registry.dump(stream)
+        assert json.loads(stream.getvalue())[0]["count"] == 1
+
+    @staticmethod
+    def test_disabled_and_reset() -> None:
+        """Nothing is recorded while disabled, and reset discards the histograms."""
+
+        registry = MetricsRegistry()
+        registry.enabled = False
+        registry.observe("action", 0.1)
+        assert not registry.histograms()
+
+        registry.enabled = True
+        registry.observe("action", 0.1)
+        assert registry.histograms()
+
+        registry.reset()
+        assert not registry.histograms()
+
+
+@dataclasses.dataclass
+class TimedEvent(InputEvent):
+    """Event for checking the pipeline stages are timed."""
+
+
+class TimedTrigger(Trigger):
+    """Matches the timed events."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes timed events."""
+        return {TimedEvent}
+
+    def matches(self, event: InputEvent) -> bool:
+        """Matches all events."""
+        return True
+
+
+class TimedCondition(Condition):
+    """Allows all the timed events."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes timed events."""
+        return {TimedEvent}
+
+    def allows(self, event: InputEvent) -> bool:
+        """Allows all events."""
+        return True
+
+
+class TimedAction(Action):
+    """Produces one output event."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes timed events."""
+        return {TimedEvent}
+
+    @staticmethod
+    def produces_outputs() -> set[type[OutputEvent]]:
+        """Produces plain output events."""
+        return {OutputEvent}
+
+    async def act(
+        self, event: InputEvent, state: dict[str, Any]
+    ) -> AsyncIterable[OutputEvent]:
+        """Produce an output."""
+        yield OutputEvent()
+
+
+class TimedOutput:
+    """Output which accepts every event."""
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Consumes all output events."""
+        return {OutputEvent}
+
+    @staticmethod
+    async def output(event: OutputEvent) -> bool:
+        """Accept every output event."""
+        return isinstance(event, OutputEvent)
+
+
+class TestPipelineStages:
+    """
+    Tests that each stage of the pipeline records its latency.
+    """
+
+    @staticmethod
+    async def test_stages_recorded() -> None:
+        """The queue, each component, and the output, record their latencies."""
+
+        REGISTRY.reset()
+
+        # pylint: disable=unexpected-keyword-arg
+        behaviour = Behaviour(name="Timed")  # type: ignore
+        behaviour.add(TimedTrigger())
+        behaviour.add(TimedCondition())
+        behaviour.add(TimedAction())
+
+        queue = InputQueue()
+        await queue.put(TimedEvent())
+        event = await queue.get()
+
+        outputs = [output async for output in behaviour.process(event)]
+
+        lane = OutputLane(TimedOutput())
+        await lane.put(outputs[0])
+        lane.start()
+        await lane.close()
+
+        assert set(REGISTRY.histograms()) == {
+            ("queue", "", "InputQueue"),
+            ("trigger", "Timed", "TimedTrigger"),
+            ("condition", "Timed", "TimedCondition"),
+            ("action", "Timed", "TimedAction"),
+            ("output", "", "TimedOutput"),
+        }
+        assert all(h.count == 1 for h in REGISTRY.histograms().values())
+
+    @staticmethod
+    async def test_dropped_events_not_recorded() -> None:
+        """Events dropped from a full queue are not recorded as waiting."""
+
+        REGISTRY.reset()
+
+        queue = InputQueue(1, "drop-oldest")
+        await queue.put(TimedEvent())
+        await queue.put(TimedEvent())
+
+        assert not REGISTRY.histograms()
+
+        await queue.get()
+        assert REGISTRY.histogram("queue", "", "InputQueue").count == 1
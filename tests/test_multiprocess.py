@@ -0,0 +1,326 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the BotRunner which processes events in worker processes.
+"""
+
+from __future__ import annotations
+
+from collections.abc import AsyncIterable, Callable, Hashable
+from typing import Any, Optional
+
+import asyncio
+import dataclasses
+import os
+import pathlib
+
+import pytest
+
+from mewbot.api.v1 import Action, Behaviour, Trigger
+from mewbot.bot import RunnerConfig
+from mewbot.core import InputEvent, OutputEvent
+from mewbot.multiprocess import MultiProcessBotRunner, serialise_behaviour
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+@dataclasses.dataclass
+class ValueEvent(InputEvent):
+    """Input event with a value, and an optional partition key."""
+
+    value: int
+    key: Optional[str] = None
+    callback: Optional[Callable[[], None]] = None
+
+    def partition_key(self) -> Hashable:
+        """Events are partitioned by their key field."""
+        return self.key
+
+
+@dataclasses.dataclass
+class ResultEvent(OutputEvent):
+    """Output event recording the value, and the process which produced it."""
+
+    value: int
+    pid: int
+
+
+class ValueTrigger(Trigger):
+    """Matches all the value events."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the value events."""
+        return {ValueEvent}
+
+    def matches(self, event: InputEvent) -> bool:
+        """All value events match."""
+        return True
+
+
+class DoubleAction(Action):
+    """Produces a result with double the event's value, and the current process id."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the value events."""
+        return {ValueEvent}
+
+    @staticmethod
+    def produces_outputs() -> set[type[OutputEvent]]:
+        """Produces the result events."""
+        return {ResultEvent}
+
+    async def act(
+        self, event: InputEvent, state: dict[str, Any]
+    ) -> AsyncIterable[OutputEvent]:
+        """Double the value."""
+        assert isinstance(event, ValueEvent)
+        yield ResultEvent(event.value * 2, os.getpid())
+
+
+class TripleAction(DoubleAction):
+    """Produces a result with triple the event's value, and the current process id."""
+
+    async def act(
+        self, event: InputEvent, state: dict[str, Any]
+    ) -> AsyncIterable[OutputEvent]:
+        """Triple the value."""
+        assert isinstance(event, ValueEvent)
+        yield ResultEvent(event.value * 3, os.getpid())
+
+
+class ExitAction(DoubleAction):
+    """Doubles the value, or exits the worker process if it is negative."""
+
+    async def act(
+        self, event: InputEvent, state: dict[str, Any]
+    ) -> AsyncIterable[OutputEvent]:
+        """Double the value, unless it is negative."""
+        assert isinstance(event, ValueEvent)
+        if event.value < 0:
+            os._exit(1)  # pylint: disable=protected-access
+        yield ResultEvent(event.value * 2, os.getpid())
+
+
+class FailAction(DoubleAction):
+    """Doubles the value, or raises an exception if it is negative."""
+
+    async def act(
+        self, event: InputEvent, state: dict[str, Any]
+    ) -> AsyncIterable[OutputEvent]:
+        """Double the value, unless it is negative."""
+        assert isinstance(event, ValueEvent)
+        if event.value < 0:
+            raise ValueError(f"Negative value {event.value}")
+        yield ResultEvent(event.value * 2, os.getpid())
+
+
+class ResultOutput:
+    """Minimal OutputInterface implementation which records the results it receives."""
+
+    def __init__(self) -> None:
+        self.sent: list[ResultEvent] = []
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Accepts the result events."""
+        return {ResultEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Record the event."""
+        assert isinstance(event, ResultEvent)
+        self.sent.append(event)
+        return True
+
+
+def make_behaviour(action: type[Action] = DoubleAction) -> Behaviour:
+    """Build a behaviour which doubles (or otherwise acts on) every value event."""
+
+    behaviour = Behaviour()
+    behaviour.add(ValueTrigger())
+    behaviour.add(action())
+    return behaviour
+
+
+async def run_events(processes: int, *events: ValueEvent) -> list[ResultEvent]:
+    """Process the events with a multiprocess runner, and return the results sent."""
+
+    output = ResultOutput()
+    runner = MultiProcessBotRunner(
+        {ValueEvent: {make_behaviour()}},
+        set(),
+        {ResultEvent: {output}},
+        RunnerConfig(input_workers=4, processes=processes),
+    )
+
+    for event in events:
+        await runner.input_event_queue.put(event)
+
+    tasks = [
+        asyncio.create_task(runner.process_input_queue()),
+        asyncio.create_task(runner.process_output_queue()),
+    ]
+    report = await runner.drain(30)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert not report.timed_out
+    return output.sent
+
+
+class TestMultiProcessBotRunner:
+    """
+    Tests that events are processed in worker processes, and their outputs sent.
+    """
+
+    @staticmethod
+    async def test_events_processed_in_workers() -> None:
+        """Each event is processed by a worker process, and the outputs returned."""
+
+        results = await run_events(2, *(ValueEvent(i) for i in range(10)))
+
+        assert sorted(result.value for result in results) == [i * 2 for i in range(10)]
+        assert os.getpid() not in {result.pid for result in results}
+
+    @staticmethod
+    async def test_keyed_events_stay_on_one_worker() -> None:
+        """Events with the same partition key are processed in order, by the same worker."""
+
+        events = [ValueEvent(i, key=str(i % 2)) for i in range(10)]
+        results = await run_events(2, *events)
+
+        for key in (0, 1):
+            keyed = [result for result in results if result.value // 2 % 2 == key]
+            assert [result.value // 2 for result in keyed] == list(range(key, 10, 2))
+            assert len({result.pid for result in keyed}) == 1
+
+    @staticmethod
+    async def test_unpicklable_events_processed_locally() -> None:
+        """Events which can not be sent to a worker are processed in the main process."""
+
+        results = await run_events(1, ValueEvent(1, callback=lambda: None))
+
+        assert results == [ResultEvent(2, os.getpid())]
+
+    @staticmethod
+    async def test_reload_restarts_workers() -> None:
+        """Reloading starts new workers with the new behaviours."""
+
+        output = ResultOutput()
+        runner = MultiProcessBotRunner(
+            {ValueEvent: {make_behaviour()}},
+            set(),
+            {ResultEvent: {output}},
+            RunnerConfig(processes=1),
+        )
+        tasks = [
+            asyncio.create_task(runner.process_input_queue()),
+            asyncio.create_task(runner.process_output_queue()),
+        ]
+
+        await runner.input_event_queue.put(ValueEvent(1))
+        assert not (await runner.drain(30)).timed_out
+
+        runner.reload({ValueEvent: {make_behaviour(TripleAction)}}, set(), runner.outputs)
+        await runner.input_event_queue.put(ValueEvent(1))
+        assert not (await runner.drain(30)).timed_out
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert [result.value for result in output.sent] == [2, 3]
+        assert output.sent[0].pid != output.sent[1].pid
+
+    @staticmethod
+    async def test_behaviour_failures_returned(caplog: pytest.LogCaptureFixture) -> None:
+        """Exceptions in the worker processes are dead-lettered by the main process."""
+
+        output = ResultOutput()
+        runner = MultiProcessBotRunner(
+            {ValueEvent: {make_behaviour(FailAction)}},
+            set(),
+            {ResultEvent: {output}},
+            RunnerConfig(processes=1, dead_letter_size=10),
+        )
+        tasks = [
+            asyncio.create_task(runner.process_input_queue()),
+            asyncio.create_task(runner.process_output_queue()),
+        ]
+
+        await runner.input_event_queue.put(ValueEvent(-1))
+        await runner.input_event_queue.put(ValueEvent(1))
+        assert not (await runner.drain(30)).timed_out
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert [result.value for result in output.sent] == [2]
+        assert runner.inputs_processed == 2
+        assert runner.behaviour_failures == 1
+
+        assert runner.dead_letters
+        [letter] = runner.dead_letters.letters()
+        assert letter.event == ValueEvent(-1)
+        assert letter.error == repr(ValueError("Negative value -1"))
+        assert "in act" in caplog.text
+
+    @staticmethod
+    async def test_exited_worker_replaced(tmp_path: pathlib.Path) -> None:
+        """An event whose worker exits is a failure, and the worker is replaced."""
+
+        output = ResultOutput()
+        runner = MultiProcessBotRunner(
+            {ValueEvent: {make_behaviour(ExitAction)}},
+            set(),
+            {ResultEvent: {output}},
+            RunnerConfig(
+                processes=1, queue_path=str(tmp_path / "queue.db"), dead_letter_size=10
+            ),
+        )
+        tasks = [
+            asyncio.create_task(runner.process_input_queue()),
+            asyncio.create_task(runner.process_output_queue()),
+        ]
+
+        await runner.input_event_queue.put(ValueEvent(-1))
+        assert not (await runner.drain(30)).timed_out
+        await runner.input_event_queue.put(ValueEvent(1))
+        assert not (await runner.drain(30)).timed_out
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert [result.value for result in output.sent] == [2]
+        assert runner.inputs_processed == 1
+        assert runner.behaviour_failures == 1
+
+        assert runner.dead_letters and runner.journal
+        assert [letter.event for letter in runner.dead_letters.letters()] == [ValueEvent(-1)]
+        assert [event for _, event in runner.journal.pending("input")] == [ValueEvent(-1)]
+        runner.close()
+
+
+class TestSerialiseBehaviour:
+    """
+    Tests for preparing behaviours to be loaded in worker processes.
+    """
+
+    @staticmethod
+    def test_behaviour_without_serialise_rejected() -> None:
+        """Behaviours which are not v1 Behaviours can not be sent to workers."""
+
+        class PlainBehaviour:
+            """Behaviour which only implements the interface."""
+
+        with pytest.raises(TypeError):
+            serialise_behaviour(PlainBehaviour())  # type: ignore
@@ -0,0 +1,64 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the thread pool blocking components are run on.
+"""
+
+from __future__ import annotations
+
+import threading
+from contextvars import ContextVar
+
+import pytest
+
+from mewbot.offload import BlockingPool
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+CALLER: ContextVar[str] = ContextVar("caller", default="")
+
+
+def describe(value: int) -> str:
+    """Describe the call, and where it was made from."""
+    if value < 0:
+        raise ValueError("Negative")
+    return f"{value} from {CALLER.get()} on {threading.current_thread().name}"
+
+
+class TestBlockingPool:
+    """
+    Tests for running blocking calls on the pool.
+    """
+
+    @staticmethod
+    async def test_results_and_exceptions_returned() -> None:
+        """Calls run on the pool's threads, with the caller's context, and raise as usual."""
+
+        pool = BlockingPool(2)
+        CALLER.set("test")
+
+        assert (await pool.run(describe, 1)).startswith("1 from test on mewbot-blocking")
+        with pytest.raises(ValueError):
+            await pool.run(describe, -1)
+        assert pool.calls == 2
+
+        pool.shutdown()
+
+    @staticmethod
+    async def test_configure_changes_size() -> None:
+        """Changing the size replaces the threads; the size can not be negative."""
+
+        pool = BlockingPool(1)
+        await pool.run(describe, 1)
+        pool.configure(3)
+        assert pool.workers == 3
+        assert (await pool.run(describe, 2)).startswith("2")
+
+        with pytest.raises(ValueError):
+            pool.configure(-1)
+
+        pool.shutdown()
@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the sampling profiler.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import pathlib
+import threading
+import time
+
+import pytest
+
+from mewbot.profiler import SamplingProfiler, await_stack
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+async def spin(seconds: float) -> None:
+    """Keep the event loop busy, without yielding to it."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def wait_inside() -> None:
+    """Wait for a long time."""
+    await asyncio.sleep(10)
+
+
+async def wait_outside() -> None:
+    """Wait, a coroutine further away."""
+    await wait_inside()
+
+
+class TestStacks:
+    """
+    Tests for naming the frames of running and suspended stacks.
+    """
+
+    @staticmethod
+    async def test_await_chain_followed() -> None:
+        """The stack of a suspended task runs from its coroutine to what it is waiting on."""
+
+        task = asyncio.create_task(wait_outside())
+        await asyncio.sleep(0)
+
+        stack = await_stack(task.get_coro())
+        task.cancel()
+
+        assert stack[:3] == [
+            f"{__name__}:wait_outside",
+            f"{__name__}:wait_inside",
+            "asyncio.tasks:sleep",
+        ]
+
+
+class TestSamplingProfiler:
+    """
+    Tests for sampling an event loop.
+    """
+
+    @staticmethod
+    async def test_running_and_waiting_sampled(tmp_path: pathlib.Path) -> None:
+        """Busy coroutines are sampled as running, and suspended tasks as awaiting."""
+
+        profiler = SamplingProfiler()
+        waiter = asyncio.create_task(wait_outside())
+
+        profiler.start(asyncio.get_running_loop(), interval=0.001)
+        await spin(0.1)
+        await asyncio.sleep(0.05)
+        profiler.stop()
+        waiter.cancel()
+
+        assert not profiler.running
+        assert profiler.sample_count > 10
+        assert any(
+            stack.startswith("[running]") and stack.endswith(f"{__name__}:spin")
+            for stack in profiler.samples
+        )
+        assert any(
+            stack.startswith(f"[awaiting];{__name__}:wait_outside")
+            for stack in profiler.samples
+        )
+
+        path = tmp_path / "profile.folded"
+        profiler.write(str(path))
+        for line in path.read_text(encoding="utf-8").splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert profiler.samples[stack] == int(count)
+
+    @staticmethod
+    async def test_toggle_writes_profile(tmp_path: pathlib.Path) -> None:
+        """Toggling starts the profiler, and toggling again writes a file named by time."""
+
+        profiler = SamplingProfiler()
+        loop = asyncio.get_running_loop()
+        path = str(tmp_path / "profile-%Y.folded")
+
+        assert profiler.toggle(loop, path, 0.001) is None
+        assert profiler.running
+        await asyncio.sleep(0.02)
+
+        written = profiler.toggle(loop, path)
+        assert written == str(tmp_path / f"profile-{time.strftime('%Y')}.folded")
+        assert pathlib.Path(written).read_text(encoding="utf-8")
+
+        assert not profiler.running
+        assert "mewbot-profiler" not in [thread.name for thread in threading.enumerate()]
+
+    @staticmethod
+    async def test_interval_must_be_positive() -> None:
+        """The profiler can not sample with a zero interval."""
+
+        with pytest.raises(ValueError):
+            SamplingProfiler().start(asyncio.get_running_loop(), interval=0)
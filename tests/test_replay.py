@@ -0,0 +1,239 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for recording a bot's input events, and replaying them through a runner.
+"""
+
+from __future__ import annotations
+
+from typing import AsyncIterable
+
+import dataclasses
+import gzip
+import logging
+import pathlib
+import pickle
+import threading
+
+import pytest
+
+from mewbot.bot import Bot, BotRunner, RunnerConfig
+from mewbot.core import InputEvent, OutputEvent
+from mewbot.replay import (
+    RECORDING_FORMAT,
+    RECORDING_VERSION,
+    EventRecorder,
+    RecordingQueue,
+    read_recording,
+    replay,
+    replay_runner,
+)
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+@dataclasses.dataclass
+class RecordedEvent(InputEvent):
+    """Input event for the replay tests."""
+
+    value: int = 0
+
+
+@dataclasses.dataclass
+class RepliedEvent(OutputEvent):
+    """Output event produced for each recorded event."""
+
+    value: int = 0
+
+
+@dataclasses.dataclass
+class UnpicklableEvent(InputEvent):
+    """Input event which can not be recorded."""
+
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+
+class ReplyBehaviour:
+    """Minimal behaviour which replies to each event it is given."""
+
+    seen: list[InputEvent]
+
+    def __init__(self) -> None:
+        self.seen = []
+
+    def add(self, component: object) -> None:
+        """Components are not supported by this test behaviour."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes the recorded events."""
+        return {RecordedEvent}
+
+    async def process(self, event: InputEvent) -> AsyncIterable[OutputEvent]:
+        """Record the event, and reply with the same value."""
+        self.seen.append(event)
+        yield RepliedEvent(getattr(event, "value", 0))
+
+
+def write_recording(path: pathlib.Path, events: list[tuple[float, InputEvent]]) -> None:
+    """Write a recording with the given offsets, as the recorder would."""
+
+    with gzip.open(path, "wb") as stream:
+        pickle.dump({"format": RECORDING_FORMAT, "version": RECORDING_VERSION}, stream)
+        for offset, event in events:
+            pickle.dump((offset, event), stream)
+
+
+def reply_bot(config: RunnerConfig | None = None) -> tuple[Bot, ReplyBehaviour]:
+    """Create a bot with a replying behaviour."""
+
+    behaviour = ReplyBehaviour()
+
+    bot = Bot("replayed")
+    bot.add_behaviour(behaviour)
+    if config:
+        bot.configure_runner(config)
+    return bot, behaviour
+
+
+class TestRecording:
+    """
+    Tests for writing input events to a recording, and reading them back.
+    """
+
+    @staticmethod
+    def test_events_read_back_in_order(tmp_path: pathlib.Path) -> None:
+        """Recorded events are read back in order, with increasing offsets."""
+
+        recorder = EventRecorder(str(tmp_path / "traffic.rec.gz"))
+        for value in range(3):
+            recorder.record(RecordedEvent(value))
+        recorder.record(UnpicklableEvent())
+        recorder.close()
+
+        assert (recorder.recorded, recorder.skipped) == (3, 1)
+
+        recording = list(read_recording(str(tmp_path / "traffic.rec.gz")))
+        assert [event for _, event in recording] == [
+            RecordedEvent(value) for value in range(3)
+        ]
+        assert [offset for offset, _ in recording] == sorted(
+            offset for offset, _ in recording
+        )
+
+    @staticmethod
+    def test_unpicklable_classes_warned_once(
+        tmp_path: pathlib.Path, caplog: pytest.LogCaptureFixture
+    ) -> None:
+        """Each class of event which can not be recorded is only warned about once."""
+
+        recorder = EventRecorder(str(tmp_path / "traffic.rec.gz"))
+        with caplog.at_level(logging.WARNING):
+            for _ in range(3):
+                recorder.record(UnpicklableEvent())
+        recorder.close()
+
+        assert recorder.skipped == 3
+        assert len(caplog.records) == 1
+        assert "UnpicklableEvent" in caplog.records[0].message
+
+    @staticmethod
+    def test_other_files_rejected(tmp_path: pathlib.Path) -> None:
+        """Files which are not recordings are not read."""
+
+        path = tmp_path / "other.gz"
+        with gzip.open(path, "wb") as stream:
+            pickle.dump(["something", "else"], stream)
+
+        with pytest.raises(ValueError):
+            list(read_recording(str(path)))
+
+    @staticmethod
+    async def test_runner_records_inputs(tmp_path: pathlib.Path) -> None:
+        """A runner with a record_path binds its inputs to a queue which records events."""
+
+        path = tmp_path / "traffic.rec.gz"
+        runner = BotRunner({}, set(), {}, RunnerConfig(record_path=str(path)))
+        assert isinstance(runner.input_target, RecordingQueue)
+
+        await runner.input_target.put(RecordedEvent(1))
+        runner.input_target.put_nowait(RecordedEvent(2))
+        runner.close()
+
+        assert runner.input_event_queue.qsize() == 2
+        assert [event for _, event in read_recording(str(path))] == [
+            RecordedEvent(1),
+            RecordedEvent(2),
+        ]
+
+
+class TestReplay:
+    """
+    Tests for replaying a recording through a bot's behaviours.
+    """
+
+    @staticmethod
+    def test_replay_runner_uses_counting_output(tmp_path: pathlib.Path) -> None:
+        """The runner keeps the bot's settings, but does not write to the bot's files."""
+
+        bot, _ = reply_bot(
+            RunnerConfig(
+                input_workers=2,
+                queue_path=str(tmp_path / "queue.db"),
+                record_path=str(tmp_path / "traffic.rec.gz"),
+                dead_letter_size=10,
+                dead_letter_path=str(tmp_path / "dead.db"),
+                trace_sample_rate=1.0,
+                trace_file=str(tmp_path / "trace.jsonl"),
+            )
+        )
+        runner, sink = replay_runner(bot)
+
+        assert runner.config.input_workers == 2
+        assert runner.journal is None and runner.recorder is None
+        assert runner.dead_letters is not None and not runner.config.dead_letter_path
+        assert not runner.config.trace_sample_rate and not runner.config.trace_file
+        assert not list(tmp_path.iterdir())
+        assert not runner.inputs
+        assert runner.outputs == {OutputEvent: {sink}}
+
+    @staticmethod
+    async def test_events_replayed_through_behaviours(tmp_path: pathlib.Path) -> None:
+        """Every recorded event is processed, and its outputs are counted."""
+
+        path = tmp_path / "traffic.rec.gz"
+        write_recording(path, [(0.0, RecordedEvent(value)) for value in range(5)])
+
+        bot, behaviour = reply_bot()
+        runner, sink = replay_runner(bot)
+        report = await replay(runner, str(path), speed=0)
+
+        assert report.events == 5 and report.drained
+        assert behaviour.seen == [RecordedEvent(value) for value in range(5)]
+        assert sink.counts == {"RepliedEvent": 5}
+        assert any(latency["stage"] == "queue" for latency in report.latencies)
+
+    @staticmethod
+    async def test_replay_keeps_recorded_pace(tmp_path: pathlib.Path) -> None:
+        """Events are replayed at the recorded offsets, divided by the speed."""
+
+        path = tmp_path / "traffic.rec.gz"
+        write_recording(path, [(0.0, RecordedEvent(0)), (0.2, RecordedEvent(1))])
+
+        runner, _ = replay_runner(reply_bot()[0])
+        assert (await replay(runner, str(path), speed=2)).elapsed >= 0.1
+
+        runner, _ = replay_runner(reply_bot()[0])
+        assert (await replay(runner, str(path), speed=0)).elapsed < 0.1
+
+    @staticmethod
+    async def test_negative_speed_rejected(tmp_path: pathlib.Path) -> None:
+        """The replay speed can not be negative."""
+
+        runner, _ = replay_runner(reply_bot()[0])
+        with pytest.raises(ValueError):
+            await replay(runner, str(tmp_path / "traffic.rec.gz"), speed=-1)
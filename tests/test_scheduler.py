@@ -0,0 +1,156 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the schedulers which run behaviours as independent tasks.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable
+
+import asyncio
+import functools
+
+import pytest
+
+from mewbot.scheduler import BehaviourScheduler
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+def recorder(log: list[str], name: str, delay: float) -> Callable[[], Awaitable[None]]:
+    """Creates a process function which records when it starts and finishes."""
+
+    async def process() -> None:
+        log.append(f"start {name}")
+        await asyncio.sleep(delay)
+        log.append(f"end {name}")
+
+    return process
+
+
+class TestBehaviourScheduler:
+    """
+    Tests for the in-flight limits and ordering of a behaviour scheduler.
+    """
+
+    @staticmethod
+    async def test_submit_waits_when_buffer_full() -> None:
+        """Events wait in the buffer at the limit; submitting waits once it is full."""
+
+        log: list[str] = []
+        scheduler = BehaviourScheduler("test", 2, buffer=1)
+
+        for name in ("a", "b", "c"):
+            await scheduler.submit(recorder(log, name, 0.05))
+        await asyncio.sleep(0.01)
+        assert scheduler.in_flight == 3
+        assert log == ["start a", "start b"]
+
+        fourth = asyncio.create_task(scheduler.submit(recorder(log, "d", 0)))
+        await asyncio.sleep(0.01)
+        assert not fourth.done()
+
+        await fourth
+        await scheduler.stop()
+        assert log[:2] == ["start a", "start b"]
+
+    @staticmethod
+    async def test_same_key_runs_in_order() -> None:
+        """Events with the same key run one after another; other keys run alongside."""
+
+        log: list[str] = []
+        done: list[str] = []
+        scheduler = BehaviourScheduler("test", 10)
+
+        for name, key, delay in (("a1", "a", 0.05), ("b1", "b", 0.01), ("a2", "a", 0)):
+            await scheduler.submit(
+                recorder(log, name, delay), key, functools.partial(done.append, name)
+            )
+
+        while scheduler.in_flight:
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+
+        assert log.index("end a1") < log.index("start a2")
+        assert log.index("start b1") < log.index("end a1")
+        assert done == ["b1", "a1", "a2"]
+
+    @staticmethod
+    async def test_failures_are_logged() -> None:
+        """An exception from processing is logged, and does not block the next event."""
+
+        done: list[bool] = []
+        scheduler = BehaviourScheduler("test", 1)
+
+        async def fail() -> None:
+            raise RuntimeError("Behaviour failed")
+
+        await scheduler.submit(fail, "key", lambda: done.append(True))
+        await scheduler.submit(recorder([], "next", 0), "key", lambda: done.append(True))
+
+        while scheduler.in_flight:
+            await asyncio.sleep(0.01)
+        await scheduler.stop()
+
+        assert done == [True, True]
+
+    @staticmethod
+    async def test_stop_cancels_in_flight() -> None:
+        """Stopping cancels events which are still being processed."""
+
+        log: list[str] = []
+        scheduler = BehaviourScheduler("test", 1)
+        await scheduler.submit(recorder(log, "slow", 10))
+        await asyncio.sleep(0)
+
+        await scheduler.stop()
+
+        assert log == ["start slow"]
+        assert scheduler.in_flight == 0
+
+    @staticmethod
+    async def test_stop_finishes_buffered() -> None:
+        """Stopping calls back for buffered events, without processing them."""
+
+        log: list[str] = []
+        done: list[str] = []
+        scheduler = BehaviourScheduler("test", 1)
+        for name in ("slow", "waiting"):
+            await scheduler.submit(
+                recorder(log, name, 10), done=functools.partial(done.append, name)
+            )
+        await asyncio.sleep(0)
+
+        await scheduler.stop()
+
+        assert log == ["start slow"]
+        assert done == ["slow", "waiting"]
+        assert scheduler.in_flight == 0
+
+    @staticmethod
+    async def test_close_finishes_submitted() -> None:
+        """Closing waits for the events in flight and in the buffer, then stops."""
+
+        log: list[str] = []
+        scheduler = BehaviourScheduler("test", 1)
+        for name in ("a", "b"):
+            await scheduler.submit(recorder(log, name, 0.01))
+
+        await scheduler.close()
+
+        assert log == ["start a", "end a", "start b", "end b"]
+        assert scheduler._dispatcher is None  # pylint: disable=protected-access
+
+    @staticmethod
+    def test_invalid_limit() -> None:
+        """Schedulers must allow at least one event in flight, and a valid buffer."""
+
+        with pytest.raises(ValueError):
+            BehaviourScheduler("test", 0)
+        with pytest.raises(ValueError):
+            BehaviourScheduler("test", 1, buffer=-1)
@@ -0,0 +1,287 @@
+# SPDX-FileCopyrightText: 2021 - 2023 Mewbot Developers <mewbot@quicksilver.london>
+#
+# SPDX-License-Identifier: BSD-2-Clause
+
+"""
+Tests for the correlation IDs and sampled traces of events passing through the runner.
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterable, Optional
+
+import asyncio
+import dataclasses
+import json
+import logging
+import pathlib
+
+import pytest
+
+from mewbot.api.v1 import Action, Behaviour, Trigger
+from mewbot.bot import BotRunner, RunnerConfig
+from mewbot.core import InputEvent, OutputEvent
+from mewbot.tracing import TRACER, FileExporter, Span, Trace, Tracer, correlation_id
+
+# pylint: disable=R0903
+#  Disable "too few public methods" for test cases - most test files will be classes used for
+#  grouping and then individual tests alongside these
+
+
+class ListExporter:
+    """Exporter which keeps the spans in a list."""
+
+    spans: list[Span]
+
+    def __init__(self) -> None:
+        self.spans = []
+
+    def export(self, span: Span) -> None:
+        """Keep the span."""
+        self.spans.append(span)
+
+    def close(self) -> None:
+        """Nothing to close."""
+
+
+@dataclasses.dataclass
+class TracedEvent(InputEvent):
+    """Input event for the tracing tests."""
+
+    value: int = 0
+
+
+@dataclasses.dataclass
+class TracedOutputEvent(OutputEvent):
+    """Output event for the tracing tests."""
+
+    value: int = 0
+
+
+class TracedTrigger(Trigger):
+    """Matches all the traced events."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes traced events."""
+        return {TracedEvent}
+
+    def matches(self, event: InputEvent) -> bool:
+        """Matches all events."""
+        return True
+
+
+class EchoAction(Action):
+    """Produces an output with the same value as the input."""
+
+    @staticmethod
+    def consumes_inputs() -> set[type[InputEvent]]:
+        """Consumes traced events."""
+        return {TracedEvent}
+
+    @staticmethod
+    def produces_outputs() -> set[type[OutputEvent]]:
+        """Produces traced output events."""
+        return {TracedOutputEvent}
+
+    async def act(
+        self, event: InputEvent, state: dict[str, Any]
+    ) -> AsyncIterable[OutputEvent]:
+        """Echo the event's value."""
+        yield TracedOutputEvent(getattr(event, "value", 0))
+
+
+class SinkOutput:
+    """Output which keeps the events it sends."""
+
+    sent: list[OutputEvent]
+
+    def __init__(self) -> None:
+        self.sent = []
+
+    @staticmethod
+    def consumes_outputs() -> set[type[OutputEvent]]:
+        """Consumes traced output events."""
+        return {TracedOutputEvent}
+
+    async def output(self, event: OutputEvent) -> bool:
+        """Keep the event."""
+        self.sent.append(event)
+        return True
+
+
+async def run_events(
+    *events: InputEvent, config: Optional[RunnerConfig] = None
+) -> SinkOutput:
+    """Pass the events through a runner with an echoing behaviour, and return its output."""
+
+    # pylint: disable=unexpected-keyword-arg
+    behaviour = Behaviour(name="Echo")  # type: ignore
+    behaviour.add(TracedTrigger())
+    behaviour.add(EchoAction())
+
+    sink = SinkOutput()
+    runner = BotRunner({TracedEvent: {behaviour}}, set(), {TracedOutputEvent: {sink}}, config)
+
+    tasks = [
+        asyncio.create_task(runner.process_input_queue()),
+        asyncio.create_task(runner.process_output_queue()),
+    ]
+    for event in events:
+        await runner.input_event_queue.put(event)
+    assert not (await runner.drain(5)).timed_out
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    return sink
+
+
+class TestTracer:
+    """
+    Tests for creating and sampling traces.
+    """
+
+    @staticmethod
+    def test_ids_are_unique() -> None:
+        """Every trace gets a different correlation ID."""
+
+        tracer = Tracer()
+        ids = {tracer.start().correlation_id for _ in range(100)}
+        assert len(ids) == 100
+
+    @staticmethod
+    def test_sampling_needs_rate_and_exporter() -> None:
+        """Traces are only sampled with a sample rate and somewhere to export them."""
+
+        assert not Tracer(1.0).start().sampled
+        assert not Tracer(0.0, ListExporter()).start().sampled
+        assert Tracer(1.0, ListExporter()).start().sampled
+
+    @staticmethod
+    def test_unsampled_spans_not_exported() -> None:
+        """Spans are only exported for sampled traces."""
+
+        exporter = ListExporter()
+        tracer = Tracer(1.0, exporter)
+
+        tracer.span(Trace("unsampled"), "process", 0.0, 0.1)
+        tracer.span(Trace("sampled", True), "process", 0.0, 0.1)
+
+        assert [span.correlation_id for span in exporter.spans] == ["sampled"]
+
+    @staticmethod
+    def test_file_exporter(tmp_path: pathlib.Path) -> None:
+        """The file exporter appends one JSON object per span."""
+
+        path = tmp_path / "trace.jsonl"
+        exporter = FileExporter(str(path))
+        exporter.export(Span("id", "output", 1.0, 0.5, component="SinkOutput"))
+        exporter.export(Span("id", "process", 1.0, 0.75))
+        exporter.close()
+
+        lines = [json.loads(line) for line in path.read_text("utf-8").splitlines()]
+        assert [line["stage"] for line in lines] == ["output", "process"]
+        assert lines[0]["component"] == "SinkOutput"
+
+    @staticmethod
+    def test_invalid_sample_rate() -> None:
+        """The configured sample rate must be a fraction."""
+
+        with pytest.raises(ValueError):
+            RunnerConfig(trace_sample_rate=1.5)
+
+
+class TestRunnerTracing:
+    """
+    Tests that the runner carries correlation IDs from input events to outputs.
+    """
+
+    @staticmethod
+    async def test_outputs_carry_correlation_id() -> None:
+        """Each output has the correlation ID of the event it was produced for."""
+
+        TRACER.configure(0.0, None)
+        sink = await run_events(TracedEvent(1), TracedEvent(2))
+
+        ids = [correlation_id(event) for event in sink.sent]
+        assert len(ids) == 2
+        assert None not in ids
+        assert ids[0] != ids[1]
+
+    @staticmethod
+    async def test_inputs_carry_correlation_id(caplog: pytest.LogCaptureFixture) -> None:
+        """Input events are tagged, and logged, with the ID their outputs are given."""
+
+        TRACER.configure(0.0, None)
+        event = TracedEvent(1)
+        with caplog.at_level(logging.DEBUG):
+            sink = await run_events(event)
+
+        assert correlation_id(event) == correlation_id(sink.sent[0])
+        assert f"correlation ID {correlation_id(event)}" in caplog.text
+
+    @staticmethod
+    async def test_sampled_stages_share_correlation_id() -> None:
+        """Every stage of a sampled event is exported with the same correlation ID."""
+
+        exporter = ListExporter()
+        TRACER.configure(1.0, exporter)
+        try:
+            sink = await run_events(TracedEvent(1))
+        finally:
+            TRACER.configure(0.0, None)
+
+        assert {span.stage for span in exporter.spans} == {
+            "process",
+            "behaviour",
+            "trigger",
+            "action",
+            "output",
+        }
+        assert {span.correlation_id for span in exporter.spans} == {
+            correlation_id(sink.sent[0])
+        }
+        assert {span.behaviour for span in exporter.spans if span.behaviour} == {"Echo"}
+
+    @staticmethod
+    async def test_scheduled_events_have_process_span() -> None:
+        """Events scheduled on limited behaviours are traced as other events are."""
+
+        exporter = ListExporter()
+        TRACER.configure(1.0, exporter)
+        try:
+            sink = await run_events(
+                TracedEvent(1), config=RunnerConfig(behaviour_concurrency=2)
+            )
+        finally:
+            TRACER.configure(0.0, None)
+
+        assert {"process", "behaviour"} <= {span.stage for span in exporter.spans}
+        assert {span.correlation_id for span in exporter.spans} == {
+            correlation_id(sink.sent[0])
+        }
+
+    @staticmethod
+    async def test_batched_inputs_have_own_correlation_ids() -> None:
+        """Each event in a batch has its own trace, and the batch's span links to them."""
+
+        exporter = ListExporter()
+        TRACER.configure(1.0, exporter)
+        events = [TracedEvent(1), TracedEvent(2)]
+        try:
+            sink = await run_events(
+                *events, config=RunnerConfig(batch_size=2, batch_wait=1.0)
+            )
+        finally:
+            TRACER.configure(0.0, None)
+
+        ids = [correlation_id(event) for event in events]
+        assert None not in ids
+        assert ids[0] != ids[1]
+        assert {correlation_id(event) for event in sink.sent} == set(ids)
+
+        [batch] = [span for span in exporter.spans if span.stage == "batch"]
+        assert batch.links == tuple(ids)
+        assert batch.correlation_id not in ids